@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+🗜️ Benchmark de archivado de checkpoints
+Compara el camino anterior (tar.gz de todo output_dir con gzip de un hilo en
+/tmp y luego subida del archivo) con src.train.archive.upload_archive (solo el
+adapter, o todo, comprimido con zstd multihilo o gzip y subido en streaming
+sin archivo intermedio) contra un LocalStorage.
+
+El output_dir sintético imita uno real: adapter, tokenizer y training_info en
+la raíz más --checkpoints carpetas checkpoint-* con optimizer.pt (dos momentos
+en fp32: 4x los bytes del adapter) y estado del scheduler/RNG. Los pesos son normales de
+desvío 0.02, que comprimen como pesos reales (no bytes aleatorios).
+
+Uso:
+    python scripts/bench_archive.py --adapter_mb 64 --checkpoints 3
+    python scripts/bench_archive.py --dir /workspace/jotica/checkpoints --levels 1,3,9
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.train import archive
+from src.utils import supa
+from src.utils.storage import LocalStorage
+
+def weights(path, mb, dtype, rng):
+    n = int(mb * 1024 * 1024) // np.dtype(dtype).itemsize
+    rng.normal(0, 0.02, n).astype(dtype).tofile(path)
+
+def synthetic_output_dir(root, adapter_mb, checkpoints):
+    """output_dir con la forma de uno de lora_runner."""
+    rng = np.random.default_rng(0)
+    os.makedirs(root)
+    weights(os.path.join(root, "adapter_model.safetensors"), adapter_mb, np.float16, rng)
+    with open(os.path.join(root, "adapter_config.json"), "w") as f:
+        json.dump({"r": 16, "lora_alpha": 32, "target_modules": ["q_proj", "v_proj"]}, f)
+    with open(os.path.join(root, "tokenizer.json"), "w") as f:
+        json.dump({"model": {"vocab": {f"tok{i}": i for i in range(128000)}}}, f)
+    with open(os.path.join(root, "training_info.json"), "w") as f:
+        json.dump({"run_name": "bench"}, f)
+    for k in range(checkpoints):
+        ck = os.path.join(root, f"checkpoint-{(k + 1) * 200}")
+        os.makedirs(ck)
+        weights(os.path.join(ck, "adapter_model.safetensors"), adapter_mb, np.float16, rng)
+        # Adam: dos momentos en fp32 por parámetro del adapter
+        weights(os.path.join(ck, "optimizer.pt"), adapter_mb * 4, np.float32, rng)
+        weights(os.path.join(ck, "scheduler.pt"), 0.01, np.float32, rng)
+        weights(os.path.join(ck, "rng_state.pth"), 0.02, np.float32, rng)
+
+def dir_mb(path):
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, fs in os.walk(path) for f in fs) / (1024 * 1024)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--dir", default=None, help="output_dir real (por defecto: uno sintético)")
+    ap.add_argument("--adapter_mb", type=float, default=64)
+    ap.add_argument("--checkpoints", type=int, default=3)
+    ap.add_argument("--levels", default="1,3,9", help="Niveles de zstd a medir")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        src = args.dir
+        if src is None:
+            src = os.path.join(tmp, "output")
+            synthetic_output_dir(src, args.adapter_mb, args.checkpoints)
+        bucket = LocalStorage(os.path.join(tmp, "bucket"))
+        print(f"📁 {src}: {dir_mb(src):.1f} MB in total, "
+              f"{sum(os.path.getsize(p) for p, _ in archive.archive_members(src)) / 2**20:.1f} MB adapter-only")
+        print(f"\n{'variant':<34}{'seconds':>9}{'archive MB':>12}{'speedup':>9}")
+
+        # Camino anterior: tar.gz completo (gzip nivel 9 de tarfile) en disco y luego subida
+        t0 = time.perf_counter()
+        tar_path = os.path.join(tmp, "baseline.tar.gz")
+        archive.zip_dir(src, tar_path, contents="full", codec="gzip", level=9)
+        res = supa.upload_ckpt(tar_path, prefix="run/", bucket=bucket)
+        base = time.perf_counter() - t0
+        os.remove(tar_path)
+        print(f"{'baseline: full, gzip-9, temp file':<34}{base:>9.2f}{res['file_size'] / 2**20:>12.1f}{1.0:>8.2f}x")
+
+        variants = [("full", "gzip", 6), ("adapter", "gzip", 6)]
+        if archive.zstandard is not None:
+            variants += [("full", "zstd", 3)] + [("adapter", "zstd", int(l)) for l in args.levels.split(",")]
+        else:
+            print("⚠️ zstandard not installed: only gzip variants")
+        for contents, codec, level in variants:
+            t0 = time.perf_counter()
+            res = archive.upload_archive(src, "run/", contents=contents, codec=codec, level=level,
+                                         stem=f"{contents}-{codec}-{level}", bucket=bucket)
+            dt = time.perf_counter() - t0
+            assert res["success"], res
+            name = f"{contents}, {codec}-{level}, streamed"
+            print(f"{name:<34}{dt:>9.2f}{res['file_size'] / 2**20:>12.1f}{base / dt:>8.2f}x")
+
+        # Comprobar que el último archivo en streaming se extrae completo
+        out = os.path.join(tmp, "restored")
+        supa.extract_ckpt(res["remote_path"], out, bucket)
+        restored = sorted(os.listdir(os.path.join(out, os.path.basename(src))))
+        print(f"\n✅ Restored {res['remote_path']}: {', '.join(restored)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+🧩 Prueba de snapshots deduplicados de checkpoints contra un bucket local
+Simula el directorio de salida de lora_runner a lo largo de varios save_steps
+(tokenizer y configs fijos, adapter y optimizador nuevos en cada paso, los
+últimos --save_total checkpoints conservados) y compara lo que se sube con
+.tar.gz completos vs. snapshots por chunks. Luego restaura el último snapshot
+en frío y con el caché de chunks caliente y verifica el contenido.
+
+Uso:
+    python scripts/bench_ckpt_dedup.py --steps 5 --adapter_mb 32 --latency 0.02
+"""
+
+import argparse
+import hashlib
+import io
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.config import cfg
+from src.utils.chunk_store import ChunkStore, iter_chunks
+from src.utils.storage import LocalStorage
+from src.utils import supa
+from bench_ckpt_transfer import FlakyStorage
+
+def write_random(path, mb, seed=None):
+    with open(path, "wb") as f:
+        f.write(os.urandom(mb * 1024 * 1024) if seed is None else
+                hashlib.sha256(str(seed).encode()).digest() * (mb * 1024 * 1024 // 32))
+
+def save_checkpoint(out_dir, step, adapter_mb):
+    """Lo que Trainer.save deja en checkpoint-<step> para un LoRA."""
+    ckpt = os.path.join(out_dir, f"checkpoint-{step}")
+    os.makedirs(ckpt)
+    write_random(os.path.join(ckpt, "adapter_model.safetensors"), adapter_mb)
+    write_random(os.path.join(ckpt, "optimizer.pt"), 2 * adapter_mb)
+    for name in ("tokenizer.json", "adapter_config.json", "special_tokens_map.json", "training_args.bin"):
+        src = os.path.join(out_dir, "_static", name)
+        shutil.copyfile(src, os.path.join(ckpt, name))
+
+def tree_digest(root):
+    h = hashlib.sha256()
+    for d, _, names in sorted(os.walk(root)):
+        for n in sorted(names):
+            p = os.path.join(d, n)
+            h.update(os.path.relpath(p, root).encode())
+            with open(p, "rb") as f:
+                h.update(hashlib.sha256(f.read()).digest())
+    return h.hexdigest()
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--steps", type=int, default=5)
+    ap.add_argument("--save_total", type=int, default=3)
+    ap.add_argument("--adapter_mb", type=int, default=16)
+    ap.add_argument("--tokenizer_mb", type=int, default=8)
+    ap.add_argument("--latency", type=float, default=0.01, help="Latencia simulada por request (s)")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cfg.ckpt_cache_dir = os.path.join(tmp, "upload_cache")
+        out_dir = os.path.join(tmp, "jotica-run")
+        static = os.path.join(out_dir, "_static")
+        os.makedirs(static)
+        write_random(os.path.join(static, "tokenizer.json"), args.tokenizer_mb, seed="tok")
+        for name in ("adapter_config.json", "special_tokens_map.json", "training_args.bin"):
+            write_random(os.path.join(static, name), 1, seed=name)
+
+        bucket = LocalStorage(os.path.join(tmp, "bucket"))
+        tar_bytes = snap_bytes = 0
+        tar_time = snap_time = 0.0
+        for i in range(1, args.steps + 1):
+            save_checkpoint(out_dir, 100 * i, args.adapter_mb)
+            old = sorted((d for d in os.listdir(out_dir) if d.startswith("checkpoint-")),
+                         key=lambda d: int(d.split("-")[1]))[:-args.save_total]
+            for d in old:
+                shutil.rmtree(os.path.join(out_dir, d))
+
+            # Antes: .tar.gz de todo el directorio, subido por partes
+            t0 = time.perf_counter()
+            tar_path = os.path.join(tmp, f"step{i}.tar.gz")
+            with tarfile.open(tar_path, "w:gz", compresslevel=1) as tar:
+                tar.add(out_dir, arcname="jotica-run")
+            supa.upload_chunked(tar_path, f"tar/step{i}.tar.gz", FlakyStorage(bucket, args.latency))
+            tar_time += time.perf_counter() - t0
+            tar_bytes += os.path.getsize(tar_path)
+            os.remove(tar_path)
+
+            # Ahora: snapshot por chunks (solo se suben los nuevos)
+            t0 = time.perf_counter()
+            res = supa.upload_ckpt_dir(out_dir, prefix="snap/", bucket=FlakyStorage(bucket, args.latency), step=100 * i)
+            snap_time += time.perf_counter() - t0
+            snap_bytes += res["uploaded_bytes"]
+            print(f"📊 step {100 * i}: snapshot sent {res['uploaded_bytes'] / 2**20:.1f} MB "
+                  f"of {res['file_size'] / 2**20:.1f} MB")
+
+        # Robustez ante desplazamientos: insertar bytes al inicio reutiliza casi todos los chunks
+        blob = os.urandom(32 * 2**20)
+        before = {hashlib.sha256(c).digest() for c in iter_chunks(io.BytesIO(blob))}
+        after = [hashlib.sha256(c).digest() for c in iter_chunks(io.BytesIO(b"inserted" + blob))]
+        reused = sum(c in before for c in after)
+
+        # Restauración: caché frío y caliente
+        ok = True
+        timings = []
+        for label, cache in (("cold", "cache_a"), ("warm", "cache_a")):
+            dest = os.path.join(tmp, f"restore_{label}")
+            t0 = time.perf_counter()
+            ChunkStore(FlakyStorage(bucket, args.latency), cache_dir=os.path.join(tmp, cache)).get_dir(
+                "snap/jotica-run.snapshot.json", dest)
+            timings.append(time.perf_counter() - t0)
+            ok &= tree_digest(os.path.join(dest, "jotica-run")) == tree_digest(out_dir)
+
+        print(f"📊 {args.steps} saves: tar.gz sent {tar_bytes / 2**20:.1f} MB in {tar_time:.2f}s, "
+              f"snapshots sent {snap_bytes / 2**20:.1f} MB in {snap_time:.2f}s "
+              f"({tar_bytes / max(snap_bytes, 1):.1f}x less)")
+        print(f"📊 Insert at offset 0: {reused}/{len(after)} chunks reused; "
+              f"restore cold {timings[0]:.2f}s, warm cache {timings[1]:.2f}s")
+        print(f"{'✅' if ok else '❌'} Restored snapshots match the run directory")
+        sys.exit(0 if ok else 1)
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+📦 Prueba de transferencia de checkpoints contra un bucket local
+Sube un checkpoint aleatorio (.tar.gz) por partes a un LocalStorage (sistema de
+archivos), simula cortes a mitad de subida y de descarga, reanuda ambos,
+compara descarga secuencial vs. paralela, extrae en streaming sin archivo
+intermedio, mide descargas repetidas a través del caché local (CachedStorage) y
+actualiza el índice de checkpoints del run desde varios escritores a la vez.
+
+Uso:
+    python scripts/bench_ckpt_transfer.py --size_mb 256 --part_mb 16 --workers 4 --latency 0.05
+"""
+
+import argparse
+import hashlib
+import os
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.utils.storage import CachedStorage, LocalStorage, Storage
+from src.utils import supa
+from src.utils.ckpt_index import CheckpointIndex
+
+class Interrupted(BaseException):
+    """Simula que el proceso muere (no lo capturan los reintentos)."""
+
+class FlakyStorage(Storage):
+    """Envuelve un Storage: latencia por request y corte tras N partes subidas."""
+
+    def __init__(self, inner, latency=0.0, fail_after=None, fail_after_bytes=None):
+        self.inner = inner
+        self.latency = latency
+        self.fail_after = fail_after
+        self.fail_after_bytes = fail_after_bytes
+        self.kind = inner.kind
+        self.uploads = 0
+        self.streamed = 0
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def __repr__(self):
+        return f"Flaky({self.inner!r})"
+
+    def put(self, path, data, content_type="application/octet-stream", overwrite=True):
+        time.sleep(self.latency)
+        with self.lock:
+            if ".parts/" in path and self.fail_after is not None and self.uploads >= self.fail_after:
+                raise Interrupted("simulated crash")
+            self.uploads += 1
+        return self.inner.put(path, data, content_type, overwrite)
+
+    def stream(self, path, start=0, end=None, chunk_size=1024 * 1024):
+        time.sleep(self.latency)
+        with self.lock:
+            self.requests += 1
+        for chunk in self.inner.stream(path, start, end, chunk_size):
+            with self.lock:
+                if self.fail_after_bytes is not None and self.streamed >= self.fail_after_bytes:
+                    raise ConnectionError("simulated network drop")
+                self.streamed += len(chunk)
+            yield chunk
+
+    def list(self, prefix=""):
+        return self.inner.list(prefix)
+
+    def size(self, path):
+        return self.inner.size(path)
+
+    def delete(self, paths):
+        return self.inner.delete(paths)
+
+def sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--size_mb", type=int, default=64)
+    ap.add_argument("--part_mb", type=int, default=8)
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--latency", type=float, default=0.02, help="Latencia simulada por request (s)")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        ckpt_dir = os.path.join(tmp, "checkpoint-200")
+        os.makedirs(ckpt_dir)
+        for i in range(4):
+            with open(os.path.join(ckpt_dir, f"shard-{i}.bin"), "wb") as f:
+                for _ in range(args.size_mb // 4):
+                    f.write(os.urandom(1024 * 1024))
+        src = os.path.join(tmp, "jotica_ckpt.tar.gz")
+        with tarfile.open(src, "w:gz", compresslevel=1) as tar:
+            tar.add(ckpt_dir, arcname="checkpoint-200")
+        bucket = LocalStorage(os.path.join(tmp, "bucket"))
+        part_size = args.part_mb * 1024 * 1024
+        parts = -(-os.path.getsize(src) // part_size)
+
+        # 1) Subida secuencial de referencia
+        t0 = time.perf_counter()
+        supa.upload_chunked(src, "seq/jotica_ckpt.tar.gz", FlakyStorage(bucket, args.latency),
+                            part_size=part_size, workers=1)
+        seq = time.perf_counter() - t0
+
+        # 2) Subida paralela interrumpida a mitad y reanudada
+        flaky = FlakyStorage(bucket, args.latency, fail_after=parts // 2)
+        try:
+            supa.upload_chunked(src, "run/jotica_ckpt.tar.gz", flaky, part_size=part_size, workers=args.workers)
+        except Interrupted as e:
+            print(f"💥 Interrupted after {flaky.uploads}/{parts} parts: {e}")
+        t0 = time.perf_counter()
+        manifest = supa.upload_chunked(src, "run/jotica_ckpt.tar.gz", FlakyStorage(bucket, args.latency),
+                                       part_size=part_size, workers=args.workers)
+        par = time.perf_counter() - t0
+
+        # 3) Descarga interrumpida y reanudada por rangos
+        dst = os.path.join(tmp, "downloaded.tar.gz")
+        supa.download_ckpt("run/jotica_ckpt.tar.gz", dst,
+                           FlakyStorage(bucket, fail_after_bytes=args.size_mb * 1024 * 1024 // 3))
+        partial_mb = os.path.getsize(dst + ".partial") / (1024 * 1024) if os.path.exists(dst + ".partial") else 0
+        print(f"💥 Download interrupted with {partial_mb:.1f} MB on disk")
+        ok = supa.download_ckpt("run/jotica_ckpt.tar.gz", dst, bucket) and sha256_file(dst) == sha256_file(src)
+        print(f"{'✅' if ok else '❌'} Resumed download matches source")
+
+        # 4) Secuencial vs. paralela por rangos
+        timings = {}
+        for workers in (1, args.workers):
+            out = os.path.join(tmp, f"dl_{workers}.tar.gz")
+            t0 = time.perf_counter()
+            ok &= supa.download_ckpt("run/jotica_ckpt.tar.gz", out, FlakyStorage(bucket, args.latency), workers=workers)
+            timings[workers] = time.perf_counter() - t0
+            ok &= sha256_file(out) == sha256_file(src)
+            os.remove(out)
+
+        # 5) Extracción en streaming (sin .tar.gz intermedio)
+        extract_dir = os.path.join(tmp, "extracted")
+        ok &= supa.download_ckpt("run/jotica_ckpt.tar.gz", None, bucket, extract_to=extract_dir)
+        for name in os.listdir(ckpt_dir):
+            ok &= sha256_file(os.path.join(ckpt_dir, name)) == sha256_file(os.path.join(extract_dir, "checkpoint-200", name))
+
+        # 6) Varios workers descargando el mismo checkpoint a través del caché local
+        remote = FlakyStorage(bucket, args.latency)
+        cached = CachedStorage(remote, os.path.join(tmp, "cache"), max_bytes=4 * args.size_mb * 1024 * 1024)
+        cache_timings = []
+        for i in range(3):
+            out = os.path.join(tmp, f"cached_{i}.tar.gz")
+            t0 = time.perf_counter()
+            ok &= supa.download_ckpt("run/jotica_ckpt.tar.gz", out, cached, workers=args.workers)
+            cache_timings.append(time.perf_counter() - t0)
+            ok &= sha256_file(out) == sha256_file(src)
+            os.remove(out)
+        print(f"🗄️ Cache: {cached.misses} misses, {cached.hits} hits, {remote.requests} remote reads; "
+              f"cold {cache_timings[0]:.2f}s, warm {min(cache_timings[1:]):.2f}s")
+
+        # 7) Índice del run: escritores concurrentes, último checkpoint y revalidación por ETag
+        ok &= supa.upload_ckpt(src, prefix="run/", bucket=bucket, part_size=part_size,
+                               step=200, metrics={"loss": 1.23})["success"]
+
+        def add(i):
+            CheckpointIndex("run", bucket, cache_dir=os.path.join(tmp, f"idx_{i}")).add(
+                {"path": f"run/ckpt-{i}.tar.gz", "filename": f"ckpt-{i}.tar.gz", "size": i, "sha256": "", "step": 100 * i})
+        writers = [threading.Thread(target=add, args=(i,)) for i in range(1, 9)]
+        for w in writers:
+            w.start()
+        for w in writers:
+            w.join()
+        index = CheckpointIndex("run", bucket, cache_dir=os.path.join(tmp, "idx_reader"))
+        listed = supa.list_checkpoints("run/", bucket)
+        first = index.read()
+        unchanged, _ = bucket.get_if_changed(index.pointer_path, index._load_cache()[0])
+        index_ok = (len(listed) == 9 and first["version"] == 9 and index.latest()["step"] == 800
+                    and unchanged is None and index.read() == first)
+        ok &= index_ok
+        print(f"{'✅' if index_ok else '❌'} Index: {len(listed)} checkpoints after 9 concurrent/serial writers, "
+              f"v{first['version']}, latest step {index.latest()['step']}, ETag revalidation skips body")
+
+        print(f"📊 {args.size_mb} MB in {parts} parts: upload sequential {seq:.2f}s, "
+              f"parallel resume {par:.2f}s ({len(manifest['parts'])} parts in manifest); "
+              f"download 1 worker {timings[1]:.2f}s, {args.workers} workers {timings[args.workers]:.2f}s")
+        print(f"{'✅' if ok else '❌'} Downloads and streamed extraction match source")
+        sys.exit(0 if ok else 1)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+⏱️ Benchmark de tokenización del dataset de entrenamiento
+Compara la preparación anterior (map de formato + map de tokenización en un
+solo proceso + copia de input_ids a labels) con src.train.tokenization.tokenize_texts
+(un solo map por lotes grandes, sin labels) para varios números de procesos.
+
+Sin --tokenizer entrena un tokenizer BPE pequeño sobre los datos sintéticos,
+para poder correrlo sin descargar nada.
+
+Uso:
+    python scripts/bench_tokenize.py --rows 50000 --procs 1,2,4,8
+    python scripts/bench_tokenize.py --rows 200000 --tokenizer meta-llama/Llama-3-8B-Instruct
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+WORDS = ("Jesús dijo a sus discípulos que el reino de los cielos es semejante a un grano de mostaza "
+         "porque de tal manera amó Dios al mundo que ha dado a su Hijo unigénito para que todo aquel "
+         "que en él cree no se pierda mas tenga vida eterna explicar versículo contexto histórico").split()
+
+def synthetic_rows(n, seed=0):
+    """Filas Alpaca con respuestas de longitud variable (cola larga, como el dataset real)."""
+    rng = random.Random(seed)
+    for _ in range(n):
+        out_len = min(int(rng.lognormvariate(4.0, 0.8)), 900)
+        yield {
+            "instruction": " ".join(rng.choices(WORDS, k=rng.randint(5, 20))),
+            "input": " ".join(rng.choices(WORDS, k=rng.randint(0, 30))),
+            "output": " ".join(rng.choices(WORDS, k=out_len)),
+        }
+
+def local_tokenizer(rows):
+    """Tokenizer BPE rápido entrenado sobre las filas (vocabulario de 8k)."""
+    from tokenizers import Tokenizer, models, pre_tokenizers, trainers
+    from transformers import PreTrainedTokenizerFast
+    from src.train.formatters import format_row
+
+    t = Tokenizer(models.BPE(unk_token="<unk>"))
+    t.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    trainer = trainers.BpeTrainer(vocab_size=8000, special_tokens=["<unk>", "<s>", "</s>"],
+                                  initial_alphabet=pre_tokenizers.ByteLevel.alphabet())
+    t.train_from_iterator((format_row(r) for r in rows[:5000]), trainer)
+    return PreTrainedTokenizerFast(tokenizer_object=t, unk_token="<unk>", bos_token="<s>",
+                                   eos_token="</s>", pad_token="</s>")
+
+def baseline(ds, tok, max_seq_len):
+    """Preparación anterior: dos pasadas en un proceso y labels copiadas en Python."""
+    from src.train.formatters import format_row
+
+    ds = ds.map(lambda r: {"text": format_row(r)}, remove_columns=ds.column_names)
+
+    def tokenize_function(examples):
+        tokenized = tok(examples["text"], truncation=True, max_length=max_seq_len)
+        tokenized["labels"] = tokenized["input_ids"].copy()
+        return tokenized
+
+    return ds.map(tokenize_function, batched=True, remove_columns=["text"])
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=50000)
+    ap.add_argument("--procs", default="1,2,4,8", help="Números de procesos a medir, separados por coma")
+    ap.add_argument("--tokenizer", default=None, help="Tokenizer de HF (por defecto: BPE local)")
+    ap.add_argument("--max_seq_len", type=int, default=1024)
+    args = ap.parse_args()
+
+    import datasets
+    from datasets import Dataset
+    from src.train.formatters import format_row
+    from src.train.tokenization import default_num_proc, tokenize_texts
+
+    datasets.disable_caching()
+    datasets.disable_progress_bars()
+    rows = list(synthetic_rows(args.rows))
+    if args.tokenizer:
+        from transformers import AutoTokenizer
+        tok = AutoTokenizer.from_pretrained(args.tokenizer, use_fast=True)
+    else:
+        tok = local_tokenizer(rows)
+    ds = Dataset.from_list(rows)
+    cpus = default_num_proc()
+    print(f"📊 {len(ds):,} rows, tokenizer {type(tok).__name__} (vocab {len(tok):,}), {cpus} CPUs available")
+
+    t0 = time.time()
+    out = baseline(ds, tok, args.max_seq_len)
+    base = time.time() - t0
+    tokens = sum(len(x) for x in out["input_ids"])
+    print(f"\n{'variant':<28}{'seconds':>10}{'rows/s':>12}{'tokens/s':>14}{'speedup':>10}")
+    print(f"{'baseline (2 maps + labels)':<28}{base:>10.2f}{len(ds) / base:>12,.0f}{tokens / base:>14,.0f}{1.0:>9.2f}x")
+
+    for n in [int(x) for x in args.procs.split(",")]:
+        t0 = time.time()
+        out = tokenize_texts(ds, tok, args.max_seq_len, formatter=format_row, num_proc=n)
+        dt = time.time() - t0
+        assert sum(len(x) for x in out["input_ids"]) == tokens
+        note = "  (> CPUs)" if n > cpus else ""
+        print(f"{f'batched, num_proc={n}':<28}{dt:>10.2f}{len(ds) / dt:>12,.0f}{tokens / dt:>14,.0f}{base / dt:>9.2f}x{note}")
+
+if __name__ == "__main__":
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+    main()
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+🏋️ Benchmark de entrenamiento de punta a punta en CPU
+Corre N pasos del pipeline real de src.train.lora_runner (formato, tokenización,
+batching por longitud o packing, collator, LoRA y Trainer) sobre un Llama
+diminuto de pesos aleatorios y un tokenizer BPE entrenado localmente: sin GPU
+y sin descargas. Mide el tiempo de cada etapa, samples/s (con --pack, secuencias
+empaquetadas/s) y tokens supervisados/s (ThroughputCallback), y los compara con
+una línea base guardada.
+
+Las cifras solo son comparables en la misma máquina y con los mismos hilos:
+guarde la línea base antes del cambio y compare después. Cada variante se
+corre --repeats veces y se reporta la mediana.
+
+Uso:
+    python scripts/bench_train.py --save_baseline        # antes del cambio
+    python scripts/bench_train.py --check                # después: falla si algo empeora más de --tolerance
+    python scripts/bench_train.py --variants packed --steps 50
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from bench_tokenize import local_tokenizer, synthetic_rows
+
+BASELINE = Path(__file__).parent / "bench_train_baseline.json"
+
+# Variantes de batching: flags extra de lora_runner
+VARIANTS = {
+    "grouped": [],
+    "random": ["--no_group_by_length"],
+    "packed": ["--pack"],
+}
+STAGES = ("tokenizer", "dataset", "model", "trainer", "train", "save")
+
+# Métricas vigiladas por --check: True si más es mejor
+CHECKED = {
+    "samples_per_second": True,
+    "tokens_per_second": True,
+    "step_time_p50": False,
+    "dataset_seconds": False,
+}
+
+def build_fixture(root, rows, max_seq_len, hidden_size=128, layers=2):
+    """Dataset Alpaca sintético, tokenizer BPE local y Llama pequeño con pesos aleatorios."""
+    import torch
+    from transformers import LlamaConfig, LlamaForCausalLM
+
+    rows = list(synthetic_rows(rows))
+    data = os.path.join(root, "data.jsonl")
+    with open(data, "w", encoding="utf-8") as f:
+        for r in rows:
+            f.write(json.dumps(r, ensure_ascii=False) + "\n")
+
+    tok = local_tokenizer(rows)
+    torch.manual_seed(0)
+    config = LlamaConfig(vocab_size=len(tok), hidden_size=hidden_size, intermediate_size=hidden_size * 8 // 3,
+                         num_hidden_layers=layers, num_attention_heads=max(1, hidden_size // 32),
+                         num_key_value_heads=max(1, hidden_size // 32), max_position_embeddings=max_seq_len,
+                         bos_token_id=tok.bos_token_id, eos_token_id=tok.eos_token_id,
+                         pad_token_id=tok.pad_token_id)
+    model_dir = os.path.join(root, "model")
+    LlamaForCausalLM(config).save_pretrained(model_dir)
+    tok.save_pretrained(model_dir)
+    return model_dir, data
+
+def run_variant(name, model_dir, data, out, args):
+    """Una corrida de lora_runner etapa por etapa (sin la subida final), con tiempos."""
+    from src.train import lora_runner
+    from src.train.callbacks import ThroughputCallback
+
+    argv = ["--base_model", model_dir, "--data", data, "--output_dir", out, "--run_name", f"bench-{name}",
+            "--max_steps", str(args.steps), "--batch_size", str(args.batch_size),
+            "--max_seq_len", str(args.max_seq_len), "--save_steps", str(10**9),
+            "--cache_dir", "", "--no_checkpoint_upload"] + VARIANTS[name]
+    if args.num_proc:
+        argv += ["--num_proc", str(args.num_proc)]
+    if args.precision:
+        argv += ["--precision", args.precision]
+    rargs = lora_runner.parse_args(argv)
+    seconds = {}
+
+    def stage(key, fn, *a):
+        t0 = time.perf_counter()
+        result = fn(*a)
+        seconds[key] = round(time.perf_counter() - t0, 3)
+        return result
+
+    dev = lora_runner.setup_device(rargs)
+    tok = stage("tokenizer", lora_runner.load_tokenizer, rargs.base_model)
+    ds, stats = stage("dataset", lora_runner.build_dataset, rargs, tok)
+    model = stage("model", lora_runner.build_model, rargs, dev)
+    trainer = stage("trainer", lora_runner.build_trainer, rargs, model, tok, ds, dev)
+    metrics = stage("train", lambda: trainer.train().metrics)
+    stage("save", trainer.save_model, out)
+
+    perf = lora_runner.find_callback(trainer, ThroughputCallback).summary
+    return {
+        "steps": perf["steps"],
+        "samples_per_second": round(metrics["train_samples_per_second"], 2),
+        "tokens_per_second": perf["tokens_per_second"],
+        "step_time_p50": perf["step_time_p50"],
+        "first_step_time": perf["first_step_time"],
+        "data_wait_share": perf["data_wait_share"],
+        "padding_ratio": perf["padding_ratio"],
+        "peak_rss_mb": perf["peak_rss_mb"],
+        "stages": seconds,
+    }
+
+def median_result(runs):
+    """Mediana por métrica de varias corridas de la misma variante."""
+    med = lambda xs: round(statistics.median(xs), 4)
+    result = {k: med([r[k] for r in runs]) for k in runs[0] if k != "stages"}
+    result["stages"] = {s: med([r["stages"][s] for r in runs]) for s in runs[0]["stages"]}
+    return result
+
+def environment(precision):
+    import torch
+    import transformers
+    from src.train.device import training_device
+    from src.train.tokenization import default_num_proc
+
+    return {
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "transformers": transformers.__version__,
+        "machine": platform.machine(),
+        "cpus": default_num_proc(),
+        "torch_threads": torch.get_num_threads(),
+        # Con "auto" depende del CPU (bf16 nativo o no)
+        "precision": training_device(precision or "auto").precision,
+    }
+
+def flat(result):
+    """Métricas de una variante con las etapas como <etapa>_seconds."""
+    out = {k: v for k, v in result.items() if k != "stages"}
+    out.update({f"{s}_seconds": v for s, v in result["stages"].items()})
+    return out
+
+def compare(results, baseline, tolerance):
+    """Imprime la comparación con la línea base; devuelve las regresiones por encima de la tolerancia."""
+    regressions = []
+    for name, result in results.items():
+        base = baseline["variants"].get(name)
+        if base is None:
+            print(f"\n⚠️ {name}: no baseline stored")
+            continue
+        print(f"\n📏 {name} vs baseline")
+        print(f"   {'metric':<22}{'baseline':>12}{'current':>12}{'change':>9}")
+        cur, ref = flat(result), flat(base)
+        for key, value in cur.items():
+            if key not in ref or not ref[key]:
+                continue
+            change = value / ref[key] - 1
+            mark = ""
+            if key in CHECKED:
+                worse = -change if CHECKED[key] else change
+                if worse > tolerance:
+                    mark = "  ❌"
+                    regressions.append(f"{name}.{key} {change:+.1%}")
+            print(f"   {key:<22}{ref[key]:>12,.3f}{value:>12,.3f}{change:>+8.1%}{mark}")
+    return regressions
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--variants", default=",".join(VARIANTS), help=f"Variantes a correr ({', '.join(VARIANTS)})")
+    ap.add_argument("--steps", type=int, default=20, help="Pasos de optimización por corrida")
+    ap.add_argument("--rows", type=int, default=2000)
+    ap.add_argument("--batch_size", type=int, default=4)
+    ap.add_argument("--max_seq_len", type=int, default=256)
+    ap.add_argument("--hidden_size", type=int, default=128, help="Ancho del modelo aleatorio")
+    ap.add_argument("--layers", type=int, default=2, help="Capas del modelo aleatorio")
+    ap.add_argument("--num_proc", type=int, default=None)
+    ap.add_argument("--precision", default=None, help="--precision de lora_runner (por defecto: auto)")
+    ap.add_argument("--repeats", type=int, default=3, help="Corridas por variante (se reporta la mediana)")
+    ap.add_argument("--baseline", default=str(BASELINE), help="Archivo JSON de la línea base")
+    ap.add_argument("--save_baseline", action="store_true", help="Guardar los resultados como nueva línea base")
+    ap.add_argument("--check", action="store_true", help="Salir con error si hay regresiones")
+    ap.add_argument("--tolerance", type=float, default=0.10, help="Empeoramiento relativo tolerado")
+    args = ap.parse_args()
+
+    variants = args.variants.split(",")
+    unknown = set(variants) - set(VARIANTS)
+    if unknown:
+        ap.error(f"unknown variants: {', '.join(sorted(unknown))}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Sin red y sin cachés compartidas: cada corrida tokeniza en frío
+        os.environ["HF_HUB_OFFLINE"] = "1"
+        os.environ["HF_DATASETS_CACHE"] = os.path.join(tmp, "hf_datasets")
+        os.environ["TQDM_DISABLE"] = "1"
+        os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+        import datasets
+        from transformers.utils import logging as hf_logging
+
+        datasets.disable_caching()
+        datasets.disable_progress_bars()
+        hf_logging.set_verbosity_error()
+
+        model_dir, data = build_fixture(tmp, args.rows, args.max_seq_len, args.hidden_size, args.layers)
+        env = environment(args.precision)
+        config = {k: getattr(args, k) for k in ("steps", "rows", "batch_size", "max_seq_len",
+                                         "hidden_size", "layers", "num_proc", "precision")}
+        print(f"🏋️ {args.rows} rows, {args.steps} steps × batch {args.batch_size} × 4 (grad accum), "
+              f"max_seq_len {args.max_seq_len}, {env['cpus']} CPUs, {env['torch_threads']} torch threads")
+
+        results = {}
+        for name in variants:
+            runs = []
+            for i in range(args.repeats):
+                out = os.path.join(tmp, f"out-{name}-{i}")
+                runs.append(run_variant(name, model_dir, data, out, args))
+            results[name] = median_result(runs)
+
+    print(f"\n{'variant':<10}{'samples/s':>11}{'tokens/s':>11}{'step p50':>10}{'padding':>9}  "
+          + "".join(f"{s:>10}" for s in STAGES))
+    for name, r in results.items():
+        print(f"{name:<10}{r['samples_per_second']:>11,.1f}{r['tokens_per_second']:>11,.0f}"
+              f"{r['step_time_p50']:>9.3f}s{r['padding_ratio']:>9.1%}  "
+              + "".join(f"{r['stages'][s]:>9.2f}s" for s in STAGES))
+
+    regressions, compared = [], False
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline["config"] != config:
+            print(f"\n⚠️ Baseline config {baseline['config']} differs from this run: not comparable")
+        else:
+            if baseline["env"] != env:
+                print(f"\n⚠️ Baseline measured on {baseline['env']}, now {env}: expect differences")
+            regressions = compare(results, baseline, args.tolerance)
+            compared = True
+    elif not args.save_baseline:
+        print(f"\nℹ️ No baseline at {args.baseline} (create one with --save_baseline)")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"env": env, "config": config, "variants": results,
+                       "created": time.strftime('%Y-%m-%d %H:%M:%S')}, f, indent=2)
+            f.write("\n")
+        print(f"\n💾 Baseline saved to {args.baseline}")
+
+    if regressions:
+        print(f"\n❌ Regressions beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+        if args.check:
+            sys.exit(1)
+    elif compared:
+        print(f"\n✅ No regressions beyond {args.tolerance:.0%}")
+
+if __name__ == "__main__":
+    main()
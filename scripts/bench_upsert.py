@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+⏱️ Benchmark de upserts contra un PostgREST local simulado
+Levanta un servidor HTTP que implementa el subconjunto de PostgREST que usa
+src.ingest.upsert_supabase y compara upsert fila a fila vs. lotes concurrentes.
+Con --sync mide además una re-ingesta incremental (--edit_rate de filas cambiadas).
+Con --pipeline compara la ingesta por pasos (JSONL entero en memoria) con el
+pipeline en streaming de src.ingest.pipeline: tiempo y pico de memoria.
+
+Uso:
+    python scripts/bench_upsert.py --rows 5000 --latency 0.02 --fail_rate 0.05
+    python scripts/bench_upsert.py --rows 5000 --sync --edit_rate 0.01
+    python scripts/bench_upsert.py --rows 50000 --pipeline
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+class PostgrestStandIn(ThreadingHTTPServer):
+    """Tablas en memoria servidas con la semántica mínima de PostgREST."""
+
+    daemon_threads = True
+
+    def __init__(self, latency=0.0, fail_rate=0.0):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.tables = {}
+        self.next_id = 1
+        self.requests = 0
+        self.written = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def write(self, table, rows, on_conflict, merge):
+        with self.lock:
+            t = self.tables.setdefault(table, {})
+            for r in rows:
+                r.pop("embedding", None)  # no se consulta: no inflar la memoria medida
+                if merge and on_conflict:
+                    key = tuple(r.get(c) for c in on_conflict.split(","))
+                else:
+                    key = self.next_id
+                old = t.get(key)
+                if old is None:
+                    r["id"] = self.next_id
+                    self.next_id += 1
+                else:
+                    r["id"] = old["id"]
+                t[key] = r
+                self.written += 1
+
+    def select(self, table, cols, gt_id, limit):
+        with self.lock:
+            rows = sorted(self.tables.get(table, {}).values(), key=lambda r: r["id"])
+        rows = [r for r in rows if r["id"] > gt_id][:limit]
+        return [{c: r.get(c) for c in cols} for r in rows]
+
+    def delete(self, table, ids):
+        with self.lock:
+            t = self.tables.get(table, {})
+            for k in [k for k, r in t.items() if r["id"] in ids]:
+                del t[k]
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, code, body=b""):
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _begin(self):
+        """Latencia, fallos simulados y parseo de la URL; None si ya se respondió."""
+        srv = self.server
+        url = urlparse(self.path)
+        with srv.lock:
+            srv.requests += 1
+        time.sleep(srv.latency)
+        if random.random() < srv.fail_rate:
+            self._reply(503, b'{"message":"simulated outage"}')
+            return None
+        if not url.path.startswith("/rest/v1/"):
+            self._reply(404)
+            return None
+        return url.path[len("/rest/v1/"):], parse_qs(url.query)
+
+    def do_GET(self):
+        req = self._begin()
+        if req is None:
+            return
+        table, query = req
+        cols = query.get("select", ["*"])[0].split(",")
+        gt_id = int(query["id"][0].split(".", 1)[1]) if "id" in query else 0
+        limit = int(query.get("limit", [10**9])[0])
+        self._reply(200, json.dumps(self.server.select(table, cols, gt_id, limit)).encode())
+
+    def do_DELETE(self):
+        req = self._begin()
+        if req is None:
+            return
+        table, query = req
+        ids = {int(x) for x in query["id"][0][len("in.("):-1].split(",")}
+        self.server.delete(table, ids)
+        self._reply(204)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        req = self._begin()
+        if req is None:
+            return
+        table, query = req
+        rows = json.loads(body)
+        rows = rows if isinstance(rows, list) else [rows]
+        on_conflict = query.get("on_conflict", [None])[0]
+        merge = "merge-duplicates" in self.headers.get("Prefer", "")
+        self.server.write(table, rows, on_conflict, merge)
+        self._reply(201, b"[]")
+
+def fake_embed_batch(latency, dim=3):
+    def embed_batch(texts):
+        time.sleep(latency)
+        return [[float(len(t) % 7), 0.0, 1.0] + [0.5] * (dim - 3) for t in texts]
+    return embed_batch
+
+def make_rows(n, dup_rate):
+    rows = []
+    for i in range(n):
+        text = "Porque de tal manera amó Dios al mundo" if random.random() < dup_rate else f"Texto del versículo {i}"
+        rows.append({"book": "Juan", "chapter": 1 + i // 100, "verse": 1 + i % 100, "text": text})
+    return rows
+
+def start_server(latency, fail_rate):
+    srv = PostgrestStandIn(latency=latency, fail_rate=fail_rate)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv
+
+def run(label, rows, latency, fail_rate, batch_size, concurrency, srv=None, sync=False):
+    own = srv is None
+    srv = srv or start_server(latency, fail_rate)
+    requests, written = srv.requests, srv.written
+
+    from src.ingest import upsert_supabase as up
+    from src.utils.supa import get_client
+    client = get_client(srv.url, "stand-in.service.key")
+
+    t0 = time.perf_counter()
+    up.upsert_bible([dict(r) for r in rows], client=client, embed_fn=fake_embed_batch(latency),
+                    batch_size=batch_size, concurrency=concurrency, sync=sync)
+    dt = time.perf_counter() - t0
+    if own:
+        srv.shutdown()
+
+    stored = len(srv.tables.get("bible_verses", {}))
+    print(f"📊 {label}: {len(rows)} rows in {dt:.2f}s ({len(rows)/dt:.0f} rows/s), "
+          f"{srv.requests - requests} HTTP requests, {srv.written - written} rows written, "
+          f"{stored} rows stored")
+    return dt
+
+def run_sync(rows, args):
+    srv = start_server(args.latency, args.fail_rate)
+    full = run("full load", rows, args.latency, args.fail_rate, args.batch_size, args.concurrency, srv)
+    again = run("sync (no changes)", rows, args.latency, args.fail_rate, args.batch_size, args.concurrency, srv, sync=True)
+
+    edited = [dict(r) for r in rows[:int(len(rows) * (1 - args.edit_rate / 2))]]
+    for r in random.sample(edited, int(len(rows) * args.edit_rate / 2)):
+        r["text"] += " (revisado)"
+    delta = run("sync (edited)", edited, args.latency, args.fail_rate, args.batch_size, args.concurrency, srv, sync=True)
+    srv.shutdown()
+
+    ok = len(srv.tables.get("bible_verses", {})) == len(edited)
+    print(f"{'✅' if ok else '❌'} Remote matches local after sync; "
+          f"full {full:.2f}s vs no-op sync {again:.2f}s vs edited sync {delta:.2f}s")
+
+def run_pipeline(rows, args):
+    from src.ingest import pipeline, upsert_supabase as up
+    from src.utils.io_utils import iter_jsonl, read_jsonl, write_jsonl
+    from src.utils.supa import get_client
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bible.jsonl")
+        write_jsonl(path, rows)
+        results = {}
+        for label in ("staged", "pipeline"):
+            srv = start_server(args.latency, args.fail_rate)
+            client = get_client(srv.url, "stand-in.service.key")
+            tracemalloc.start()
+            t0 = time.perf_counter()
+            if label == "staged":
+                up.upsert_bible(read_jsonl(path), client=client, embed_fn=fake_embed_batch(args.latency, args.dim),
+                                batch_size=args.batch_size, concurrency=args.concurrency)
+            else:
+                pipeline.ingest("bible_verses", iter_jsonl(path), client=client,
+                                embed_fn=fake_embed_batch(args.latency, args.dim), batch_size=args.batch_size,
+                                embed_workers=args.concurrency, upsert_workers=args.concurrency, every=2.0)
+            dt = time.perf_counter() - t0
+            peak = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+            srv.shutdown()
+            results[label] = (dt, peak, len(srv.tables.get("bible_verses", {})))
+    for label, (dt, peak, stored) in results.items():
+        print(f"📊 {label}: {len(rows)} rows in {dt:.2f}s ({len(rows)/dt:.0f} rows/s), "
+              f"peak Python memory {peak:.1f} MB, {stored} rows stored")
+    ok = results["staged"][2] == results["pipeline"][2]
+    print(f"{'✅' if ok else '❌'} Same rows stored; memory {results['staged'][1] / results['pipeline'][1]:.1f}x lower with pipeline")
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=2000)
+    ap.add_argument("--latency", type=float, default=0.01, help="Latencia simulada por request (s)")
+    ap.add_argument("--fail_rate", type=float, default=0.0, help="Fracción de requests que devuelven 503")
+    ap.add_argument("--dup_rate", type=float, default=0.1)
+    ap.add_argument("--batch_size", type=int, default=250)
+    ap.add_argument("--concurrency", type=int, default=4)
+    ap.add_argument("--skip_baseline", action="store_true")
+    ap.add_argument("--sync", action="store_true", help="Medir re-ingesta incremental por content_hash")
+    ap.add_argument("--edit_rate", type=float, default=0.01, help="Fracción de filas editadas/borradas con --sync")
+    ap.add_argument("--pipeline", action="store_true", help="Comparar ingesta por pasos vs. pipeline en streaming")
+    ap.add_argument("--dim", type=int, default=3, help="Dimensión de los vectores simulados (1536 = real)")
+    args = ap.parse_args()
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    rows = make_rows(args.rows, args.dup_rate)
+    if args.sync:
+        run_sync(rows, args)
+        sys.exit(0)
+    if args.pipeline:
+        run_pipeline(rows, args)
+        sys.exit(0)
+    if not args.skip_baseline:
+        base = run("row-by-row", rows, args.latency, args.fail_rate, 1, 1)
+    bulk = run("bulk", rows, args.latency, args.fail_rate, args.batch_size, args.concurrency)
+    if not args.skip_baseline:
+        print(f"🚀 Speedup: {base / bulk:.1f}x")
@@ -2,7 +2,7 @@
 set -e
 export $(grep -v '^#' .env | xargs)
 python -m src.ingest.parse_bible --root ./data/bible_rva1909/ --emit ./data/_parsed_bible.jsonl
-python -m src.ingest.parse_refs  --root ./data/refs/          --emit ./data/_parsed_refs.jsonl
-python -m src.ingest.upsert_supabase \
+# Versículos y referencias en streaming: parse → dedupe → embed → upsert con colas acotadas
+python -m src.ingest.pipeline \
   --bible ./data/_parsed_bible.jsonl \
-  --refs  ./data/_parsed_refs.jsonl
\ No newline at end of file
+  --refs_root ./data/refs/
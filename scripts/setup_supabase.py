@@ -12,6 +12,122 @@ from dotenv import load_dotenv
 # Add src to path for imports
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
 
+# Bible verses table
+BIBLE_VERSES_SQL = """
+CREATE EXTENSION IF NOT EXISTS vector;
+
+CREATE TABLE IF NOT EXISTS bible_verses (
+    id SERIAL PRIMARY KEY,
+    book VARCHAR(50) NOT NULL,
+    chapter INTEGER NOT NULL,
+    verse INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    embedding VECTOR(1536),
+    content_hash VARCHAR(40),
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    UNIQUE(book, chapter, verse)
+);
+
+-- Tablas creadas antes del modo --sync
+ALTER TABLE bible_verses ADD COLUMN IF NOT EXISTS content_hash VARCHAR(40);
+
+CREATE INDEX IF NOT EXISTS idx_bible_verses_book ON bible_verses(book);
+CREATE INDEX IF NOT EXISTS idx_bible_verses_chapter ON bible_verses(book, chapter);
+"""
+
+# Bible references table
+BIBLE_REFS_SQL = """
+CREATE TABLE IF NOT EXISTS bible_refs (
+    id SERIAL PRIMARY KEY,
+    work VARCHAR(100) NOT NULL,
+    ref_key VARCHAR(100) NOT NULL,
+    seq INTEGER NOT NULL DEFAULT 0,
+    content TEXT NOT NULL,
+    embedding VECTOR(1536),
+    content_hash VARCHAR(40),
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Tablas creadas antes del modo --sync: numerar los fragmentos existentes
+-- (incluidas las copias de ingestas repetidas) para poder exigir la clave
+ALTER TABLE bible_refs ADD COLUMN IF NOT EXISTS seq INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE bible_refs ADD COLUMN IF NOT EXISTS content_hash VARCHAR(40);
+UPDATE bible_refs SET seq = n.rn
+  FROM (SELECT id, ROW_NUMBER() OVER (PARTITION BY work, ref_key ORDER BY id) - 1 AS rn
+          FROM bible_refs) n
+ WHERE bible_refs.id = n.id AND bible_refs.content_hash IS NULL;
+CREATE UNIQUE INDEX IF NOT EXISTS uq_bible_refs_key ON bible_refs(work, ref_key, seq);
+
+CREATE INDEX IF NOT EXISTS idx_bible_refs_work ON bible_refs(work);
+CREATE INDEX IF NOT EXISTS idx_bible_refs_key ON bible_refs(ref_key);
+"""
+
+# Búsqueda por similitud en el servidor (pgvector): índices ANN + funciones RPC
+VECTOR_SEARCH_SQL = """
+CREATE EXTENSION IF NOT EXISTS vector;
+
+-- HNSW desde pgvector 0.5.0 (no necesita datos previos); antes, IVFFlat.
+-- IVFFlat calcula sus listas con los datos existentes: recrearlo tras la ingesta
+-- (lists ≈ filas / 1000) y subir ivfflat.probes si falta recall.
+DO $$
+BEGIN
+  IF (SELECT string_to_array(extversion, '.')::int[] >= ARRAY[0, 5, 0]
+        FROM pg_extension WHERE extname = 'vector') THEN
+    CREATE INDEX IF NOT EXISTS idx_bible_verses_embedding ON bible_verses
+      USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64);
+    CREATE INDEX IF NOT EXISTS idx_bible_refs_embedding ON bible_refs
+      USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64);
+  ELSE
+    CREATE INDEX IF NOT EXISTS idx_bible_verses_embedding ON bible_verses
+      USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100);
+    CREATE INDEX IF NOT EXISTS idx_bible_refs_embedding ON bible_refs
+      USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100);
+  END IF;
+END $$;
+
+-- Top-k versículos por similitud coseno, con filtros opcionales por libro/capítulo.
+-- Los filtros se aplican sobre los candidatos del índice: para filtros muy
+-- selectivos subir hnsw.ef_search (o hnsw.iterative_scan en pgvector >= 0.8).
+CREATE OR REPLACE FUNCTION match_verses(
+    query_embedding VECTOR(1536),
+    match_count INT DEFAULT 10,
+    min_similarity FLOAT DEFAULT 0,
+    filter_book VARCHAR DEFAULT NULL,
+    filter_chapter INT DEFAULT NULL
+) RETURNS TABLE (id INT, book VARCHAR, chapter INT, verse INT, text TEXT, similarity FLOAT)
+LANGUAGE sql STABLE AS $$
+    SELECT v.id, v.book, v.chapter, v.verse, v.text,
+           1 - (v.embedding <=> query_embedding) AS similarity
+      FROM bible_verses v
+     WHERE v.embedding IS NOT NULL
+       AND (filter_book IS NULL OR v.book = filter_book)
+       AND (filter_chapter IS NULL OR v.chapter = filter_chapter)
+       AND 1 - (v.embedding <=> query_embedding) >= min_similarity
+     ORDER BY v.embedding <=> query_embedding
+     LIMIT match_count;
+$$;
+
+-- Top-k fragmentos de obras de referencia, con filtros opcionales por obra/referencia
+CREATE OR REPLACE FUNCTION match_refs(
+    query_embedding VECTOR(1536),
+    match_count INT DEFAULT 10,
+    min_similarity FLOAT DEFAULT 0,
+    filter_work VARCHAR DEFAULT NULL,
+    filter_ref_key VARCHAR DEFAULT NULL
+) RETURNS TABLE (id INT, work VARCHAR, ref_key VARCHAR, seq INT, content TEXT, similarity FLOAT)
+LANGUAGE sql STABLE AS $$
+    SELECT r.id, r.work, r.ref_key, r.seq, r.content,
+           1 - (r.embedding <=> query_embedding) AS similarity
+      FROM bible_refs r
+     WHERE r.embedding IS NOT NULL
+       AND (filter_work IS NULL OR r.work = filter_work)
+       AND (filter_ref_key IS NULL OR r.ref_key = filter_ref_key)
+       AND 1 - (r.embedding <=> query_embedding) >= min_similarity
+     ORDER BY r.embedding <=> query_embedding
+     LIMIT match_count;
+$$;
+"""
+
 def setup_supabase_storage():
     """Create and configure Supabase storage buckets"""
     
@@ -138,44 +254,14 @@ def create_database_tables():
         
         print("\n📊 Setting up database tables...")
         
-        # Bible verses table
-        bible_verses_sql = """
-        CREATE TABLE IF NOT EXISTS bible_verses (
-            id SERIAL PRIMARY KEY,
-            book VARCHAR(50) NOT NULL,
-            chapter INTEGER NOT NULL,
-            verse INTEGER NOT NULL,
-            text TEXT NOT NULL,
-            embedding VECTOR(1536),
-            created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-            UNIQUE(book, chapter, verse)
-        );
-        
-        CREATE INDEX IF NOT EXISTS idx_bible_verses_book ON bible_verses(book);
-        CREATE INDEX IF NOT EXISTS idx_bible_verses_chapter ON bible_verses(book, chapter);
-        """
-        
-        # Bible references table  
-        bible_refs_sql = """
-        CREATE TABLE IF NOT EXISTS bible_refs (
-            id SERIAL PRIMARY KEY,
-            work VARCHAR(100) NOT NULL,
-            ref_key VARCHAR(100) NOT NULL,
-            content TEXT NOT NULL,
-            embedding VECTOR(1536),
-            created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
-        );
-        
-        CREATE INDEX IF NOT EXISTS idx_bible_refs_work ON bible_refs(work);
-        CREATE INDEX IF NOT EXISTS idx_bible_refs_key ON bible_refs(ref_key);
-        """
-        
         # Execute SQL (Note: Direct SQL execution might need RPC function)
         print("📋 Tables SQL prepared (may need manual execution in Supabase dashboard)")
         print("SQL for bible_verses table:")
-        print(bible_verses_sql)
+        print(BIBLE_VERSES_SQL)
         print("\nSQL for bible_refs table:")
-        print(bible_refs_sql)
+        print(BIBLE_REFS_SQL)
+        print("\nSQL for vector search (indexes + match_verses/match_refs):")
+        print(VECTOR_SEARCH_SQL)
         
         return True
         
@@ -12,4 +12,5 @@ python -m src.train.lora_runner \
   --lr ${LR:-2e-4} \
   --save_steps ${SAVE_STEPS:-200} \
   --save_total ${SAVE_TOTAL:-3} \
-  --max_seq_len ${MAX_SEQ_LEN:-1024}
\ No newline at end of file
+  --max_seq_len ${MAX_SEQ_LEN:-1024} \
+  --resume "${RESUME-auto}"
\ No newline at end of file
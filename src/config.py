@@ -10,6 +10,15 @@ class Cfg(BaseModel):
     supabase_anon: str = os.getenv("SUPABASE_ANON_KEY","")
     bucket_ckpt: str = os.getenv("SUPABASE_BUCKET","jotica-models")
     bucket_data: str = os.getenv("SUPABASE_DATA_BUCKET","jotica-data")
+    supabase_timeout: float = float(os.getenv("SUPABASE_TIMEOUT","60"))       # segundos por request
+    supabase_pool_size: int = int(os.getenv("SUPABASE_POOL_SIZE","16"))       # conexiones keep-alive
+    supabase_retries: int = int(os.getenv("SUPABASE_RETRIES","5"))
+    dataset_cache: str = os.getenv("DATASET_CACHE","./data/cache/tokenized")   # vacío = sin caché
+    verse_index: str = os.getenv("VERSE_INDEX","./data/refs_index")          # prefijo del índice versículo → chunks
+    storage_backend: str = os.getenv("STORAGE_BACKEND","supabase")            # supabase | local
+    storage_local_root: str = os.getenv("STORAGE_LOCAL_ROOT","/workspace/jotica/storage")
+    ckpt_cache_dir: str = os.getenv("CKPT_CACHE_DIR","")                      # vacío = sin caché local
+    ckpt_cache_gb: float = float(os.getenv("CKPT_CACHE_GB","50"))
     base_model: str = os.getenv("BASE_MODEL","meta-llama/Llama-3-8B-Instruct")
     output_dir: str = os.getenv("OUTPUT_DIR","/workspace/jotica/checkpoints")
     run_name: str = os.getenv("RUN_NAME","jotica-bible-lora-001")
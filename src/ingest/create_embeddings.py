@@ -10,9 +10,9 @@ import time
 import logging
 
 import openai
-from supabase import create_client
 
 from ..utils import setup_logging, ConfigManager, ensure_dir, BibleProcessor
+from ..utils.supa import get_client
 
 # Setup logging
 logger = setup_logging()
@@ -44,7 +44,7 @@ class EmbeddingGenerator:
         
         if supabase_url and supabase_key:
             try:
-                self.supabase_client = create_client(supabase_url, supabase_key)
+                self.supabase_client = get_client(supabase_url, supabase_key)
                 logger.info("Supabase client initialized")
             except Exception as e:
                 logger.warning(f"Failed to initialize Supabase client: {e}")
@@ -0,0 +1,94 @@
+"""
+Text deduplication for the ingestion pipeline.
+
+Overlapping commentary chunks, repeated boilerplate and verses that read the
+same across translations would otherwise each cost an embedding call. Texts
+are keyed by a hash of their normalized form so every unique text is embedded
+once and its vector is shared by all rows that carry it.
+"""
+
+import hashlib
+import unicodedata
+from typing import Callable, Dict, List, Tuple
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize text for deduplication (Unicode NFC, collapsed whitespace).
+
+    Args:
+        text: Raw text
+
+    Returns:
+        Normalized text
+    """
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+def text_key(text: str) -> str:
+    """
+    Content hash of the normalized text.
+
+    Args:
+        text: Raw text
+
+    Returns:
+        Hex SHA-1 digest
+    """
+    return _digest(normalize_text(text))
+
+def _digest(norm: str) -> str:
+    return hashlib.sha1(norm.encode("utf-8")).hexdigest()
+
+def dedupe_texts(texts: List[str]) -> Tuple[List[str], List[int]]:
+    """
+    Collapse identical texts.
+
+    Args:
+        texts: Texts in row order
+
+    Returns:
+        Tuple of (unique normalized texts, slot of each input text in that list)
+    """
+    slots_by_key: Dict[str, int] = {}
+    unique: List[str] = []
+    slots: List[int] = []
+
+    for text in texts:
+        norm = normalize_text(text)
+        key = _digest(norm)
+        slot = slots_by_key.get(key)
+        if slot is None:
+            slot = len(unique)
+            slots_by_key[key] = slot
+            unique.append(norm)
+        slots.append(slot)
+
+    return unique, slots
+
+def dedup_stats(total: int, unique: int) -> Dict[str, float]:
+    """Summarize how much deduplication saved."""
+    return {
+        "rows": total,
+        "unique": unique,
+        "saved": total - unique,
+        "ratio": (total / unique) if unique else 1.0,
+    }
+
+def embed_deduped(texts: List[str], embed_many: Callable[[List[str]], List[List[float]]], label: str = "rows") -> List[List[float]]:
+    """
+    Embed each unique text once and fan the vectors back out to every row.
+
+    Args:
+        texts: Texts in row order
+        embed_many: Function that embeds a list of texts, preserving order
+        label: Name used in the deduplication report
+
+    Returns:
+        One embedding per input text, in input order
+    """
+    unique, slots = dedupe_texts(texts)
+    stats = dedup_stats(len(texts), len(unique))
+    print(f"🔁 Dedup {label}: {stats['rows']} rows → {stats['unique']} unique texts "
+          f"({stats['saved']} embedding calls saved, {stats['ratio']:.2f}x)")
+
+    vectors = embed_many(unique)
+    return [vectors[s] for s in slots]
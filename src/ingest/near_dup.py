@@ -0,0 +1,245 @@
+"""
+Near-duplicate detection for commentary chunks (MinHash + LSH).
+
+Commentaries quote each other and the same verses constantly, so many chunks
+differ only in a few words. Each chunk gets a MinHash signature of its word
+5-grams; signatures are cut into bands and every band is a bucket key in an
+on-disk SQLite table. A chunk whose band collides with an earlier
+representative is compared signature to signature, and if the estimated
+Jaccard similarity reaches the threshold it is dropped and a back-reference to
+the representative is written to a side file. Only representatives are
+indexed, and the index lives on disk, so memory stays flat for millions of
+chunks. ``SyncKeys`` keeps the remote rows and the natural keys an ingestion
+has produced (for --sync) in the same database.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import zlib
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .dedup import normalize_text
+
+DUP_THRESHOLD = 0.8
+NUM_PERM = 128
+SHINGLE = 5              # palabras por shingle
+COMMIT_EVERY = 10_000
+LOOKUP_BATCH = 10_000     # ids obsoletos por lote al recorrerlos
+
+# Los candidatos se verifican con la firma completa: un falso positivo solo cuesta una comparación
+FN_WEIGHT = 0.9
+
+_WORD = re.compile(r"\w+")
+
+def _lsh_params(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """(bands, rows) minimizing weighted false positives + false negatives around the threshold."""
+    s = np.linspace(0.0, 1.0, 201)
+    best, best_err = (1, num_perm), float("inf")
+    for bands in range(1, num_perm + 1):
+        rows = num_perm // bands
+        p = 1 - (1 - s ** rows) ** bands   # probabilidad de ser candidato con similitud s
+        err = np.mean(np.where(s < threshold, (1 - FN_WEIGHT) * p, FN_WEIGHT * (1 - p)))
+        if err < best_err:
+            best, best_err = (bands, rows), err
+    return best
+
+def shingles(text: str, k: int = SHINGLE) -> np.ndarray:
+    """Hashes (uint64) of the word k-grams of the normalized, lowercased text."""
+    words = _WORD.findall(normalize_text(text).lower())
+    if not words:
+        return np.zeros(1, dtype=np.uint64)
+    h = np.fromiter((zlib.crc32(w.encode("utf-8")) for w in words), dtype=np.uint64, count=len(words))
+    k = min(k, len(h))
+    out = np.zeros(len(h) - k + 1, dtype=np.uint64)
+    for j in range(k):
+        # Combinación polinómica de las k palabras (módulo 2**64)
+        out = out * np.uint64(0x100000001B3) + h[j:len(h) - k + 1 + j]
+    return np.unique(out)
+
+class NearDupIndex:
+    """Streaming near-duplicate clustering over an on-disk LSH band index."""
+
+    def __init__(self, threshold: float = DUP_THRESHOLD, path: Optional[str] = None,
+                 num_perm: int = NUM_PERM, seed: int = 1):
+        """
+        Initialize an empty index.
+
+        Args:
+            threshold: Estimated Jaccard similarity at which a chunk is a near-duplicate
+            path: SQLite file (defaults to a temporary file removed on close)
+            num_perm: MinHash permutations (signature length)
+            seed: Seed of the permutations; signatures are only comparable with the same one
+        """
+        self.threshold = threshold
+        self.bands, self.rows = _lsh_params(threshold, num_perm)
+        rng = np.random.default_rng(seed)
+        # Hash multiplicativo: (a*x + b) mod 2**64, quedarse con los 32 bits altos
+        self.a = rng.integers(1, 2**63, num_perm, dtype=np.uint64) | np.uint64(1)
+        self.b = rng.integers(0, 2**63, num_perm, dtype=np.uint64)
+        # Un multiplicador por posición y una sal por banda: la misma banda en otra posición no colisiona
+        self.band_mult = rng.integers(1, 2**63, self.rows, dtype=np.uint64) | np.uint64(1)
+        self.band_salt = rng.integers(0, 2**63, self.bands, dtype=np.uint64)
+        self._tmp = None
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix="neardup_", suffix=".sqlite")
+            os.close(fd)
+            self._tmp = path
+        elif os.path.exists(path):
+            os.remove(path)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript("""
+            PRAGMA journal_mode=OFF;
+            PRAGMA synchronous=OFF;
+            CREATE TABLE reps (id INTEGER PRIMARY KEY, key TEXT, sig BLOB);
+            CREATE TABLE lsh (bucket INTEGER, rep INTEGER, PRIMARY KEY (bucket, rep)) WITHOUT ROWID;
+        """)
+        self.pending = 0
+        self.stats = {"chunks": 0, "representatives": 0, "duplicates": 0}
+
+    def signature(self, text: str) -> np.ndarray:
+        """MinHash signature (uint32) of the text's shingles."""
+        x = shingles(text)
+        # (num_perm, n) en bloques para acotar memoria con textos largos
+        sig = np.full(len(self.a), np.iinfo(np.uint32).max, dtype=np.uint64)
+        for i in range(0, len(x), 4096):
+            h = (self.a[:, None] * x[None, i:i + 4096] + self.b[:, None]) >> np.uint64(32)
+            np.minimum(sig, h.min(axis=1), out=sig)
+        return sig.astype(np.uint32)
+
+    def _buckets(self, sig: np.ndarray):
+        bands = sig[:self.bands * self.rows].astype(np.uint64).reshape(self.bands, self.rows)
+        keys = (bands * self.band_mult).sum(axis=1, dtype=np.uint64) + self.band_salt
+        return keys.view(np.int64).tolist()
+
+    def check(self, key: Any, text: str) -> Optional[Tuple[Any, float]]:
+        """
+        Match a chunk against the representatives seen so far.
+
+        Args:
+            key: JSON-serializable identifier of the chunk
+            text: Chunk text
+
+        Returns:
+            (representative key, estimated similarity) if the chunk is a
+            near-duplicate, otherwise None (the chunk becomes a representative)
+        """
+        sig = self.signature(text)
+        buckets = self._buckets(sig)
+        self.stats["chunks"] += 1
+        best, best_sim = None, self.threshold
+        marks = ",".join("?" * len(buckets))
+        for rep_key, rep_sig in self.db.execute(
+                f"SELECT key, sig FROM reps WHERE id IN (SELECT rep FROM lsh WHERE bucket IN ({marks}))", buckets):
+            sim = float(np.mean(np.frombuffer(rep_sig, dtype=np.uint32) == sig))
+            if sim >= best_sim:
+                best, best_sim = rep_key, sim
+        if best is not None:
+            self.stats["duplicates"] += 1
+            return json.loads(best), best_sim
+
+        cur = self.db.execute("INSERT INTO reps (key, sig) VALUES (?, ?)", (json.dumps(key), sig.tobytes()))
+        self.db.executemany("INSERT OR IGNORE INTO lsh VALUES (?, ?)", [(k, cur.lastrowid) for k in buckets])
+        self.stats["representatives"] += 1
+        self.pending += 1
+        if self.pending >= COMMIT_EVERY:
+            self.db.commit()
+            self.pending = 0
+        return None
+
+    def close(self) -> None:
+        self.db.commit()
+        self.db.close()
+        if self._tmp:
+            os.remove(self._tmp)
+
+class SyncKeys:
+    """Remote rows (natural key → id, content_hash) and the keys an ingestion produced, kept in SQLite."""
+
+    def __init__(self, db: Optional[sqlite3.Connection] = None):
+        """
+        Open the store.
+
+        Args:
+            db: Connection to share (e.g. NearDupIndex.db); defaults to a temporary file removed on close
+        """
+        self._tmp = None
+        if db is None:
+            fd, self._tmp = tempfile.mkstemp(prefix="sync_", suffix=".sqlite")
+            os.close(fd)
+            db = sqlite3.connect(self._tmp, check_same_thread=False)
+            db.executescript("PRAGMA journal_mode=OFF; PRAGMA synchronous=OFF;")
+        self.db = db
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS remote (key TEXT PRIMARY KEY, id, hash TEXT) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS seen (key TEXT PRIMARY KEY) WITHOUT ROWID;
+        """)
+
+    def add_remote(self, rows: Iterable[Tuple[Tuple, Any, Optional[str]]]) -> int:
+        """Store (key, id, content_hash) rows of the remote table; returns how many."""
+        rows = [(json.dumps(list(k)), rid, h) for k, rid, h in rows]
+        self.db.executemany("INSERT OR REPLACE INTO remote VALUES (?, ?, ?)", rows)
+        return len(rows)
+
+    def remote(self, key: Tuple) -> Optional[Tuple[Any, Optional[str]]]:
+        """(id, content_hash) of the remote row with this key, or None."""
+        return self.db.execute("SELECT id, hash FROM remote WHERE key = ?", (json.dumps(list(key)),)).fetchone()
+
+    def add(self, key: Tuple) -> None:
+        """Mark a key as produced by this ingestion."""
+        self.db.execute("INSERT OR IGNORE INTO seen VALUES (?)", (json.dumps(list(key)),))
+
+    def __contains__(self, key: Tuple) -> bool:
+        return self.db.execute("SELECT 1 FROM seen WHERE key = ?", (json.dumps(list(key)),)).fetchone() is not None
+
+    def stale_ids(self, batch_size: int = LOOKUP_BATCH) -> Iterator[List[Any]]:
+        """Ids of the remote rows whose key was never produced, in lists of at most batch_size."""
+        cur = self.db.execute("SELECT id FROM remote WHERE key NOT IN (SELECT key FROM seen) ORDER BY id")
+        while True:
+            ids = [rid for (rid,) in cur.fetchmany(batch_size)]
+            if not ids:
+                return
+            yield ids
+
+    def close(self) -> None:
+        # Con una conexión compartida la cierra su dueño
+        if self._tmp:
+            self.db.close()
+            os.remove(self._tmp)
+
+def filter_near_dups(rows: Iterable[Dict[str, Any]], index: NearDupIndex, log_path: Optional[str] = None,
+                     text_col: str = "content", key_cols: Tuple[str, ...] = ("work", "ref_key", "seq"),
+                     ) -> Iterator[Dict[str, Any]]:
+    """
+    Drop near-duplicate rows, writing a back-reference for each one.
+
+    Args:
+        rows: Rows in ingestion order (the first of each cluster is kept)
+        index: Near-duplicate index
+        log_path: JSONL side file of {key..., "duplicate_of": {key...}, "similarity"}
+        text_col: Column compared
+        key_cols: Columns identifying a row
+
+    Yields:
+        Representative rows
+    """
+    log = open(log_path, "w", encoding="utf-8") if log_path else None
+    try:
+        for r in rows:
+            key = {c: r[c] for c in key_cols if c in r}
+            match = index.check(key, r[text_col])
+            if match is None:
+                yield r
+            elif log:
+                log.write(json.dumps({**key, "duplicate_of": match[0], "similarity": round(match[1], 3)},
+                                     ensure_ascii=False) + "\n")
+    finally:
+        if log:
+            log.close()
+        s = index.stats
+        print(f"🧬 Near-dup (Jaccard ≥ {index.threshold}): {s['chunks']} chunks → "
+              f"{s['representatives']} kept, {s['duplicates']} near-duplicates")
@@ -1,26 +1,48 @@
 import argparse
 import os
 import glob
-from ..utils.io_utils import read_text, write_jsonl
+from ..utils.chunking import MAX_TOKENS, OVERLAP_TOKENS, chunk_by_tokens, iter_file_chunks
+from ..utils.io_utils import write_jsonl
+from ..utils.verse_index import VerseIndexWriter, index_rows
+from .near_dup import DUP_THRESHOLD, NearDupIndex, filter_near_dups
 
-def chunk_text(txt, max_chars=2000, overlap=200):
-    out, i = [], 0
-    while i < len(txt):
-        out.append(txt[i:i+max_chars])
-        i += max_chars - overlap
-    return out
+def chunk_refs(txt, max_tokens=MAX_TOKENS, overlap=OVERLAP_TOKENS):
+    # Cortes entre oraciones con presupuesto de tokens (ver utils/chunking.py)
+    return chunk_by_tokens(txt, max_tokens, overlap)
+
+def dup_log_path(emit):
+    return os.path.splitext(emit)[0] + ".dups.jsonl"
+
+def list_files(root):
+    return sorted(glob.glob(os.path.join(root,"**","*.txt"), recursive=True))
+
+def parse_file(p):
+    # Generador: los comentarios grandes se leen por bloques, sin cargarlos enteros
+    work = "Unknown"  # ej: "Matthew Henry"
+    ref_key = os.path.basename(p).replace(".txt","")  # ej: "Jn_1_1" o "Simbolos_Agua"
+    for seq, (start, end, ch) in enumerate(iter_file_chunks(p)):
+        yield {"work":work,"ref_key":ref_key,"seq":seq,"start":start,"end":end,"content":ch}
 
 if __name__ == "__main__":
     ap = argparse.ArgumentParser()
     ap.add_argument("--root", required=True)
     ap.add_argument("--emit", required=True)
+    ap.add_argument("--dup_threshold", type=float, default=DUP_THRESHOLD,
+                    help="Jaccard a partir del cual un fragmento es casi duplicado (0 desactiva)")
+    ap.add_argument("--dup_log", default=None, help="JSONL de back-references (por defecto <emit>.dups.jsonl)")
+    ap.add_argument("--verse_index", default=None,
+                    help="Prefijo del índice versículo → fragmento (por defecto <emit> sin extensión)")
     args = ap.parse_args()
 
-    rows = []
-    for p in glob.glob(os.path.join(args.root,"**","*.txt"), recursive=True):
-        txt = read_text(p)
-        work = "Unknown"  # ej: "Matthew Henry"
-        ref_key = os.path.basename(p).replace(".txt","")  # ej: "Jn_1_1" o "Simbolos_Agua"
-        for ch in chunk_text(txt):
-            rows.append({"work":work,"ref_key":ref_key,"content":ch})
-    write_jsonl(args.emit, rows)
\ No newline at end of file
+    rows = (r for p in list_files(args.root) for r in parse_file(p))
+    index = None
+    if args.dup_threshold > 0:
+        # Un representante por grupo de casi duplicados; el resto queda referenciado en el log
+        index = NearDupIndex(args.dup_threshold)
+        rows = filter_near_dups(rows, index, args.dup_log or dup_log_path(args.emit))
+    # Ids del índice = número de línea en --emit (después de quitar casi duplicados)
+    verses = VerseIndexWriter(args.verse_index or os.path.splitext(args.emit)[0])
+    write_jsonl(args.emit, index_rows(rows, verses))
+    verses.close()
+    if index is not None:
+        index.close()
\ No newline at end of file
@@ -0,0 +1,447 @@
+"""
+Streaming ingestion: parse → dedupe → embed → upsert over bounded queues.
+
+Each stage runs its own worker threads and reads from a bounded queue, so a
+slow stage (usually embed or upsert) blocks the ones before it instead of
+letting batches pile up in memory. Rows are never materialized as a whole:
+memory holds at most the batches in flight and a bounded cache of recent
+vectors for repeated texts; for --sync, the remote key → hash rows and the
+natural keys seen go to SQLite, and the rows to delete are a query there.
+Commentary near-duplicates are dropped in the dedupe stage against an
+on-disk LSH index (see near_dup.py), and the verses each kept chunk cites go
+to the verse → chunk index (see utils/verse_index.py).
+
+Several parse workers finish files in any order, but the dedupe stage sees
+them in source order: it is an ordered stage that buffers early batches
+until the ones before them arrive, and the feeder stays at most `window`
+files ahead of it. Which chunk of a near-duplicate cluster is kept, the
+verse index ids and what --sync deletes therefore do not depend on timing.
+"""
+
+import argparse
+import json
+import queue
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+from ..utils.emb import embed_batch
+from ..config import cfg
+from ..utils.io_utils import iter_jsonl
+from ..utils.retry import retry_call
+from ..utils.supa import get_client
+from ..utils.verse_index import VerseIndexWriter
+from .dedup import normalize_text, _digest
+from .near_dup import DUP_THRESHOLD, NearDupIndex, SyncKeys
+from .parse_refs import list_files, parse_file
+from .upsert_supabase import ATTEMPTS, TABLES, UPSERT_BATCH, _delete, iter_remote_hashes
+
+PARSE_WORKERS = 2
+EMBED_WORKERS = 4
+UPSERT_WORKERS = 4
+VECTOR_CACHE = 10_000   # vectores recientes reutilizables (~6 KB c/u en float32)
+REPORT_EVERY = 5.0
+
+_DONE = object()
+
+class Stage:
+    """
+    One pipeline step run by `workers` threads.
+
+    fn(batch) returns the batch for the next stage (falsy to drop it), or an
+    iterable of batches when many=True (e.g. one parsed file split into batches).
+    An ordered stage (one worker, right after the first stage) gets its
+    batches in the order of the source items they came from.
+    """
+
+    def __init__(self, name, fn, workers=1, queue_size=None, many=False, ordered=False):
+        self.name = name
+        self.fn = fn
+        self.many = many
+        self.ordered = ordered
+        self.workers = max(1, workers)
+        self.inbox = queue.Queue(maxsize=queue_size or 2 * self.workers)
+        self.items = 0
+        self.batches = 0
+        self.busy = 0.0
+        self.running = 0
+        self.lock = threading.Lock()
+        # Reordenamiento: (ítem, parte) → lote llegado antes de su turno
+        self.pending = {}
+        self.next = (0, 0)
+
+class Pipeline:
+    """Threads + bounded queues between stages, with live per-stage throughput."""
+
+    def __init__(self, stages, every=REPORT_EVERY, window=None):
+        for i, s in enumerate(stages):
+            if s.ordered and (i != 1 or s.workers != 1):
+                raise ValueError(f"Ordered stage {s.name} must have one worker and follow the first stage")
+        self.stages = stages
+        self.every = every
+        self.stop = threading.Event()
+        self.error = None
+        self.started = None
+        # Con una etapa ordenada, el feeder no se adelanta más de `window` ítems a ella
+        self.ordered = len(stages) > 1 and stages[1].ordered
+        self.window = window or 4 * stages[0].workers
+        self.released = 0
+        self.progress = threading.Condition()
+
+    def _put(self, q, item):
+        # Bloquea mientras la cola esté llena (backpressure), salvo que otro hilo haya fallado
+        while not self.stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        while not self.stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _fail(self, e):
+        if self.error is None:
+            self.error = e
+        self.stop.set()
+
+    def _wait_window(self, i):
+        with self.progress:
+            while i >= self.released + self.window:
+                if self.stop.is_set():
+                    return False
+                self.progress.wait(0.1)
+        return True
+
+    def _feed(self, source):
+        first = self.stages[0]
+        try:
+            for i, batch in enumerate(source):
+                if self.ordered and not self._wait_window(i):
+                    return
+                # Etiqueta (ítem de la fuente, parte, última parte)
+                if not self._put(first.inbox, ((i, 0, True), batch)):
+                    return
+        except Exception as e:
+            self._fail(e)
+            return
+        for _ in range(first.workers):
+            self._put(first.inbox, _DONE)
+
+    @staticmethod
+    def _tagged(item, batches):
+        # Partes numeradas del ítem; la última lo marca completo (None si no produjo lotes)
+        prev, part = None, 0
+        for b in batches:
+            if not b:
+                continue
+            if prev is not None:
+                yield (item, part, False), prev
+                part += 1
+            prev = b
+        yield (item, part, True), prev
+
+    def _in_order(self, stage, tag, batch):
+        # Guarda el lote y entrega, en orden de la fuente, todos los que ya pueden salir
+        stage.pending[tag[:2]] = (tag, batch)
+        while stage.next in stage.pending:
+            tag, batch = stage.pending.pop(stage.next)
+            item, part, last = tag
+            stage.next = (item + 1, 0) if last else (item, part + 1)
+            yield tag, batch
+            if last:
+                with self.progress:
+                    self.released = item + 1
+                    self.progress.notify_all()
+
+    def _process(self, stage, nxt, tag, batch):
+        t0 = time.perf_counter()
+        out = stage.fn(batch)
+        with stage.lock:
+            stage.busy += time.perf_counter() - t0
+            stage.items += len(batch)
+            stage.batches += 1
+        if nxt is None:
+            return True
+        outs = (out or []) if stage.many else [out]
+        sent = self._tagged(tag[0], outs) if nxt.ordered else ((tag, b) for b in outs if b)
+        return all(self._put(nxt.inbox, x) for x in sent)
+
+    def _work(self, i):
+        stage = self.stages[i]
+        nxt = self.stages[i + 1] if i + 1 < len(self.stages) else None
+        running = True
+        while running:
+            item = self._get(stage.inbox)
+            if item is _DONE:
+                break
+            ready = self._in_order(stage, *item) if stage.ordered else [item]
+            try:
+                for tag, batch in ready:
+                    # Marcador de un ítem sin lotes: solo avanza el orden
+                    if batch is not None and not self._process(stage, nxt, tag, batch):
+                        running = False
+                        break
+            except Exception as e:
+                print(f"❌ Stage {stage.name} failed: {e}")
+                self._fail(e)
+                break
+        with stage.lock:
+            stage.running -= 1
+            last = stage.running == 0
+        # El último worker de la etapa cierra la siguiente
+        if last and nxt is not None:
+            for _ in range(nxt.workers):
+                self._put(nxt.inbox, _DONE)
+
+    def report(self, final=False):
+        elapsed = time.perf_counter() - self.started
+        parts = []
+        for s in self.stages:
+            busy = s.busy / (elapsed * s.workers) if elapsed > 0 else 0.0
+            parts.append(f"{s.name} {s.items} ({s.items / elapsed if elapsed else 0:.0f}/s, "
+                         f"busy {busy:.0%}, q {s.inbox.qsize()}/{s.inbox.maxsize})")
+        print(f"{'📊' if final else '⏱️'} [{elapsed:.1f}s] " + " | ".join(parts))
+
+    def _monitor(self, done):
+        while not done.wait(self.every):
+            self.report()
+
+    def run(self, source):
+        """Push every batch of `source` through the stages; raises if any stage fails."""
+        self.started = time.perf_counter()
+        threads = [threading.Thread(target=self._feed, args=(source,), daemon=True)]
+        for i, stage in enumerate(self.stages):
+            stage.running = stage.workers
+            threads += [threading.Thread(target=self._work, args=(i,), daemon=True) for _ in range(stage.workers)]
+        done = threading.Event()
+        monitor = threading.Thread(target=self._monitor, args=(done,), daemon=True)
+        for t in threads:
+            t.start()
+        monitor.start()
+        for t in threads:
+            t.join()
+        done.set()
+        self.report(final=True)
+        if self.error is not None:
+            raise RuntimeError(f"Pipeline aborted: {self.error}") from self.error
+
+class VectorCache:
+    """Bounded LRU of text hash → embedding (float32) shared by the embed workers."""
+
+    def __init__(self, size=VECTOR_CACHE):
+        self.size = size
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+
+    def get(self, key):
+        with self.lock:
+            v = self.data.get(key)
+            if v is not None:
+                self.data.move_to_end(key)
+                self.hits += 1
+            return v
+
+    def put(self, key, vec):
+        with self.lock:
+            self.data[key] = array("f", vec)
+            self.data.move_to_end(key)
+            while len(self.data) > self.size:
+                self.data.popitem(last=False)
+
+def batched(rows, size):
+    batch = []
+    for r in rows:
+        batch.append(r)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _shape(table, r, counters):
+    if table == "bible_verses":
+        return {"book": r["book"], "chapter": r["chapter"], "verse": r["verse"], "text": r["text"]}
+    # JSONL antiguos no traen "seq": numerar los fragmentos de cada ref_key en orden
+    k = (r["work"], r["ref_key"])
+    seq = r.get("seq", counters.get(k, 0))
+    counters[k] = seq + 1
+    return {"work": r["work"], "ref_key": r["ref_key"], "seq": seq, "content": r["content"]}
+
+def ingest(table, source, client=None, embed_fn=None, batch_size=UPSERT_BATCH, parse_fn=None,
+           parse_workers=PARSE_WORKERS, embed_workers=EMBED_WORKERS, upsert_workers=UPSERT_WORKERS,
+           queue_size=None, sync=False, every=REPORT_EVERY, near_dup=None, dup_log=None, verses=None):
+    """
+    Stream one table through parse → dedupe → embed → upsert.
+
+    Args:
+        table: "bible_verses" or "bible_refs"
+        source: Iterable of raw rows, or of parse_fn inputs when parse_fn is given
+        client: Supabase client (defaults to the shared one)
+        embed_fn: Function embedding a list of texts (defaults to emb.embed_batch)
+        batch_size: Rows per batch (one embeddings call and one upsert each)
+        parse_fn: Turns one source item into a list of raw rows (e.g. a file into chunks)
+        parse_workers, embed_workers, upsert_workers: Threads per stage
+        queue_size: Batches buffered before each stage (defaults to 2x its workers)
+        sync: Skip rows whose content_hash matches the remote and delete rows missing locally
+        every: Seconds between live reports
+        near_dup: NearDupIndex; rows close to an earlier one are dropped
+        dup_log: JSONL file receiving a back-reference per dropped row
+        verses: VerseIndexWriter receiving every kept row
+
+    Returns:
+        Dictionary of counters
+    """
+    client = client or get_client()
+    embed_fn = embed_fn or embed_batch
+    spec = TABLES[table]
+    text_col, key_cols = spec["text"], spec["key"]
+    on_conflict = ",".join(key_cols)
+    cache = VectorCache()
+    stats = {"rows": 0, "near_dups": 0, "unchanged": 0, "embedded": 0, "written": 0, "deleted": 0}
+    stats_lock = threading.Lock()
+    counters, keys = {}, None
+    if sync:
+        # Filas remotas y claves vistas en disco, junto a las bandas LSH si hay índice de casi duplicados
+        keys = SyncKeys(near_dup.db if near_dup is not None else None)
+        n = sum(keys.add_remote(page) for page in iter_remote_hashes(table, client))
+        print(f"🔄 Sync {table}: {n} remote rows")
+    log = open(dup_log, "w", encoding="utf-8") if near_dup is not None and dup_log else None
+
+    if parse_fn is None:
+        # Las filas ya vienen parseadas: numerar seq en orden antes de repartir lotes
+        source = batched((_shape(table, r, counters) for r in source), batch_size)
+        parse = lambda batch: [batch]
+    else:
+        source = batched(source, 1)
+        parse = lambda items: batched((_shape(table, r, {}) for item in items for r in parse_fn(item)), batch_size)
+
+    def dedupe(batch):
+        # Una sola instancia, en el orden de la fuente: el primero de cada grupo es el representante
+        out = []
+        for r in batch:
+            norm = normalize_text(r[text_col])
+            r["content_hash"] = _digest(norm)
+            if near_dup is not None:
+                # Antes de --sync: un casi duplicado que ya estaba arriba se borra como obsoleto
+                key = {c: r[c] for c in key_cols}
+                match = near_dup.check(key, r[text_col])
+                if match is not None:
+                    stats["near_dups"] += 1
+                    if log:
+                        log.write(json.dumps({**key, "duplicate_of": match[0], "similarity": round(match[1], 3)},
+                                             ensure_ascii=False) + "\n")
+                    continue
+            if verses is not None:
+                verses.add(r)
+            if sync:
+                k = tuple(r[c] for c in key_cols)
+                keys.add(k)
+                current = keys.remote(k)
+                if current is not None and current[1] == r["content_hash"]:
+                    stats["unchanged"] += 1
+                    continue
+            r["_norm"] = norm
+            out.append(r)
+        stats["rows"] += len(batch)
+        return out
+
+    def embed(batch):
+        vectors, todo = {}, {}
+        for r in batch:
+            key = r["content_hash"]
+            if key in vectors or key in todo:
+                continue
+            hit = cache.get(key)
+            if hit is not None:
+                vectors[key] = list(hit)
+            else:
+                todo[key] = r["_norm"]
+        if todo:
+            vecs = retry_call(embed_fn, list(todo.values()), attempts=ATTEMPTS,
+                              on_retry=lambda n, e: print(f"⚠️ embed retry {n}: {e}"))
+            for key, v in zip(todo, vecs):
+                vectors[key] = v
+                cache.put(key, v)
+            with stats_lock:
+                stats["embedded"] += len(todo)
+        for r in batch:
+            r["embedding"] = vectors[r["content_hash"]]
+            del r["_norm"]
+        return batch
+
+    def upsert(batch):
+        retry_call(lambda: client.table(table).upsert(batch, on_conflict=on_conflict).execute(),
+                   attempts=ATTEMPTS, on_retry=lambda n, e: print(f"⚠️ {table} upsert retry {n}: {e}"))
+        with stats_lock:
+            stats["written"] += len(batch)
+        return None
+
+    try:
+        Pipeline([
+            Stage("parse", parse, parse_workers if parse_fn else 1, queue_size, many=True),
+            Stage("dedupe", dedupe, 1, queue_size, ordered=True),
+            Stage("embed", embed, embed_workers, queue_size),
+            Stage("upsert", upsert, upsert_workers, queue_size),
+        ], every).run(source)
+        if sync:
+            for stale in keys.stale_ids():
+                _delete(table, stale, client, upsert_workers)
+                stats["deleted"] += len(stale)
+    finally:
+        if log:
+            log.close()
+        if keys is not None:
+            keys.close()
+
+    reused = stats["rows"] - stats["near_dups"] - stats["unchanged"] - stats["embedded"]
+    print(f"🔁 {table}: {stats['rows']} rows, {stats['near_dups']} near-duplicates, "
+          f"{stats['unchanged']} unchanged, {stats['embedded']} embedded, "
+          f"{reused} reused vectors, {stats['written']} written, {stats['deleted']} deleted")
+    return stats
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--bible", help="JSONL de versículos (parse_bible)")
+    ap.add_argument("--refs", help="JSONL de referencias (parse_refs)")
+    ap.add_argument("--refs_root", help="Carpeta de .txt: se parsean en el pipeline, sin JSONL intermedio")
+    ap.add_argument("--batch_size", type=int, default=UPSERT_BATCH)
+    ap.add_argument("--parse_workers", type=int, default=PARSE_WORKERS)
+    ap.add_argument("--embed_workers", type=int, default=EMBED_WORKERS)
+    ap.add_argument("--upsert_workers", type=int, default=UPSERT_WORKERS)
+    ap.add_argument("--queue_size", type=int, default=None, help="Lotes en cola por etapa (por defecto 2x workers)")
+    ap.add_argument("--sync", action="store_true",
+                    help="Escribir/borrar solo las filas cuyo content_hash difiere del remoto")
+    ap.add_argument("--dup_threshold", type=float, default=DUP_THRESHOLD,
+                    help="Con --refs_root: Jaccard a partir del cual una referencia es casi duplicada (0 desactiva)")
+    ap.add_argument("--dup_log", default="./data/_refs.dups.jsonl", help="JSONL de back-references")
+    ap.add_argument("--verse_index", default=cfg.verse_index,
+                    help="Con --refs_root: prefijo del índice versículo → fragmento (vacío desactiva)")
+    args = ap.parse_args()
+    opts = dict(batch_size=args.batch_size, parse_workers=args.parse_workers, embed_workers=args.embed_workers,
+                upsert_workers=args.upsert_workers, queue_size=args.queue_size, sync=args.sync)
+    if args.bible:
+        ingest("bible_verses", iter_jsonl(args.bible), **opts)
+    if args.refs_root:
+        # El JSONL de --refs ya viene filtrado por parse_refs; aquí se filtra al parsear
+        near_dup = NearDupIndex(args.dup_threshold) if args.dup_threshold > 0 else None
+        verses = VerseIndexWriter(args.verse_index) if args.verse_index else None
+        try:
+            ingest("bible_refs", list_files(args.refs_root), parse_fn=parse_file,
+                   near_dup=near_dup, dup_log=args.dup_log, verses=verses, **opts)
+        finally:
+            if near_dup is not None:
+                near_dup.close()
+        # Solo tras una ingesta completa: un índice a medias apuntaría a fragmentos que no se subieron
+        if verses is not None:
+            verses.close()
+    elif args.refs:
+        ingest("bible_refs", iter_jsonl(args.refs), **opts)
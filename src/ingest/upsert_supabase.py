@@ -1,32 +1,158 @@
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 from ..utils.io_utils import read_jsonl
-from ..utils.emb import embed
+from ..utils.emb import embed_batch
+from ..utils.progress import Progress
+from ..utils.retry import retry_call
+from ..utils.supa import get_client
 from ..utils import io_utils
 from ..config import cfg
-from supabase import create_client
+from .dedup import embed_deduped, text_key
 
-sb = create_client(cfg.supabase_url, cfg.supabase_service)
+UPSERT_BATCH = 250      # filas por request (~7 MB de JSON con vectores de 1536 dims)
+EMBED_BATCH = 256       # textos por llamada a embeddings
+FETCH_PAGE = 1000       # filas por página al leer hashes remotos
+DELETE_BATCH = 500      # ids por request de borrado
+CONCURRENCY = 4         # requests en vuelo como máximo
+ATTEMPTS = 5
 
-def upsert_bible(rows):
+# Clave natural y columna de texto de cada tabla
+TABLES = {
+    "bible_verses": {"key": ("book", "chapter", "verse"), "text": "text"},
+    "bible_refs": {"key": ("work", "ref_key", "seq"), "text": "content"},
+}
+
+def _batches(items, size):
+    return [items[i:i+size] for i in range(0, len(items), size)]
+
+def _run_batches(batches, fn, label, unit, concurrency=CONCURRENCY):
+    """Ejecuta fn sobre cada lote con a lo sumo `concurrency` en vuelo y reintentos."""
+    progress = Progress(sum(len(b) for b in batches), label, unit=unit)
+
+    def work(i, batch):
+        out = retry_call(fn, batch, attempts=ATTEMPTS,
+                         on_retry=lambda n, e: print(f"⚠️ {label} batch {i} retry {n}: {e}"))
+        progress.update(len(batch))
+        return out
+
+    with ThreadPoolExecutor(max_workers=concurrency) as ex:
+        futures = [ex.submit(work, i, b) for i, b in enumerate(batches)]
+        results, failed = [], []
+        for i, f in enumerate(futures):
+            try:
+                results.append(f.result())
+            except Exception as e:
+                print(f"❌ {label} batch {i} failed after {ATTEMPTS} attempts: {e}")
+                results.append(None)
+                failed.append(i)
+    progress.close()
+    if failed:
+        raise RuntimeError(f"{label}: {len(failed)}/{len(batches)} batches failed: {failed}")
+    return results
+
+def embed_many(texts, batch_size=EMBED_BATCH, concurrency=CONCURRENCY, embed_fn=None):
+    embed_fn = embed_fn or embed_batch
+    out = _run_batches(_batches(texts, batch_size), embed_fn, "embed", "texts", concurrency)
+    return [v for vecs in out for v in vecs]
+
+def _write(table, records, on_conflict, client=None, batch_size=UPSERT_BATCH, concurrency=CONCURRENCY):
+    client = client or get_client()
+
+    def send(batch):
+        client.table(table).upsert(batch, on_conflict=on_conflict).execute()
+
+    _run_batches(_batches(records, batch_size), send, table, "rows", concurrency)
+
+def _delete(table, ids, client=None, concurrency=CONCURRENCY):
+    client = client or get_client()
+
+    def send(batch):
+        client.table(table).delete().in_("id", batch).execute()
+
+    _run_batches(_batches(ids, DELETE_BATCH), send, f"{table} delete", "rows", concurrency)
+
+def iter_remote_hashes(table, client=None, page_size=FETCH_PAGE):
+    """Genera páginas [(clave natural, id, content_hash)] de la tabla, paginando por id (keyset)."""
+    client = client or get_client()
+    key = TABLES[table]["key"]
+    cols = ",".join(("id",) + key + ("content_hash",))
+    last_id = 0
+    while True:
+        res = retry_call(lambda: client.table(table).select(cols)
+                         .gt("id", last_id).order("id").limit(page_size).execute(),
+                         attempts=ATTEMPTS)
+        yield [(tuple(r[c] for c in key), r["id"], r.get("content_hash")) for r in res.data]
+        if len(res.data) < page_size:
+            return
+        last_id = res.data[-1]["id"]
+
+def fetch_remote_hashes(table, client=None, page_size=FETCH_PAGE):
+    """Lee {clave natural: (id, content_hash)} de la tabla, paginando por id (keyset)."""
+    return {k: (rid, h) for page in iter_remote_hashes(table, client, page_size) for k, rid, h in page}
+
+def diff_rows(table, rows, remote):
+    """Devuelve (filas nuevas o cambiadas, ids remotos a borrar)."""
+    spec = TABLES[table]
+    changed, seen = [], set()
     for r in rows:
-        e = embed(r["text"])
-        sb.table("bible_verses").upsert({
-            "book": r["book"], "chapter": r["chapter"], "verse": r["verse"],
-            "text": r["text"], "embedding": e
-        }).execute()
+        k = tuple(r[c] for c in spec["key"])
+        seen.add(k)
+        current = remote.get(k)
+        if current is None or current[1] != r["content_hash"]:
+            changed.append(r)
+    stale = [rid for k, (rid, _) in remote.items() if k not in seen]
+    return changed, stale
+
+def _sync_table(table, rows, client=None, embed_fn=None, batch_size=UPSERT_BATCH,
+                concurrency=CONCURRENCY, sync=False):
+    spec = TABLES[table]
+    for r in rows:
+        r["content_hash"] = text_key(r[spec["text"]])
+
+    stale = []
+    if sync:
+        remote = fetch_remote_hashes(table, client)
+        total = len(rows)
+        rows, stale = diff_rows(table, rows, remote)
+        print(f"🔄 Sync {table}: {total} local / {len(remote)} remote → "
+              f"{len(rows)} to write, {total - len(rows)} unchanged, {len(stale)} to delete")
+
+    if rows:
+        vecs = embed_deduped([r[spec["text"]] for r in rows],
+                             lambda ts: embed_many(ts, concurrency=concurrency, embed_fn=embed_fn),
+                             label=table)
+        for r, e in zip(rows, vecs):
+            r["embedding"] = e
+        _write(table, rows, ",".join(spec["key"]), client, batch_size, concurrency)
+    if stale:
+        _delete(table, stale, client, concurrency)
+
+def upsert_bible(rows, client=None, embed_fn=None, batch_size=UPSERT_BATCH, concurrency=CONCURRENCY, sync=False):
+    records = [{
+        "book": r["book"], "chapter": r["chapter"], "verse": r["verse"], "text": r["text"]
+    } for r in rows]
+    _sync_table("bible_verses", records, client, embed_fn, batch_size, concurrency, sync)
 
-def upsert_refs(rows):
+def upsert_refs(rows, client=None, embed_fn=None, batch_size=UPSERT_BATCH, concurrency=CONCURRENCY, sync=False):
+    # JSONL antiguos no traen "seq": numerar los fragmentos de cada ref_key en orden
+    counters = {}
+    records = []
     for r in rows:
-        e = embed(r["content"])
-        sb.table("bible_refs").insert({
-            "work": r["work"], "ref_key": r["ref_key"],
-            "content": r["content"], "embedding": e
-        }).execute()
+        k = (r["work"], r["ref_key"])
+        seq = r.get("seq", counters.get(k, 0))
+        counters[k] = seq + 1
+        records.append({"work": r["work"], "ref_key": r["ref_key"], "seq": seq, "content": r["content"]})
+    _sync_table("bible_refs", records, client, embed_fn, batch_size, concurrency, sync)
 
 if __name__ == "__main__":
     ap = argparse.ArgumentParser()
     ap.add_argument("--bible", required=True)
     ap.add_argument("--refs", required=True)
+    ap.add_argument("--batch_size", type=int, default=UPSERT_BATCH)
+    ap.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    ap.add_argument("--sync", action="store_true",
+                    help="Escribir/borrar solo las filas cuyo content_hash difiere del remoto")
     args = ap.parse_args()
-    upsert_bible(read_jsonl(args.bible))
-    upsert_refs(read_jsonl(args.refs))
\ No newline at end of file
+    opts = dict(batch_size=args.batch_size, concurrency=args.concurrency, sync=args.sync)
+    upsert_bible(read_jsonl(args.bible), **opts)
+    upsert_refs(read_jsonl(args.refs), **opts)
\ No newline at end of file
@@ -0,0 +1,192 @@
+"""
+Checkpoint archives.
+
+A training output directory holds the final adapter next to every
+intermediate ``checkpoint-*`` folder with its optimizer state, which is most
+of its size and useless for inference. Archives are written as a tar stream:
+
+- contents: "adapter" (default) keeps only the top-level files (adapter
+  weights and config, tokenizer, training_info.json) without optimizer,
+  scheduler or RNG state; "full" keeps the whole tree (needed to resume)
+- codec: zstd with all cores (``zstandard``, optional) or gzip as fallback
+- the tar stream is compressed into a pipe read directly by the uploader,
+  so no archive file is ever written to local disk
+"""
+
+import fnmatch
+import gzip
+import os
+import tarfile
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:  # dependencia opcional
+    zstandard = None
+
+CONTENTS = ("adapter", "full")
+CODECS = ("zstd", "gzip")
+LEVELS = {"zstd": 3, "gzip": 6}
+SUFFIXES = {"zstd": ".tar.zst", "gzip": ".tar.gz"}
+PIPE_BUFFER = 1024 * 1024
+
+# Estado de entrenamiento: necesario para reanudar, no para usar el adapter
+TRAINING_STATE = ("optimizer.pt", "scheduler.pt", "rng_state*.pth", "scaler.pt", "*.tar.gz", "*.tar.zst")
+
+def default_codec() -> str:
+    """zstd when the zstandard package is installed, otherwise gzip."""
+    return "zstd" if zstandard is not None else "gzip"
+
+def archive_members(src: str, contents: str = "adapter") -> List[Tuple[str, str]]:
+    """
+    Files to archive as (path, name in the archive), names prefixed by the directory name.
+
+    Args:
+        src: Output or checkpoint directory
+        contents: "adapter" (top-level files without training state) or "full" (whole tree)
+    """
+    if contents not in CONTENTS:
+        raise ValueError(f"Unknown archive contents: {contents} (expected one of {CONTENTS})")
+    root = os.path.basename(os.path.normpath(src))
+    members = []
+    if contents == "full":
+        for dirpath, dirnames, filenames in os.walk(src):
+            dirnames.sort()
+            for name in sorted(filenames):
+                path = os.path.join(dirpath, name)
+                members.append((path, os.path.join(root, os.path.relpath(path, src))))
+        return members
+    for name in sorted(os.listdir(src)):
+        path = os.path.join(src, name)
+        if os.path.isfile(path) and not any(fnmatch.fnmatch(name, pat) for pat in TRAINING_STATE):
+            members.append((path, os.path.join(root, name)))
+    return members
+
+def _compressor(fileobj, codec: str, level: int, threads: int):
+    if codec == "zstd":
+        if zstandard is None:
+            raise ImportError("zstd compression needs the zstandard package (pip install zstandard)")
+        # threads=-1: todos los núcleos
+        cctx = zstandard.ZstdCompressor(level=level, threads=threads)
+        return cctx.stream_writer(fileobj, closefd=False)
+    if codec == "gzip":
+        return gzip.GzipFile(fileobj=fileobj, mode="wb", compresslevel=level, mtime=0)
+    raise ValueError(f"Unknown codec: {codec} (expected one of {CODECS})")
+
+def write_archive(src: str, fileobj, contents: str = "adapter", codec: Optional[str] = None,
+                  level: Optional[int] = None, threads: int = -1) -> Dict:
+    """
+    Write a compressed tar of a directory to a binary file object.
+
+    Args:
+        src: Directory to archive
+        fileobj: Writable binary file object (a file, a pipe...)
+        contents: "adapter" or "full" (see archive_members)
+        codec: "zstd" or "gzip" (defaults to default_codec())
+        level: Compression level (defaults to LEVELS[codec])
+        threads: zstd worker threads (-1: all cores, 0: single-threaded)
+
+    Returns:
+        {"files", "bytes"} of uncompressed input
+    """
+    codec = codec or default_codec()
+    level = LEVELS[codec] if level is None else level
+    members = archive_members(src, contents)
+    comp = _compressor(fileobj, codec, level, threads)
+    try:
+        with tarfile.open(fileobj=comp, mode="w|") as tar:
+            for path, name in members:
+                tar.add(path, arcname=name, recursive=False)
+    finally:
+        comp.close()
+    return {"files": len(members), "bytes": sum(os.path.getsize(p) for p, _ in members)}
+
+def archive_filename(src: str, codec: Optional[str] = None, stem: Optional[str] = None) -> str:
+    """Archive name for a directory: <stem or directory name><.tar.zst | .tar.gz>."""
+    stem = stem or os.path.basename(os.path.normpath(src))
+    return stem + SUFFIXES[codec or default_codec()]
+
+def zip_dir(src, out_path, contents="full", codec="gzip", level=None):
+    """Archive a directory into a local file (gzip and full contents by default, like before)."""
+    with open(out_path, "wb") as f:
+        return write_archive(src, f, contents, codec, level)
+
+class _ProducerPipe:
+    """Read end of the archive pipe; at end of file, fails if the producer failed."""
+
+    def __init__(self, f, thread: threading.Thread, outcome: Dict):
+        self.f = f
+        self.thread = thread
+        self.outcome = outcome
+
+    def read(self, n: int = -1) -> bytes:
+        data = self.f.read(n)
+        if not data:
+            # Sin esto un archivo truncado se subiría y registraría como válido
+            self.thread.join()
+            if "error" in self.outcome:
+                raise IOError(f"archiving failed: {self.outcome['error']}")
+        return data
+
+def upload_archive(src: str, prefix: str, contents: str = "adapter", codec: Optional[str] = None,
+                   level: Optional[int] = None, stem: Optional[str] = None, bucket=None,
+                   step: int = None, metrics: dict = None) -> Dict:
+    """
+    Archive a directory and upload it while it is being compressed (no temporary file).
+
+    A thread writes the compressed tar into a pipe; the uploader reads the
+    other end in parts, so compression and network transfer overlap.
+
+    Args:
+        src: Directory to archive
+        prefix: Run folder in the bucket (e.g. "<run_name>/")
+        contents: "adapter" or "full"
+        codec: "zstd" or "gzip" (defaults to default_codec())
+        level: Compression level
+        stem: Archive name without suffix (defaults to the directory name)
+        bucket: Bucket name or Storage (defaults to cfg.bucket_ckpt)
+        step: Global step of the checkpoint
+        metrics: Metrics to record in the index
+
+    Returns:
+        Result dictionary like upload_ckpt, plus the archive stats and timing
+    """
+    from ..utils.supa import upload_ckpt_stream
+
+    codec = codec or default_codec()
+    filename = archive_filename(src, codec, stem)
+    r, w = os.pipe()
+    reader = os.fdopen(r, "rb", buffering=PIPE_BUFFER)
+    writer = os.fdopen(w, "wb", buffering=PIPE_BUFFER)
+    outcome = {}
+
+    def produce():
+        try:
+            outcome["stats"] = write_archive(src, writer, contents, codec, level)
+        except BaseException as e:
+            outcome["error"] = e
+        finally:
+            # Cerrar el extremo de escritura: el lector ve fin de archivo
+            writer.close()
+
+    t0 = time.perf_counter()
+    print(f"🗜️ Archiving {src} ({contents}, {codec}) → {filename}")
+    thread = threading.Thread(target=produce, name="archive", daemon=True)
+    thread.start()
+    try:
+        result = upload_ckpt_stream(_ProducerPipe(reader, thread, outcome), filename, prefix=prefix,
+                                    bucket=bucket, step=step, metrics=metrics)
+    finally:
+        # Si la subida falló, vaciar el pipe para que el compresor termine
+        while reader.read(PIPE_BUFFER):
+            pass
+        reader.close()
+        thread.join()
+    seconds = time.perf_counter() - t0
+    stats = outcome.get("stats")
+    if result.get("success"):
+        print(f"   {stats['files']} files, {stats['bytes'] / (1024*1024):.2f} MB → "
+              f"{result['file_size'] / (1024*1024):.2f} MB in {seconds:.1f}s")
+    return dict(result, archive=stats, seconds=seconds, contents=contents, codec=codec)
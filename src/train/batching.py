@@ -0,0 +1,144 @@
+"""
+Length-grouped batching for unpacked causal-LM fine-tuning.
+
+With random batches every row is padded to the longest one that happened to
+land in the same batch, so with a long-tailed length distribution most of the
+batch is padding. The batch sampler here shuffles the dataset, cuts it into
+megabatches of ``megabatch_mult`` batches, sorts each megabatch by length and
+slices it into batches, then shuffles the batch order: rows in a batch have
+similar lengths, while which rows meet and the order batches are seen in stay
+random from epoch to epoch. The collator pads each batch only to its own
+longest row.
+"""
+
+from typing import Any, Dict, Iterator, List, Sequence
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+from transformers import Trainer
+
+from .packing import IGNORE_INDEX
+
+MEGABATCH_MULT = 50      # batches por megabatch (el de LengthGroupedSampler de transformers)
+PAD_MULTIPLE = 8         # ancho múltiplo de 8: mejor uso de tensor cores
+
+class LengthGroupedBatchSampler:
+    """Megabatch-shuffled batch sampler that groups rows of similar length."""
+
+    def __init__(self, lengths: Sequence[int], batch_size: int, megabatch_mult: int = MEGABATCH_MULT,
+                 seed: int = 42, drop_last: bool = False):
+        """
+        Initialize the sampler.
+
+        Args:
+            lengths: Token count of every row, in dataset order
+            batch_size: Rows per batch
+            megabatch_mult: Batches per megabatch (larger: less padding, less randomness)
+            seed: Base seed; each epoch shuffles with (seed, epoch)
+            drop_last: Drop the final incomplete batch
+        """
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        self.batch_size = batch_size
+        self.megabatch_mult = megabatch_mult
+        self.seed = seed
+        self.drop_last = drop_last
+        self.epoch = 0
+
+    def set_epoch(self, epoch: int) -> None:
+        # Trainer/accelerate lo llaman al inicio de cada época: mismo orden al reanudar
+        self.epoch = epoch
+
+    def batches(self, epoch: int = None) -> List[List[int]]:
+        """Row indices of every batch of an epoch (the current one by default), in order."""
+        rng = np.random.default_rng((self.seed, self.epoch if epoch is None else epoch))
+        order = rng.permutation(len(self.lengths))
+        mega = self.batch_size * self.megabatch_mult
+        batches = []
+        for i in range(0, len(order), mega):
+            chunk = order[i:i + mega]
+            chunk = chunk[np.argsort(-self.lengths[chunk], kind="stable")]
+            batches += [chunk[j:j + self.batch_size].tolist() for j in range(0, len(chunk), self.batch_size)]
+        # Solo el último megabatch puede dejar un batch incompleto
+        if self.drop_last and batches and len(batches[-1]) < self.batch_size:
+            batches.pop()
+        if not batches:
+            return batches
+        batches = [batches[k] for k in rng.permutation(len(batches))]
+        # El batch más largo primero: un OOM aparece en el primer paso, no a mitad de época
+        longest = max(range(len(batches)), key=lambda k: self.lengths[batches[k][0]])
+        batches[0], batches[longest] = batches[longest], batches[0]
+        return batches
+
+    def padding_ratio(self) -> float:
+        """Share of pad tokens in this epoch's batches when each is padded to its longest row."""
+        real = padded = 0
+        for b in self.batches():
+            lens = self.lengths[b]
+            real += int(lens.sum())
+            padded += int(lens.max()) * len(b)
+        return 1 - real / padded if padded else 0.0
+
+    def __iter__(self) -> Iterator[List[int]]:
+        return iter(self.batches())
+
+    def __len__(self) -> int:
+        n = len(self.lengths) // self.batch_size
+        return n if self.drop_last or len(self.lengths) % self.batch_size == 0 else n + 1
+
+class DynamicPaddingCollator:
+    """Right-pads a batch to its longest row; padding gets attention 0 and label -100."""
+
+    def __init__(self, pad_id: int, pad_to_multiple_of: int = PAD_MULTIPLE):
+        """
+        Initialize the collator.
+
+        Args:
+            pad_id: Token used for padding
+            pad_to_multiple_of: Round the batch width up to a multiple of this (1 to disable)
+        """
+        self.pad_id = pad_id
+        self.pad_to_multiple_of = max(1, pad_to_multiple_of)
+
+    def __call__(self, features: Sequence[Dict[str, Any]]) -> Dict[str, torch.Tensor]:
+        width = max(len(f["input_ids"]) for f in features)
+        width = -(-width // self.pad_to_multiple_of) * self.pad_to_multiple_of
+        batch = {"input_ids": [], "attention_mask": [], "labels": []}
+        for f in features:
+            ids = list(f["input_ids"])
+            pad = width - len(ids)
+            # Sin columna labels, se entrena sobre los propios input_ids (solo el relleno queda fuera)
+            labels = list(f["labels"]) if f.get("labels") is not None else ids
+            batch["input_ids"].append(ids + [self.pad_id] * pad)
+            batch["attention_mask"].append(list(f.get("attention_mask") or [1] * len(ids)) + [0] * pad)
+            batch["labels"].append(labels + [IGNORE_INDEX] * pad)
+        return {k: torch.tensor(v, dtype=torch.long) for k, v in batch.items()}
+
+def row_lengths(dataset) -> List[int]:
+    """Token count of every row of a tokenized dataset."""
+    return [len(x) for x in dataset["input_ids"]]
+
+class LengthGroupedTrainer(Trainer):
+    """Trainer whose training batches come from a LengthGroupedBatchSampler."""
+
+    def __init__(self, *args, megabatch_mult: int = MEGABATCH_MULT, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.megabatch_mult = megabatch_mult
+
+    def get_train_dataloader(self) -> DataLoader:
+        if self.train_dataset is None:
+            raise ValueError("Trainer: training requires a train_dataset.")
+        dataset = self.train_dataset
+        sampler = LengthGroupedBatchSampler(row_lengths(dataset), self._train_batch_size, self.megabatch_mult,
+                                            seed=self.args.seed, drop_last=self.args.dataloader_drop_last)
+        if self.args.remove_unused_columns and hasattr(dataset, "column_names"):
+            dataset = self._remove_unused_columns(dataset, description="training")
+        loader = DataLoader(
+            dataset,
+            batch_sampler=sampler,
+            collate_fn=self.data_collator,
+            num_workers=self.args.dataloader_num_workers,
+            pin_memory=self.args.dataloader_pin_memory,
+            persistent_workers=self.args.dataloader_persistent_workers and self.args.dataloader_num_workers > 0,
+        )
+        return self.accelerator.prepare(loader)
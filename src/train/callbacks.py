@@ -0,0 +1,334 @@
+"""
+Trainer callbacks.
+
+ThroughputCallback records per-step performance to ``metrics.jsonl`` in the
+output directory and keeps a summary for ``training_info.json``.
+
+RunMarkerCallback writes the run name into every saved checkpoint so that
+auto-resume never picks up another run's checkpoint from a shared output
+directory.
+
+CheckpointUploadCallback backs every checkpoint up to storage while training
+continues. On each save the new ``checkpoint-<step>`` directory is snapshotted
+with hard links (instant, no extra disk, and unaffected when the Trainer later
+rotates the checkpoint away) and queued; a background thread uploads the
+snapshots one at a time. The queue is bounded: when uploads fall behind, the
+oldest pending snapshot is dropped in favour of the newer one instead of
+blocking the training loop. At the end of training (or at interpreter exit)
+the queue is drained.
+"""
+
+import atexit
+import json
+import os
+import queue
+import resource
+import shutil
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+import torch
+from transformers import TrainerCallback
+
+from ..utils.supa import upload_ckpt_dir
+from .archive import upload_archive
+from .packing import IGNORE_INDEX
+from .resume import write_run_marker
+
+METRICS_FILE = "metrics.jsonl"
+UPLOAD_QUEUE = 2          # snapshots esperando subida como máximo
+STAGING = ".upload"       # subdirectorio de output_dir con los snapshots pendientes
+
+def snapshot_dir(src: str, dst: str) -> str:
+    """Copy a directory tree as hard links (plain copies where linking is not possible)."""
+    def link(s, d):
+        try:
+            os.link(s, d)
+        except OSError:
+            shutil.copy2(s, d)
+    shutil.rmtree(dst, ignore_errors=True)
+    shutil.copytree(src, dst, copy_function=link)
+    return dst
+
+def last_metrics(state) -> Dict:
+    """Latest logged training metrics (loss, learning rate...) of a TrainerState."""
+    last_log = next((h for h in reversed(state.log_history) if "loss" in h), {})
+    return {k: v for k, v in last_log.items() if k != "step"}
+
+def rss_mb() -> Dict[str, float]:
+    """Current and peak resident memory of this process, in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024   # KB en Linux
+    try:
+        with open("/proc/self/statm") as f:
+            current = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        current = peak
+    return {"rss_mb": round(current, 1), "peak_rss_mb": round(peak, 1)}
+
+class ThroughputCallback(TrainerCallback):
+    """
+    Per-step wall time, data-loader wait, tokens/s, padding and memory, written to metrics.jsonl.
+
+    Timing: the Trainer fetches the batches of an optimizer step between
+    on_step_end of the previous step (or the end of its logging/saving) and
+    on_step_begin, so that gap is the data-loader wait; step time runs from
+    on_step_begin to on_step_end. Tokens are counted by a forward pre-hook on
+    the model (main process, so DataLoader workers do not matter): "tokens"
+    are the supervised ones (label != -100), "padded" every position of the
+    batch tensors. They are read once per optimizer step, which also syncs
+    the device so step times are real.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Initialize the callback.
+
+        Args:
+            path: JSONL file (defaults to <output_dir>/metrics.jsonl)
+        """
+        self.path = path
+        self.summary: Dict = {}
+        self._f = None
+        self._hook = None
+
+    def _count(self, module, args, kwargs):
+        ids = kwargs.get("input_ids", args[0] if args else None)
+        labels = kwargs.get("labels")
+        if ids is None or not torch.is_grad_enabled():
+            return
+        self._padded += ids.numel()
+        real = (labels != IGNORE_INDEX).sum() if labels is not None else ids.numel()
+        self._tokens = self._tokens + real
+
+    def on_train_begin(self, args, state, control, model=None, **kwargs):
+        if not state.is_world_process_zero:
+            return
+        path = self.path or os.path.join(args.output_dir, METRICS_FILE)
+        # Al reanudar se agregan líneas al archivo existente
+        self._f = open(path, "a", encoding="utf-8")
+        self._tokens, self._padded = 0, 0
+        self._rows: List[Dict] = []
+        if model is not None:
+            self._hook = model.register_forward_pre_hook(self._count, with_kwargs=True)
+        if torch.cuda.is_available():
+            torch.cuda.reset_peak_memory_stats()
+        self._ready = self._begin = time.perf_counter()
+
+    def _mark_ready(self):
+        # Fin de todo lo que no es cargar datos (paso, log, guardado): desde aquí se espera al DataLoader
+        self._ready = time.perf_counter()
+
+    def on_step_begin(self, args, state, control, **kwargs):
+        if self._f is None:
+            return
+        self._begin = time.perf_counter()
+        self._wait = self._begin - self._ready
+
+    def on_step_end(self, args, state, control, **kwargs):
+        if self._f is None:
+            return
+        tokens = int(self._tokens)   # sincroniza el dispositivo
+        now = time.perf_counter()
+        step_time = now - self._begin
+        row = {
+            "step": state.global_step,
+            "epoch": round(state.epoch or 0.0, 4),
+            "step_time": round(step_time, 4),
+            "data_wait": round(self._wait, 4),
+            "tokens": tokens,
+            "padded_tokens": self._padded,
+            "tokens_per_second": round(tokens / (step_time + self._wait), 1) if step_time + self._wait > 0 else None,
+            "padding_ratio": round(1 - tokens / self._padded, 4) if self._padded else None,
+            **rss_mb(),
+        }
+        if torch.cuda.is_available():
+            row["cuda_peak_mb"] = round(torch.cuda.max_memory_allocated() / 2**20, 1)
+        self._f.write(json.dumps(row) + "\n")
+        self._f.flush()
+        self._rows.append(row)
+        self._tokens, self._padded = 0, 0
+        self._ready = time.perf_counter()
+
+    def on_log(self, args, state, control, **kwargs):
+        if self._f is not None:
+            self._mark_ready()
+
+    def on_save(self, args, state, control, **kwargs):
+        if self._f is not None:
+            self._mark_ready()
+
+    def on_evaluate(self, args, state, control, **kwargs):
+        if self._f is not None:
+            self._mark_ready()
+
+    def on_train_end(self, args, state, control, **kwargs):
+        if self._f is None:
+            return
+        self._f.close()
+        self._f = None
+        if self._hook is not None:
+            self._hook.remove()
+            self._hook = None
+        self.summary = summarize_metrics(self._rows)
+        s = self.summary
+        if s:
+            print(f"📊 Steps: {s['steps']}, {s['step_time_p50']:.3f}s median "
+                  f"(p90 {s['step_time_p90']:.3f}s), data wait {s['data_wait_share']:.1%}, "
+                  f"{s['tokens_per_second']:,.0f} tokens/s, padding {s['padding_ratio']:.1%}, "
+                  f"peak RSS {s['peak_rss_mb']:,.0f} MB"
+                  + (f", CUDA peak {s['cuda_peak_mb']:,.0f} MB" if "cuda_peak_mb" in s else ""))
+
+def summarize_metrics(rows: List[Dict]) -> Dict:
+    """
+    Run-level summary of ThroughputCallback rows.
+
+    The first step is reported apart and left out of the step-time
+    percentiles (it includes warm-up: allocations, kernel selection...).
+
+    Args:
+        rows: Rows as written to metrics.jsonl
+
+    Returns:
+        Summary dictionary (empty without rows)
+    """
+    if not rows:
+        return {}
+    times = np.array([r["step_time"] for r in rows])
+    waits = np.array([r["data_wait"] for r in rows])
+    tokens = sum(r["tokens"] for r in rows)
+    padded = sum(r["padded_tokens"] for r in rows)
+    steady = times[1:] if len(times) > 1 else times
+    total = float(times.sum() + waits.sum())
+    summary = {
+        "steps": len(rows),
+        "first_step_time": round(float(times[0]), 4),
+        "step_time_mean": round(float(steady.mean()), 4),
+        "step_time_p50": round(float(np.percentile(steady, 50)), 4),
+        "step_time_p90": round(float(np.percentile(steady, 90)), 4),
+        "data_wait_share": round(float(waits.sum()) / total, 4) if total else 0.0,
+        "tokens": tokens,
+        "tokens_per_second": round(tokens / total, 1) if total else None,
+        "padding_ratio": round(1 - tokens / padded, 4) if padded else None,
+        "peak_rss_mb": max(r["peak_rss_mb"] for r in rows),
+    }
+    if "cuda_peak_mb" in rows[-1]:
+        summary["cuda_peak_mb"] = max(r.get("cuda_peak_mb", 0) for r in rows)
+    return summary
+
+class RunMarkerCallback(TrainerCallback):
+    """Marks each saved checkpoint with the run that saved it (see resume.checkpoint_run)."""
+
+    def __init__(self, run_name: str):
+        self.run_name = run_name
+
+    def on_save(self, args, state, control, **kwargs):
+        if not state.is_world_process_zero:
+            return
+        path = os.path.join(args.output_dir, f"checkpoint-{state.global_step}")
+        if os.path.isdir(path):
+            write_run_marker(path, self.run_name)
+
+class CheckpointUploadCallback(TrainerCallback):
+    """Uploads each saved checkpoint from a background thread."""
+
+    def __init__(self, prefix: str, ckpt_format: str = "chunks", bucket=None, queue_size: int = UPLOAD_QUEUE,
+                 codec: Optional[str] = None, level: Optional[int] = None):
+        """
+        Initialize the callback.
+
+        Args:
+            prefix: Run folder in the bucket (e.g. "<run_name>/")
+            ckpt_format: "chunks" (deduplicated snapshot) or "tar" (compressed archive)
+            bucket: Bucket name or Storage (defaults to cfg.bucket_ckpt)
+            queue_size: Snapshots allowed to wait for upload
+            codec: Archive codec with "tar" (see archive.upload_archive)
+            level: Compression level with "tar"
+        """
+        self.prefix = prefix
+        self.ckpt_format = ckpt_format
+        self.bucket = bucket
+        self.codec = codec
+        self.level = level
+        self.queue: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=max(1, queue_size))
+        self.results: List[Dict] = []
+        self.skipped: List[int] = []
+        self._thread = None
+        self._staging = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._worker, name="ckpt-upload", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def _upload(self, step: int, path: str, metrics: Dict) -> Dict:
+        if self.ckpt_format == "chunks":
+            return upload_ckpt_dir(path, prefix=self.prefix, bucket=self.bucket, step=step, metrics=metrics)
+        # Checkpoint intermedio completo (con estado del optimizador) para poder reanudar
+        return upload_archive(path, self.prefix, contents="full", codec=self.codec, level=self.level,
+                              bucket=self.bucket, step=step, metrics=metrics)
+
+    def _worker(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            step, path, metrics = item
+            t0 = time.perf_counter()
+            try:
+                result = self._upload(step, path, metrics)
+            except Exception as e:
+                result = {"success": False, "error": str(e)}
+            finally:
+                shutil.rmtree(path, ignore_errors=True)
+            result = dict(result, step=step, seconds=time.perf_counter() - t0)
+            self.results.append(result)
+            if result.get("success"):
+                print(f"☁️ Checkpoint {step} backed up in background ({result['seconds']:.1f}s)")
+            else:
+                print(f"⚠️ Background upload of checkpoint {step} failed: {result.get('error')}")
+
+    def on_save(self, args, state, control, **kwargs):
+        if not state.is_world_process_zero:
+            return
+        step = state.global_step
+        src = os.path.join(args.output_dir, f"checkpoint-{step}")
+        if not os.path.isdir(src):
+            return
+        with self._lock:
+            self._start()
+            self._staging = os.path.join(args.output_dir, STAGING)
+            path = snapshot_dir(src, os.path.join(self._staging, f"checkpoint-{step}"))
+            while True:
+                try:
+                    self.queue.put_nowait((step, path, last_metrics(state)))
+                    break
+                except queue.Full:
+                    # La subida va atrasada: el checkpoint más nuevo reemplaza al más viejo pendiente
+                    try:
+                        old_step, old_path, _ = self.queue.get_nowait()
+                    except queue.Empty:
+                        continue
+                    shutil.rmtree(old_path, ignore_errors=True)
+                    self.skipped.append(old_step)
+                    print(f"⏭️ Upload of checkpoint {old_step} skipped: superseded by checkpoint {step}")
+
+    def on_train_end(self, args, state, control, **kwargs):
+        self.close()
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Wait for the pending uploads to finish and stop the background thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        pending = self.queue.qsize()
+        if pending:
+            print(f"⏳ Waiting for {pending} pending checkpoint upload(s)...")
+        self.queue.put(None)
+        thread.join(timeout)
+        if not thread.is_alive() and self._staging:
+            shutil.rmtree(self._staging, ignore_errors=True)
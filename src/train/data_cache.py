@@ -0,0 +1,144 @@
+"""
+On-disk cache of tokenized training datasets.
+
+Formatting and tokenizing the whole dataset with ``ds.map`` is repeated on
+every launch, although it only depends on the data file, the prompt template,
+the tokenizer and ``max_seq_len``. The tokenized dataset is saved as Arrow
+files (``save_to_disk``) under a key hashing all of those, and later runs
+memory-map it back with ``load_from_disk`` instead of rebuilding it.
+
+The key covers:
+- the data file's content (sha256)
+- the tokenizer: its serialized vocabulary/merges, special tokens and class,
+  plus the transformers version
+- the formatter: its qualified name, its module's FORMAT_VERSION and its source
+- max_seq_len and any extra options that change the rows (e.g. labels)
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import sys
+import time
+from typing import Any, Callable, Optional
+
+from ..config import cfg
+
+COMPLETE = "_COMPLETE"   # marcador: el guardado terminó
+
+def file_hash(path: str, block: int = 1 << 20) -> str:
+    """sha256 of a file's content, read in blocks."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for data in iter(lambda: f.read(block), b""):
+            h.update(data)
+    return h.hexdigest()
+
+def tokenizer_fingerprint(tok) -> str:
+    """Hash of everything that changes how a tokenizer encodes text."""
+    import transformers
+    backend = getattr(tok, "backend_tokenizer", None)
+    if backend is not None:
+        spec = json.loads(backend.to_str())
+        # Truncado y relleno son estado de la última llamada (los fija tok(...)), no del tokenizer
+        spec.pop("truncation", None)
+        spec.pop("padding", None)
+        vocab = json.dumps(spec, sort_keys=True, ensure_ascii=False)
+    else:
+        vocab = json.dumps(sorted(tok.get_vocab().items()), ensure_ascii=False)
+    parts = {
+        "class": type(tok).__name__,
+        "vocab": hashlib.sha256(vocab.encode("utf-8")).hexdigest(),
+        # pad_token no cambia la codificación (los runners lo fijan a EOS si falta)
+        "special": {k: str(v) for k, v in tok.special_tokens_map.items() if k != "pad_token"},
+        "add_bos": getattr(tok, "add_bos_token", None),
+        "add_eos": getattr(tok, "add_eos_token", None),
+        "transformers": transformers.__version__,
+    }
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+def formatter_fingerprint(formatter: Callable) -> str:
+    """Hash of a formatter's name, its module's FORMAT_VERSION and its source code."""
+    module = sys.modules.get(formatter.__module__)
+    try:
+        source = inspect.getsource(formatter)
+    except (OSError, TypeError):
+        source = ""
+    parts = [f"{formatter.__module__}.{formatter.__qualname__}",
+             str(getattr(module, "FORMAT_VERSION", None)), source]
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+def dataset_key(data_path: str, tok, formatter: Callable, max_seq_len: int, **extra: Any) -> str:
+    """
+    Cache key of a tokenized dataset.
+
+    Args:
+        data_path: Source data file
+        tok: Tokenizer
+        formatter: Function turning a raw row into the training text
+        max_seq_len: Truncation length
+        **extra: Other options that change the tokenized rows
+
+    Returns:
+        Hex key (24 chars)
+    """
+    parts = {
+        "data": file_hash(data_path),
+        "tokenizer": tokenizer_fingerprint(tok),
+        "formatter": formatter_fingerprint(formatter),
+        "max_seq_len": max_seq_len,
+        "extra": extra,
+    }
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()[:24]
+
+def cached_dataset(key: str, build: Callable[[], Any], cache_dir: Optional[str] = None):
+    """
+    Load a tokenized dataset from the cache, or build and store it.
+
+    Args:
+        key: Key from dataset_key
+        build: Builds the datasets.Dataset on a cache miss
+        cache_dir: Cache root (defaults to cfg.dataset_cache; empty disables the cache)
+
+    Returns:
+        The dataset (memory-mapped from the cache when it is used)
+    """
+    from datasets import load_from_disk
+
+    cache_dir = cfg.dataset_cache if cache_dir is None else cache_dir
+    if not cache_dir:
+        return build()
+
+    path = os.path.join(cache_dir, key)
+    if os.path.exists(os.path.join(path, COMPLETE)):
+        t0 = time.time()
+        ds = load_from_disk(path)
+        print(f"⚡ Tokenized dataset loaded from cache: {path} ({len(ds)} rows, {time.time() - t0:.2f}s)")
+        return ds
+
+    t0 = time.time()
+    ds = build()
+    built = time.time() - t0
+    # Guardar en un directorio temporal y renombrar: un guardado a medias nunca se carga
+    tmp = f"{path}.partial-{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    ds.save_to_disk(tmp)
+    open(os.path.join(tmp, COMPLETE), "w").close()
+    try:
+        # Otro proceso pudo completar la misma clave mientras tanto: no pisar una copia que quizá ya lee
+        if os.path.exists(os.path.join(path, COMPLETE)):
+            raise FileExistsError(path)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp, path)
+    except OSError:
+        # Carrera entre rmtree y replace (ENOTEMPTY/EEXIST): vale la copia del ganador si está completa
+        shutil.rmtree(tmp, ignore_errors=True)
+        if not os.path.exists(os.path.join(path, COMPLETE)):
+            raise
+        print(f"⚡ Tokenized dataset cached concurrently by another process: {path}")
+        return load_from_disk(path)
+    print(f"💾 Tokenized dataset cached: {path} (built in {built:.1f}s)")
+    # Releer desde disco: memoria mapeada en vez de las tablas en RAM
+    return load_from_disk(path)
@@ -0,0 +1,155 @@
+"""
+Device-adaptive training settings.
+
+Training scripts used to assume a CUDA GPU (fp16 mixed precision, a float16
+model and ``device_map="auto"``), which fails or crawls on CPU-only workers.
+``training_device`` looks at the device from ``get_device`` and picks:
+
+- precision: fp16 on CUDA (as before); on CPU, bf16 autocast when the CPU
+  has native bf16 instructions (AVX512-BF16/AMX or Arm BF16) and fp32
+  otherwise, where emulated bf16 would be slower than fp32; fp32 on MPS
+- threads: the CPUs the container may actually use. Inside a container,
+  ``os.cpu_count()`` reports the host's cores, but the cgroup CPU quota
+  decides how many run at once; oversubscribed torch threads mostly wait
+- DataLoader workers: none on small CPU workers (collation is cheap and a
+  worker would take a core from the matmuls), one on larger ones, a few
+  with pinned memory on CUDA
+"""
+
+import math
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from ..utils.common import get_device
+
+PRECISIONS = ("auto", "bf16", "fp16", "fp32")
+CGROUP_ROOT = "/sys/fs/cgroup"
+MIN_CPUS_FOR_WORKER = 8    # en CPU, por debajo no se reserva un núcleo para el DataLoader
+MAX_CUDA_WORKERS = 4
+
+def cgroup_cpu_quota(root: str = CGROUP_ROOT) -> Optional[float]:
+    """
+    CPUs allowed by the cgroup CPU quota (cgroup v2 cpu.max or v1 cfs quota), None if unlimited.
+
+    Args:
+        root: cgroup filesystem mount point
+    """
+    try:
+        with open(os.path.join(root, "cpu.max")) as f:
+            quota, period = f.read().split()[:2]
+        return None if quota == "max" else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    for sub in ("cpu", "cpu,cpuacct"):
+        try:
+            with open(os.path.join(root, sub, "cpu.cfs_quota_us")) as f:
+                quota = int(f.read())
+            with open(os.path.join(root, sub, "cpu.cfs_period_us")) as f:
+                period = int(f.read())
+        except (OSError, ValueError):
+            continue
+        return None if quota <= 0 else quota / period
+    return None
+
+def available_cpus() -> int:
+    """CPUs this process can use: CPU affinity capped by the cgroup quota (rounded up)."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    quota = cgroup_cpu_quota()
+    if quota is not None:
+        cpus = min(cpus, math.ceil(quota))
+    return max(1, cpus)
+
+def cpu_has_bf16() -> bool:
+    """Whether the CPU computes bf16 natively (x86 AVX512-BF16/AMX-BF16, Arm BF16)."""
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = set(f.read().split())
+    except OSError:
+        return False
+    return bool(flags & {"avx512_bf16", "amx_bf16", "bf16"})
+
+@dataclass
+class TrainingDevice:
+    """Device, precision, CPU threads and DataLoader workers for a training run."""
+    device: str
+    precision: str
+    cpus: int
+    threads: int
+    workers: int
+
+    @property
+    def is_cuda(self) -> bool:
+        return self.device.startswith("cuda")
+
+    def model_dtype(self, cuda_dtype: Any = "auto") -> Any:
+        """dtype to load the base model with: cuda_dtype on CUDA, float32 elsewhere (autocast keeps fp32 weights)."""
+        import torch
+        return cuda_dtype if self.is_cuda else torch.float32
+
+    @property
+    def device_map(self) -> Optional[str]:
+        """device_map for from_pretrained: "auto" on CUDA, None (plain load, Trainer moves the model) otherwise."""
+        return "auto" if self.is_cuda else None
+
+    def training_args(self) -> Dict[str, Any]:
+        """TrainingArguments keyword arguments for this device."""
+        return {
+            "use_cpu": self.device == "cpu",
+            "bf16": self.precision == "bf16",
+            "fp16": self.precision == "fp16",
+            "dataloader_num_workers": self.workers,
+            "dataloader_pin_memory": self.is_cuda,
+            "dataloader_persistent_workers": self.workers > 0,
+        }
+
+    def apply(self) -> None:
+        """Set torch's intra-op and inter-op thread pools to the usable CPUs."""
+        import torch
+        torch.set_num_threads(self.threads)
+        try:
+            # Solo se puede fijar una vez y antes de cualquier trabajo en paralelo
+            torch.set_num_interop_threads(min(self.threads, 2))
+        except RuntimeError:
+            pass
+
+    def describe(self) -> str:
+        return (f"{self.device}, {self.precision}, {self.threads} threads of {self.cpus} CPUs, "
+                f"{self.workers} DataLoader workers")
+
+def training_device(precision: str = "auto", workers: Optional[int] = None,
+                    device: Optional[str] = None) -> TrainingDevice:
+    """
+    Pick training settings for the available device.
+
+    Args:
+        precision: "auto", "bf16", "fp16" or "fp32"
+        workers: DataLoader worker processes (None: chosen for the device)
+        device: Device string (defaults to get_device())
+
+    Returns:
+        TrainingDevice (call .apply() to set the thread pools)
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision: {precision} (expected one of {PRECISIONS})")
+    device = device or get_device()
+    cpus = available_cpus()
+    cuda = device.startswith("cuda")
+    if precision == "auto":
+        if cuda:
+            precision = "fp16"
+        elif device == "cpu" and cpu_has_bf16():
+            precision = "bf16"
+        else:
+            precision = "fp32"
+    if workers is None:
+        if cuda:
+            workers = min(MAX_CUDA_WORKERS, cpus // 2)
+        else:
+            workers = 1 if cpus >= MIN_CPUS_FOR_WORKER else 0
+    # En CPU los workers del DataLoader compiten con los hilos de cómputo
+    threads = cpus if cuda else max(1, cpus - workers)
+    return TrainingDevice(device=device, precision=precision, cpus=cpus, threads=threads, workers=workers)
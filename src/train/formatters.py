@@ -1,3 +1,6 @@
+# Subir al cambiar cualquier plantilla: invalida los datasets tokenizados en caché
+FORMAT_VERSION = 1
+
 def format_row(r):
     inst = r["instruction"].strip()
     inp  = (r.get("input") or "").strip()
@@ -6,4 +9,9 @@ def format_row(r):
         prompt = f"### Instrucción:\n{inst}\n\n### Entrada:\n{inp}\n\n### Respuesta:\n{out}"
     else:
         prompt = f"### Instrucción:\n{inst}\n\n### Respuesta:\n{out}"
-    return prompt
\ No newline at end of file
+    return prompt
+
+def format_apologetic(item):
+    # Formato de conversación apologética
+    return f"""### Objeción: {item['instruction']}
+### Respuesta Fundamentada: {item['output']}"""
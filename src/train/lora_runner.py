@@ -1,51 +1,142 @@
 import argparse
 import os
 import time
-import tarfile
 import torch
 import json
 from datasets import load_dataset
-from transformers import AutoTokenizer, AutoModelForCausalLM, DataCollatorForLanguageModeling, Trainer, TrainingArguments
+from transformers import AutoTokenizer, AutoModelForCausalLM, Trainer, TrainingArguments
 from peft import LoraConfig, get_peft_model
 from ..config import cfg
 from ..utils.io_utils import write_text
-from ..utils.supa import upload_ckpt
+from ..utils.supa import upload_ckpt_dir
+from .archive import CODECS, CONTENTS, default_codec, upload_archive
+from .batching import DynamicPaddingCollator, LengthGroupedBatchSampler, LengthGroupedTrainer
+from .callbacks import CheckpointUploadCallback, RunMarkerCallback, ThroughputCallback, last_metrics
+from .data_cache import cached_dataset, dataset_key, tokenizer_fingerprint
+from .device import PRECISIONS, training_device
+from .packing import PackedCollator, attention_mode, pack_examples, padding_ratio
+from .resume import check_checkpoint, checkpoint_epoch, find_resume_checkpoint
+from .token_shards import TokenShardDataset
+from .tokenization import tokenize_texts
 
-def zip_dir(src, out_tar_gz):
-    with tarfile.open(out_tar_gz, "w:gz") as tar:
-        tar.add(src, arcname=os.path.basename(src))
-
-if __name__ == "__main__":
+def parse_args(argv=None):
     ap = argparse.ArgumentParser()
     ap.add_argument("--base_model", required=True)
-    ap.add_argument("--data", required=True)
+    ap.add_argument("--data")
+    ap.add_argument("--shards", help="Directorio de shards de tokens (python -m src.train.token_shards) en vez de --data")
     ap.add_argument("--output_dir", required=True)
     ap.add_argument("--run_name", required=True)
     ap.add_argument("--epochs", type=int, default=2)
+    ap.add_argument("--max_steps", type=int, default=-1,
+                    help="Detener tras N pasos de optimización (tiene prioridad sobre --epochs)")
     ap.add_argument("--batch_size", type=int, default=2)
     ap.add_argument("--lr", type=float, default=2e-4)
     ap.add_argument("--save_steps", type=int, default=200)
     ap.add_argument("--save_total", type=int, default=3)
     ap.add_argument("--max_seq_len", type=int, default=1024)
-    args = ap.parse_args()
+    ap.add_argument("--ckpt_format", choices=["chunks", "tar"], default="chunks",
+                    help="chunks: snapshot deduplicado (solo sube lo que cambió); tar: archivo comprimido")
+    ap.add_argument("--archive_contents", choices=CONTENTS, default="adapter",
+                    help="Con --ckpt_format tar: adapter (pesos, config y tokenizer) o full (todo output_dir)")
+    ap.add_argument("--compression", choices=CODECS, default=default_codec(),
+                    help="Compresión del archivo: zstd multihilo (requiere zstandard) o gzip")
+    ap.add_argument("--compression_level", type=int, default=None)
+    ap.add_argument("--no_checkpoint_upload", dest="checkpoint_upload", action="store_false",
+                    help="No subir cada checkpoint en segundo plano durante el entrenamiento (solo al final)")
+    ap.add_argument("--pack", action="store_true",
+                    help="Empaquetar ejemplos en secuencias de max_seq_len (separados por EOS, sin atención cruzada)")
+    ap.add_argument("--cache_dir", default=cfg.dataset_cache,
+                    help="Caché de datasets tokenizados (vacío = desactivado)")
+    ap.add_argument("--num_proc", type=int, default=None,
+                    help="Procesos para tokenizar (por defecto: CPUs disponibles)")
+    ap.add_argument("--precision", choices=PRECISIONS, default="auto",
+                    help="auto: fp16 en CUDA; en CPU bf16 si el procesador lo soporta, si no fp32")
+    ap.add_argument("--dataloader_workers", type=int, default=None,
+                    help="Procesos del DataLoader (por defecto: según el dispositivo y las CPUs)")
+    ap.add_argument("--resume", default=None,
+                    help="'auto': reanudar del checkpoint completo más nuevo (local o en storage); o la ruta de un checkpoint")
+    ap.add_argument("--no_group_by_length", dest="group_by_length", action="store_false",
+                    help="Batches aleatorios en vez de agrupados por longitud (sin --pack)")
+    args = ap.parse_args(argv)
+    if bool(args.data) == bool(args.shards):
+        ap.error("one of --data or --shards is required")
+    if args.shards:
+        # Las ventanas de los shards ya vienen empaquetadas
+        args.pack = True
+    return args
 
-    os.makedirs(args.output_dir, exist_ok=True)
-
-    tok = AutoTokenizer.from_pretrained(args.base_model, use_fast=True)
+def load_tokenizer(base_model):
+    tok = AutoTokenizer.from_pretrained(base_model, use_fast=True)
     if tok.pad_token is None: 
         tok.pad_token = tok.eos_token
+    return tok
 
-    ds = load_dataset("json", data_files={"train": args.data})["train"]
+def build_shard_dataset(args, tok):
+    """Memory-mapped windows over pre-tokenized shards, plus token statistics."""
+    ds = TokenShardDataset(args.shards, args.max_seq_len)
+    if ds.meta["tokenizer"] != tokenizer_fingerprint(tok):
+        raise ValueError(f"{args.shards} was tokenized with {ds.meta.get('tokenizer_name') or 'another tokenizer'}, "
+                         f"not {args.base_model}: rebuild the shards")
+    # Solo la última ventana de cada shard puede quedar corta
+    rows = len(ds)
+    padding = 1 - ds.tokens / (rows * args.max_seq_len) if rows else 0.0
+    stats = {"examples": ds.docs, "padding_unpacked": padding, "padding_packed": padding,
+             "rows": rows, "tokens": ds.tokens}
+    return ds, stats
 
+def build_dataset(args, tok):
+    """Formatted and tokenized dataset (packed with --pack), plus token/padding statistics."""
+    if args.shards:
+        return build_shard_dataset(args, tok)
     from .formatters import format_row
-    ds = ds.map(lambda r: {"text": format_row(r)}, remove_columns=ds.column_names)
-    ds = ds.map(lambda b: tok(b["text"], truncation=True, max_length=args.max_seq_len), batched=True, remove_columns=["text"])
-    collator = DataCollatorForLanguageModeling(tok, mlm=False)
 
-    base = AutoModelForCausalLM.from_pretrained(args.base_model, torch_dtype="auto", device_map="auto")
+    def tokenize():
+        ds = load_dataset("json", data_files={"train": args.data})["train"]
+        return tokenize_texts(ds, tok, args.max_seq_len, formatter=format_row, num_proc=args.num_proc)
+
+    key = dataset_key(args.data, tok, format_row, args.max_seq_len) if args.cache_dir else None
+    ds = cached_dataset(key, tokenize, args.cache_dir)
+    lengths = [len(x) for x in ds["input_ids"]]
+    stats = {"examples": len(ds), "padding_unpacked": padding_ratio(lengths, args.batch_size)}
+    if not args.pack and args.group_by_length:
+        stats["padding_grouped"] = LengthGroupedBatchSampler(lengths, args.batch_size).padding_ratio()
+    if args.pack:
+        ds = ds.map(pack_examples, batched=True, remove_columns=ds.column_names,
+                    fn_kwargs={"max_seq_len": args.max_seq_len, "eos_id": tok.eos_token_id})
+        lengths = [len(x) for x in ds["input_ids"]]
+        stats["padding_packed"] = padding_ratio(lengths, args.batch_size)
+    stats["rows"] = len(ds)
+    stats["tokens"] = sum(lengths)
+    return ds, stats
+
+def effective_padding(stats):
+    """Padding ratio of the batching actually used (packed, length-grouped or random)."""
+    return stats.get("padding_packed", stats.get("padding_grouped", stats["padding_unpacked"]))
+
+def setup_device(args):
+    """Detect the device, pick precision/threads/DataLoader workers and set torch's thread pools."""
+    dev = training_device(args.precision, args.dataloader_workers)
+    dev.apply()
+    print(f"🖥️ Device: {dev.describe()}")
+    return dev
+
+def build_model(args, dev):
+    base = AutoModelForCausalLM.from_pretrained(args.base_model, torch_dtype=dev.model_dtype(),
+                                                device_map=dev.device_map)
+    if args.pack:
+        # Sin caché de KV: transformers solo separa ejemplos empaquetados por position_ids si no hay caché
+        base.config.use_cache = False
     lcfg = LoraConfig(r=16, lora_alpha=32, lora_dropout=0.05, task_type="CAUSAL_LM", bias="none",
                       target_modules=["q_proj","v_proj"])
-    model = get_peft_model(base, lcfg)
+    return get_peft_model(base, lcfg)
+
+def build_trainer(args, model, tok, ds, dev):
+    if args.pack:
+        mode = attention_mode(model)
+        collator = PackedCollator(tok.pad_token_id, mode, dtype=model.dtype)
+        print(f"🧱 Packing: attention isolated via {'position_ids' if mode == 'positions' else '4D block mask'}")
+    else:
+        collator = DynamicPaddingCollator(tok.pad_token_id)
 
     targs = TrainingArguments(
         output_dir=args.output_dir,
@@ -53,29 +144,169 @@ if __name__ == "__main__":
         per_device_train_batch_size=args.batch_size,
         gradient_accumulation_steps=4,
         num_train_epochs=args.epochs,
+        max_steps=args.max_steps,
         learning_rate=args.lr,
-        fp16=True,
         logging_steps=25,
         save_strategy="steps",
         save_steps=args.save_steps,
         save_total_limit=args.save_total,
-        evaluation_strategy="no",
-        report_to="none"
+        eval_strategy="no",
+        report_to="none",
+        **dev.training_args()
     )
+    # La marca va antes de la subida para que también viaje en el snapshot remoto
+    callbacks = [ThroughputCallback(), RunMarkerCallback(args.run_name)]
+    if args.checkpoint_upload:
+        callbacks.append(CheckpointUploadCallback(f"{args.run_name}/", args.ckpt_format,
+                                                  codec=args.compression, level=args.compression_level))
+    trainer_cls = LengthGroupedTrainer if args.group_by_length and not args.pack else Trainer
+    return trainer_cls(model=model, args=targs, train_dataset=ds, data_collator=collator, callbacks=callbacks)
+
+def resume_checkpoint(args):
+    """Checkpoint to resume from: --resume auto searches locally and in storage, a path is verified as is."""
+    if not args.resume:
+        return None
+    if args.resume != "auto":
+        problem = check_checkpoint(args.resume)
+        if problem:
+            raise ValueError(f"Cannot resume from {args.resume}: {problem}")
+        return args.resume
+    path = find_resume_checkpoint(args.output_dir, f"{args.run_name}/", run_name=args.run_name)
+    if path is None:
+        print("🆕 No complete checkpoint found: starting from step 0")
+    return path
+
+def find_callback(trainer, cls):
+    return next((cb for cb in trainer.callback_handler.callbacks if isinstance(cb, cls)), None)
+
+def wait_for_uploads(trainer):
+    """Drain the background checkpoint uploads (also when training failed)."""
+    cb = find_callback(trainer, CheckpointUploadCallback)
+    if cb is not None:
+        cb.close()
+
+def report_throughput(stats, train_metrics, epochs):
+    """
+    Real (non-pad) tokens per second of the finished run.
+
+    Args:
+        stats: Dataset statistics from build_dataset
+        train_metrics: Metrics returned by trainer.train()
+        epochs: Epochs trained by this process (train_runtime does not cover the part before a resume)
+    """
+    runtime = (train_metrics or {}).get("train_runtime")
+    if not runtime:
+        return None
+    tps = stats["tokens"] * epochs / runtime
+    padding = effective_padding(stats)
+    print(f"📊 Throughput: {tps:,.0f} tokens/s over {runtime:.1f}s (padding {padding:.1%})")
+    return tps
+
+def save_and_upload(args, trainer, tok, ds, stats, dev, train_metrics=None):
+    """Save the final adapter, write training_info.json and back the run up to storage."""
+    print("\n📦 Saving final checkpoint...")
+    
+    # Save model and tokenizer
+    trainer.save_model(args.output_dir)
+    tok.save_pretrained(args.output_dir)
+    print(f"✅ Model saved to: {args.output_dir}")
+    
+    # Create training info file
+    training_info = {
+        "run_name": args.run_name,
+        "base_model": args.base_model,
+        "training_params": {
+            "epochs": args.epochs,
+            "max_steps": args.max_steps,
+            "batch_size": args.batch_size,
+            "learning_rate": args.lr,
+            "max_seq_len": args.max_seq_len,
+            "save_steps": args.save_steps,
+            "pack": args.pack,
+            "group_by_length": args.group_by_length and not args.pack,
+            "device": dev.device,
+            "precision": dev.precision
+        },
+        "dataset_info": {
+            "samples": stats["examples"],
+            "sequences": len(ds),
+            "tokens": stats["tokens"],
+            "padding_ratio": effective_padding(stats),
+            "source": args.shards or args.data
+        },
+        "resumed_from": args.resumed_from,
+        # Épocas realmente recorridas (menos que --epochs con --max_steps), sin las anteriores a --resume
+        "tokens_per_second": report_throughput(stats, train_metrics,
+                                               (trainer.state.epoch or args.epochs) - checkpoint_epoch(args.resumed_from)),
+        "performance": getattr(find_callback(trainer, ThroughputCallback), "summary", {}),
+        "completion_time": time.strftime('%Y-%m-%d %H:%M:%S'),
+        "model_files": os.listdir(args.output_dir)
+    }
+    
+    info_file = os.path.join(args.output_dir, "training_info.json")
+    with open(info_file, "w", encoding="utf-8") as f:
+        import json
+        json.dump(training_info, f, indent=2, ensure_ascii=False)
+    
+    step = trainer.state.global_step
+    metrics = last_metrics(trainer.state)
+    
+    if args.ckpt_format == "chunks":
+        print("☁️ Uploading deduplicated snapshot to Supabase Storage...")
+        upload_result = upload_ckpt_dir(args.output_dir, prefix=f"{args.run_name}/", step=step, metrics=metrics)
+    else:
+        # Archivo comprimido subido mientras se genera (sin copia en /tmp)
+        timestamp = time.strftime('%Y%m%d_%H%M%S')
+        print("☁️ Uploading archive to Supabase Storage...")
+        upload_result = upload_archive(args.output_dir, f"{args.run_name}/", contents=args.archive_contents,
+                                       codec=args.compression, level=args.compression_level,
+                                       stem=f"jotica_{args.run_name}_{timestamp}", step=step, metrics=metrics)
+    
+    if upload_result.get("success"):
+        print("🎉 Checkpoint successfully backed up to Supabase!")
+        print(f"   Remote path: {upload_result['remote_path']}")
+        print(f"   File size: {upload_result['file_size'] / (1024*1024):.2f} MB")
+            
+    else:
+        print(f"⚠️ Supabase upload failed: {upload_result.get('error')}")
+        print(f"   Checkpoint saved locally: {args.output_dir}")
+    
+    print("\n✅ Training pipeline completed!")
+    print("🔗 Check your models at: https://app.supabase.com/project/jmtrhukymrhzrmqmgrfq/storage/buckets")
+
+def main(argv=None):
+    args = parse_args(argv)
 
-    trainer = Trainer(model=model, args=targs, train_dataset=ds, data_collator=collator)
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    dev = setup_device(args)
+    tok = load_tokenizer(args.base_model)
+    ds, stats = build_dataset(args, tok)
+    if args.pack:
+        print(f"📊 Packing: {stats['examples']} examples → {stats['rows']} sequences, "
+              f"padding {stats['padding_unpacked']:.1%} → {stats['padding_packed']:.1%} (estimated)")
+    elif "padding_grouped" in stats:
+        print(f"📊 Length-grouped batches: padding {stats['padding_unpacked']:.1%} → "
+              f"{stats['padding_grouped']:.1%} (estimated; --pack to reduce further)")
+    else:
+        print(f"📊 Padding: {stats['padding_unpacked']:.1%} of batch tokens (estimated; --pack to reduce)")
+
+    model = build_model(args, dev)
+    trainer = build_trainer(args, model, tok, ds, dev)
+    args.resumed_from = resume_checkpoint(args)
     
     # Training with automatic checkpoint backup
     print(f"🚀 Starting LoRA training: {args.run_name}")
     print(f"   Model: {args.base_model}")
-    print(f"   Dataset: {len(ds)} samples")
+    print(f"   Dataset: {stats['examples']} samples" + (f" in {len(ds)} packed sequences" if args.pack else ""))
     print(f"   Epochs: {args.epochs}")
     print(f"   Batch size: {args.batch_size}")
     print(f"   Output: {args.output_dir}")
     
+    train_metrics = None
     try:
         # Start training
-        trainer.train()
+        train_metrics = trainer.train(resume_from_checkpoint=args.resumed_from).metrics
         print("✅ Training completed successfully!")
         
     except KeyboardInterrupt:
@@ -85,64 +316,8 @@ if __name__ == "__main__":
         print(f"❌ Training failed: {str(e)}")
         
     finally:
-        print("\n📦 Saving final checkpoint...")
-        
-        # Save model and tokenizer
-        trainer.save_model(args.output_dir)
-        tok.save_pretrained(args.output_dir)
-        print(f"✅ Model saved to: {args.output_dir}")
-        
-        # Create training info file
-        training_info = {
-            "run_name": args.run_name,
-            "base_model": args.base_model,
-            "training_params": {
-                "epochs": args.epochs,
-                "batch_size": args.batch_size,
-                "learning_rate": args.lr,
-                "max_seq_len": args.max_seq_len,
-                "save_steps": args.save_steps
-            },
-            "dataset_info": {
-                "samples": len(ds),
-                "source": args.data
-            },
-            "completion_time": time.strftime('%Y-%m-%d %H:%M:%S'),
-            "model_files": os.listdir(args.output_dir)
-        }
-        
-        info_file = os.path.join(args.output_dir, "training_info.json")
-        with open(info_file, "w", encoding="utf-8") as f:
-            import json
-            json.dump(training_info, f, indent=2, ensure_ascii=False)
-        
-        # Create compressed archive
-        timestamp = time.strftime('%Y%m%d_%H%M%S')
-        tar_filename = f"jotica_{args.run_name}_{timestamp}.tar.gz"
-        tar_path = os.path.join("/tmp" if os.path.exists("/tmp") else args.output_dir, tar_filename)
-        
-        print(f"📦 Creating archive: {tar_filename}")
-        zip_dir(args.output_dir, tar_path)
-        
-        # Upload to Supabase with detailed logging
-        print("☁️ Uploading to Supabase Storage...")
-        upload_result = upload_ckpt(tar_path, prefix=f"{args.run_name}/")
-        
-        if upload_result.get("success"):
-            print("🎉 Checkpoint successfully backed up to Supabase!")
-            print(f"   Remote path: {upload_result['remote_path']}")
-            print(f"   File size: {upload_result['file_size'] / (1024*1024):.2f} MB")
-            
-            # Clean up local tar file if upload successful
-            try:
-                os.remove(tar_path)
-                print("🧹 Local archive cleaned up")
-            except Exception:
-                pass
-                
-        else:
-            print(f"⚠️ Supabase upload failed: {upload_result.get('error')}")
-            print(f"   Archive saved locally: {tar_path}")
-        
-        print("\n✅ Training pipeline completed!")
-        print("🔗 Check your models at: https://app.supabase.com/project/jmtrhukymrhzrmqmgrfq/storage/buckets")
\ No newline at end of file
+        wait_for_uploads(trainer)
+        save_and_upload(args, trainer, tok, ds, stats, dev, train_metrics)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Sequence packing for causal-LM fine-tuning.
+
+Alpaca-style verse examples are short, so padding each batch to its longest
+row wastes most of a 1024-token context. Packing concatenates tokenized
+examples (each ending in EOS) into sequences of up to ``max_seq_len``,
+filled best-fit decreasing so few tokens are left empty:
+
+- position_ids restart at 0 for every example, so RoPE sees each one as if
+  it were alone
+- attention never crosses an example boundary: with FlashAttention 2 (and
+  transformers versions that detect packed position_ids) the resets are
+  enough; otherwise the collator builds a block-diagonal causal 4D mask
+- the first token of every example gets label -100, so the token before it
+  (the previous example's EOS) is not trained to predict it
+"""
+
+from collections import deque
+from typing import Any, Dict, List, Sequence
+
+import torch
+
+IGNORE_INDEX = -100
+
+def pack_examples(batch: Dict[str, List[List[int]]], max_seq_len: int, eos_id: int) -> Dict[str, List[List[int]]]:
+    """
+    Pack tokenized examples into as few sequences of at most max_seq_len as possible.
+
+    Best-fit decreasing: examples go longest first (ties in dataset order),
+    each into the open sequence with the least room that still fits it, or a
+    new one. Unlike filling sequences in dataset order, short examples fill
+    the gaps left by long ones, and the result is still deterministic.
+
+    Meant for ``Dataset.map(batched=True)``; examples are never split, and an
+    example longer than max_seq_len is truncated (keeping its EOS).
+
+    Args:
+        batch: Batch with "input_ids"
+        max_seq_len: Tokens per packed sequence
+        eos_id: Separator appended to every example
+
+    Returns:
+        Batch of packed rows with input_ids, labels and position_ids
+    """
+    examples = []
+    for ex in batch["input_ids"]:
+        ex = list(ex[:max_seq_len - 1])
+        if not ex or ex[-1] != eos_id:
+            ex.append(eos_id)
+        examples.append(ex)
+    bins: List[List[List[int]]] = []
+    # Secuencias abiertas según el espacio que les queda
+    by_room = [deque() for _ in range(max_seq_len + 1)]
+    for ex in sorted(examples, key=len, reverse=True):
+        room = next((r for r in range(len(ex), max_seq_len + 1) if by_room[r]), None)
+        if room is None:
+            b, room = len(bins), max_seq_len
+            bins.append([])
+        else:
+            b = by_room[room].popleft()
+        bins[b].append(ex)
+        if room > len(ex):
+            by_room[room - len(ex)].append(b)
+
+    out = {"input_ids": [], "labels": [], "position_ids": []}
+    for packed in bins:
+        ids, labels, pos = [], [], []
+        for ex in packed:
+            ids += ex
+            # Primer token del ejemplo sin pérdida: lo "predeciría" el EOS del ejemplo anterior
+            labels += [IGNORE_INDEX] + ex[1:]
+            pos += range(len(ex))
+        out["input_ids"].append(ids)
+        out["labels"].append(labels)
+        out["position_ids"].append(pos)
+    return out
+
+def block_causal_mask(position_ids: torch.Tensor, dtype: torch.dtype) -> torch.Tensor:
+    """
+    Additive 4D mask (batch, 1, seq, seq): causal within each example, blocked across them.
+
+    Args:
+        position_ids: (batch, seq) positions that restart at 0 on every example
+        dtype: Model dtype (the mask is added to the attention scores)
+    """
+    seg = (position_ids == 0).cumsum(-1)
+    same = seg[:, :, None] == seg[:, None, :]
+    causal = torch.ones(position_ids.shape[-1], position_ids.shape[-1], dtype=torch.bool,
+                        device=position_ids.device).tril()
+    mask = torch.zeros(same.shape, dtype=dtype, device=position_ids.device)
+    mask.masked_fill_(~(same & causal), torch.finfo(dtype).min)
+    return mask[:, None]
+
+def detects_packed_positions() -> bool:
+    """Whether this transformers version derives packed-sequence masks from position_ids."""
+    try:
+        from transformers import masking_utils
+    except ImportError:
+        return False
+    return hasattr(masking_utils, "find_packed_sequence_indices")
+
+def attention_mode(model) -> str:
+    """
+    "positions" when position_ids alone keep examples apart, "block" when a 4D mask is needed.
+
+    Args:
+        model: Model (or PEFT wrapper) that will be trained
+    """
+    impl = getattr(getattr(model, "config", None), "_attn_implementation", None)
+    return "positions" if impl == "flash_attention_2" or detects_packed_positions() else "block"
+
+class PackedCollator:
+    """Pads packed rows to the longest in the batch and adds the boundary-aware attention inputs."""
+
+    def __init__(self, pad_id: int, mode: str = "positions", dtype: torch.dtype = torch.float32):
+        """
+        Initialize the collator.
+
+        Args:
+            pad_id: Token used for padding (never trained on)
+            mode: "positions" (position_ids only) or "block" (plus a 4D mask)
+            dtype: Model dtype, for the 4D mask
+        """
+        self.pad_id = pad_id
+        self.mode = mode
+        self.dtype = dtype
+
+    def __call__(self, features: Sequence[Dict[str, Any]]) -> Dict[str, torch.Tensor]:
+        width = max(len(f["input_ids"]) for f in features)
+        batch = {"input_ids": [], "labels": [], "position_ids": []}
+        for f in features:
+            pad = width - len(f["input_ids"])
+            batch["input_ids"].append(list(f["input_ids"]) + [self.pad_id] * pad)
+            batch["labels"].append(list(f["labels"]) + [IGNORE_INDEX] * pad)
+            # El relleno forma su propio segmento: nadie lo atiende
+            batch["position_ids"].append(list(f["position_ids"]) + list(range(pad)))
+        out = {k: torch.tensor(v, dtype=torch.long) for k, v in batch.items()}
+        if self.mode == "block":
+            out["attention_mask"] = block_causal_mask(out["position_ids"], self.dtype)
+        return out
+
+def padding_ratio(lengths: Sequence[int], batch_size: int) -> float:
+    """
+    Share of pad tokens when consecutive rows are batched and padded to the longest row.
+
+    Args:
+        lengths: Token count of every row, in dataset order
+        batch_size: Rows per batch
+    """
+    real = padded = 0
+    for i in range(0, len(lengths), batch_size):
+        chunk = lengths[i:i + batch_size]
+        real += sum(chunk)
+        padded += max(chunk) * len(chunk)
+    return 1 - real / padded if padded else 0.0
@@ -0,0 +1,230 @@
+"""
+Automatic resume from the newest complete checkpoint.
+
+A preempted run leaves ``checkpoint-<step>`` directories in its output
+directory (if the disk survived) and, through CheckpointUploadCallback, in
+storage under ``<run_name>/`` as deduplicated snapshots or full archives.
+``find_resume_checkpoint`` gathers both, newest step first, and returns the
+first one that passes ``check_checkpoint``: a remote checkpoint is restored
+into a staging directory (its chunks or parts are checksummed on the way),
+verified and only then moved to ``<output_dir>/checkpoint-<step>``. The
+Trainer resumes from it with weights, optimizer, scheduler and RNG state, so
+at most ``save_steps`` of work is lost.
+
+Adapter-only archives and the final upload of the output directory are not
+resumable (no optimizer state) and are skipped.
+
+Several runs may share an output directory, so a local checkpoint is only
+taken when it belongs to the run being resumed: RunMarkerCallback writes
+``run.json`` with the run name into every checkpoint, and older checkpoints
+without it are identified by the ``run_name`` in their ``training_args.bin``.
+"""
+
+import json
+import os
+import re
+import shutil
+import struct
+import zipfile
+from typing import Dict, List, Optional, Tuple
+
+from ..utils import io_utils
+from ..utils.supa import download_ckpt, list_checkpoints
+
+CHECKPOINT_RE = re.compile(r"^checkpoint-(\d+)$")
+REMOTE_RE = re.compile(r"^checkpoint-(\d+)(\.snapshot\.json|\.tar\.zst|\.tar\.gz)$")
+WEIGHTS = ("adapter_model.safetensors", "adapter_model.bin", "model.safetensors",
+           "model.safetensors.index.json", "pytorch_model.bin")
+TRAINING_STATE = ("optimizer.pt", "scheduler.pt")
+STAGING = ".resume"       # subdirectorio de output_dir donde se restaura antes de verificar
+RUN_FILE = "run.json"     # marca con el run_name dentro de cada checkpoint
+
+def _check_safetensors(path: str) -> Optional[str]:
+    # Cabecera: 8 bytes de longitud + JSON con los offsets; el archivo debe llegar al último
+    try:
+        with open(path, "rb") as f:
+            (n,) = struct.unpack("<Q", f.read(8))
+            header = json.loads(f.read(n))
+    except (OSError, ValueError, struct.error) as e:
+        return f"{os.path.basename(path)}: unreadable header ({e})"
+    end = max((t["data_offsets"][1] for k, t in header.items() if k != "__metadata__"), default=0)
+    if os.path.getsize(path) != 8 + n + end:
+        return f"{os.path.basename(path)}: truncated"
+    return None
+
+def _check_torch_zip(path: str) -> Optional[str]:
+    # torch.save escribe un zip: testzip verifica el CRC de cada entrada
+    try:
+        with zipfile.ZipFile(path) as z:
+            bad = z.testzip()
+    except (OSError, zipfile.BadZipFile) as e:
+        return f"{os.path.basename(path)}: {e}"
+    return f"{os.path.basename(path)}: corrupt entry {bad}" if bad else None
+
+def check_checkpoint(path: str) -> Optional[str]:
+    """
+    Why a checkpoint directory cannot be resumed from, or None if it is complete.
+
+    Checks that trainer_state.json parses and matches the directory's step,
+    that weights and optimizer/scheduler state exist, that safetensors files
+    are not truncated and that torch files pass their CRC checks.
+
+    Args:
+        path: checkpoint-<step> directory
+    """
+    m = CHECKPOINT_RE.match(os.path.basename(os.path.normpath(path)))
+    if not m or not os.path.isdir(path):
+        return "not a checkpoint-<step> directory"
+    try:
+        with open(os.path.join(path, "trainer_state.json"), encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError) as e:
+        return f"trainer_state.json: {e}"
+    if state.get("global_step") != int(m.group(1)):
+        return f"trainer_state.json is at step {state.get('global_step')}"
+    weights = [w for w in WEIGHTS if os.path.exists(os.path.join(path, w))]
+    if not weights:
+        return "no model weights"
+    missing = [s for s in TRAINING_STATE if not os.path.exists(os.path.join(path, s))]
+    if missing:
+        return f"missing {', '.join(missing)}"
+    for name in sorted(os.listdir(path)):
+        full = os.path.join(path, name)
+        if name.endswith(".safetensors"):
+            problem = _check_safetensors(full)
+        elif name.endswith((".pt", ".pth", ".bin")):
+            problem = _check_torch_zip(full)
+        else:
+            continue
+        if problem:
+            return problem
+    return None
+
+def checkpoint_epoch(path: Optional[str]) -> float:
+    """Epochs completed when a checkpoint was saved (0.0 without a checkpoint or its trainer_state.json)."""
+    if not path:
+        return 0.0
+    try:
+        with open(os.path.join(path, "trainer_state.json"), encoding="utf-8") as f:
+            return float(json.load(f).get("epoch") or 0.0)
+    except (OSError, ValueError):
+        return 0.0
+
+def write_run_marker(path: str, run_name: str) -> None:
+    """Record in a checkpoint directory which run saved it."""
+    with open(os.path.join(path, RUN_FILE), "w", encoding="utf-8") as f:
+        json.dump({"run_name": run_name}, f)
+
+def checkpoint_run(path: str) -> Optional[str]:
+    """
+    Name of the run that saved a checkpoint, or None if it cannot be told.
+
+    Reads the run.json marker; checkpoints saved before it existed fall back
+    to the run_name stored in training_args.bin by the Trainer.
+
+    Args:
+        path: checkpoint-<step> directory
+    """
+    try:
+        with open(os.path.join(path, RUN_FILE), encoding="utf-8") as f:
+            return json.load(f).get("run_name")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import torch
+        # training_args.bin es un pickle de TrainingArguments escrito por el propio Trainer
+        return getattr(torch.load(os.path.join(path, "training_args.bin"), weights_only=False), "run_name", None)
+    except Exception:
+        return None
+
+def local_checkpoints(output_dir: str) -> List[Tuple[int, str]]:
+    """(step, path) of the checkpoint-<step> directories in output_dir, newest first."""
+    if not os.path.isdir(output_dir):
+        return []
+    found = []
+    for name in os.listdir(output_dir):
+        m = CHECKPOINT_RE.match(name)
+        if m and os.path.isdir(os.path.join(output_dir, name)):
+            found.append((int(m.group(1)), os.path.join(output_dir, name)))
+    return sorted(found, reverse=True)
+
+def remote_checkpoints(prefix: str, bucket=None) -> List[Tuple[int, Dict]]:
+    """(step, index entry) of the run's resumable checkpoints in storage, newest first."""
+    found = []
+    for entry in list_checkpoints(prefix, bucket):
+        m = REMOTE_RE.match(io_utils.basename(entry["path"]))
+        if m:
+            found.append((int(m.group(1)), entry))
+    return sorted(found, key=lambda x: x[0], reverse=True)
+
+def fetch_checkpoint(entry: Dict, output_dir: str, bucket=None) -> Optional[str]:
+    """
+    Restore a remote checkpoint into output_dir/checkpoint-<step> after verifying it.
+
+    Args:
+        entry: Index entry from remote_checkpoints
+        output_dir: Training output directory
+        bucket: Bucket name or Storage
+
+    Returns:
+        Path of the restored checkpoint, or None if it could not be restored intact
+    """
+    name = REMOTE_RE.match(io_utils.basename(entry["path"])).group(0)
+    step_dir = name.split(".", 1)[0]
+    staging = os.path.join(output_dir, STAGING)
+    shutil.rmtree(staging, ignore_errors=True)
+    try:
+        if not download_ckpt(entry["path"], os.path.join(staging, name), bucket, extract_to=staging):
+            return None
+        restored = os.path.join(staging, step_dir)
+        problem = check_checkpoint(restored)
+        if problem:
+            print(f"⚠️ Remote checkpoint {entry['path']} is incomplete: {problem}")
+            return None
+        dest = os.path.join(output_dir, step_dir)
+        # Una copia local rota del mismo paso se reemplaza
+        shutil.rmtree(dest, ignore_errors=True)
+        os.replace(restored, dest)
+        return dest
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+def find_resume_checkpoint(output_dir: str, prefix: Optional[str] = None, bucket=None,
+                           run_name: Optional[str] = None) -> Optional[str]:
+    """
+    Newest complete checkpoint of a run, local or remote (downloaded into output_dir).
+
+    Candidates are tried from the highest step down; on a tie the local copy
+    goes first. Incomplete ones, and local ones saved by another run, are
+    reported and skipped.
+
+    Args:
+        output_dir: Training output directory
+        prefix: Run folder in the bucket (e.g. "<run_name>/"); None to look only locally
+        bucket: Bucket name or Storage (defaults to cfg.bucket_ckpt)
+        run_name: Only accept local checkpoints saved by this run; None accepts any
+
+    Returns:
+        Checkpoint directory to pass as resume_from_checkpoint, or None to start from scratch
+    """
+    candidates = [(step, 1, path) for step, path in local_checkpoints(output_dir)]
+    if prefix is not None:
+        candidates += [(step, 0, entry) for step, entry in remote_checkpoints(prefix, bucket)]
+    for step, is_local, item in sorted(candidates, key=lambda c: (c[0], c[1]), reverse=True):
+        if is_local:
+            owner = checkpoint_run(item) if run_name is not None else None
+            if owner != run_name:
+                print(f"⚠️ Skipping local checkpoint {item}: saved by run {owner or 'unknown'}, not {run_name}")
+                continue
+            problem = check_checkpoint(item)
+            if problem is None:
+                print(f"♻️ Resuming from local checkpoint {item}")
+                return item
+            print(f"⚠️ Skipping incomplete local checkpoint {item}: {problem}")
+            continue
+        print(f"☁️ Restoring checkpoint {step} from {item['path']}...")
+        path = fetch_checkpoint(item, output_dir, bucket)
+        if path is not None:
+            print(f"♻️ Resuming from remote checkpoint {item['path']} (step {step})")
+            return path
+    return None
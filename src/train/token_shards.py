@@ -0,0 +1,230 @@
+"""
+Pre-tokenized, memory-mapped token shards for large training corpora.
+
+``load_dataset("json")`` parses and tokenizes the whole corpus at startup and
+keeps it in memory. Here the corpus is tokenized once into flat binary shards
+(uint16 when the vocabulary fits, uint32 otherwise), every document followed
+by EOS, with a document-offset index per shard:
+
+    <root>/shard_00000.bin       tokens
+    <root>/shard_00000.idx.npy   int64 start offset of every document (+ end)
+    <root>/meta.json             dtype, tokenizer fingerprint, shard sizes
+
+``meta.json`` is written last, so a directory without it is an unfinished
+build. ``TokenShardDataset`` cuts the shards into fixed windows of
+``seq_len`` tokens read straight from ``np.memmap``: startup only opens the
+files and memory stays constant whatever the corpus size. Windows come out in
+the packed format of ``packing.pack_examples`` (position_ids restart at every
+document, the first token of a document gets no loss), so they train with
+``PackedCollator``.
+
+Build:
+    python -m src.train.token_shards --data bible_qa.jsonl refs.jsonl --text_col content \\
+        --tokenizer meta-llama/Llama-3-8B-Instruct --out ./data/shards/bible
+"""
+
+import argparse
+import json
+import os
+import time
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+import torch
+
+from ..utils.io_utils import iter_jsonl, read_text
+from .packing import IGNORE_INDEX
+
+SHARD_TOKENS = 256 * 1024 * 1024   # tokens por shard (512 MB en uint16)
+TOKENIZE_BATCH = 1000              # documentos por llamada al tokenizer
+META = "meta.json"
+
+def token_dtype(vocab_size: int) -> np.dtype:
+    """Smallest unsigned dtype holding every token id of the vocabulary."""
+    return np.dtype(np.uint16 if vocab_size <= 2**16 else np.uint32)
+
+def iter_documents(paths: Iterable[str], text_col: Optional[str] = None) -> Iterator[str]:
+    """
+    Training texts of the source files, one document at a time.
+
+    Args:
+        paths: JSONL files (one document per row) or plain text files (one document each)
+        text_col: JSONL column holding the text; None formats Alpaca rows with format_row
+    """
+    from .formatters import format_row
+    for p in paths:
+        if p.endswith(".jsonl"):
+            for r in iter_jsonl(p):
+                yield r[text_col] if text_col else format_row(r)
+        else:
+            yield read_text(p)
+
+class ShardWriter:
+    """Appends tokenized documents to shard files, starting a new shard every shard_tokens."""
+
+    def __init__(self, root: str, dtype: np.dtype, shard_tokens: int = SHARD_TOKENS):
+        self.root = root
+        self.dtype = dtype
+        self.shard_tokens = shard_tokens
+        self.shards: List[Dict] = []
+        self._f = None
+        os.makedirs(root, exist_ok=True)
+
+    def _open(self):
+        name = f"shard_{len(self.shards):05d}"
+        self._name = name
+        self._f = open(os.path.join(self.root, name + ".bin"), "wb")
+        self._offsets = [0]
+
+    def _close_shard(self):
+        self._f.close()
+        np.save(os.path.join(self.root, self._name + ".idx.npy"), np.asarray(self._offsets, dtype=np.int64))
+        self.shards.append({"file": self._name + ".bin", "tokens": self._offsets[-1],
+                            "docs": len(self._offsets) - 1})
+        self._f = None
+
+    def add(self, ids: List[int]) -> None:
+        if self._f is None:
+            self._open()
+        self._f.write(np.asarray(ids, dtype=self.dtype).tobytes())
+        self._offsets.append(self._offsets[-1] + len(ids))
+        # Los documentos nunca se parten entre shards
+        if self._offsets[-1] >= self.shard_tokens:
+            self._close_shard()
+
+    def close(self) -> List[Dict]:
+        if self._f is not None:
+            self._close_shard()
+        return self.shards
+
+def build_shards(docs: Iterable[str], tok, root: str, shard_tokens: int = SHARD_TOKENS,
+                 batch_docs: int = TOKENIZE_BATCH) -> Dict:
+    """
+    Tokenize documents into token shards.
+
+    Args:
+        docs: Document texts (streamed)
+        tok: Tokenizer; EOS is appended to every document
+        root: Output directory
+        shard_tokens: Tokens per shard (a shard closes at the first document end past it)
+        batch_docs: Documents per tokenizer call
+
+    Returns:
+        The metadata written to meta.json
+    """
+    from .data_cache import tokenizer_fingerprint
+
+    if os.path.exists(os.path.join(root, META)):
+        os.remove(os.path.join(root, META))
+    eos = tok.eos_token_id
+    dtype = token_dtype(len(tok))
+    writer = ShardWriter(root, dtype, shard_tokens)
+    t0 = time.time()
+    n_docs = n_tokens = 0
+
+    def flush(batch):
+        nonlocal n_docs, n_tokens
+        for ids in tok(batch, add_special_tokens=True)["input_ids"]:
+            if not ids or ids[-1] != eos:
+                ids = ids + [eos]
+            writer.add(ids)
+            n_docs += 1
+            n_tokens += len(ids)
+
+    batch = []
+    for text in docs:
+        batch.append(text)
+        if len(batch) >= batch_docs:
+            flush(batch)
+            batch = []
+            print(f"   🔤 {n_docs:,} docs, {n_tokens:,} tokens ({n_tokens / (time.time() - t0):,.0f} tok/s)")
+    if batch:
+        flush(batch)
+
+    meta = {
+        "dtype": dtype.name,
+        "vocab_size": len(tok),
+        "eos_id": eos,
+        "tokenizer": tokenizer_fingerprint(tok),
+        "tokenizer_name": getattr(tok, "name_or_path", ""),
+        "docs": n_docs,
+        "tokens": n_tokens,
+        "shards": writer.close(),
+    }
+    with open(os.path.join(root, META), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    print(f"✅ {n_docs:,} docs → {n_tokens:,} tokens in {len(meta['shards'])} shards ({dtype.name}) "
+          f"in {time.time() - t0:.1f}s: {root}")
+    return meta
+
+def load_meta(root: str) -> Dict:
+    path = os.path.join(root, META)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{path} not found: not a token shard directory, or its build did not finish")
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+class TokenShardDataset(torch.utils.data.Dataset):
+    """Fixed windows of seq_len tokens over memory-mapped token shards, in packed format."""
+
+    def __init__(self, root: str, seq_len: int):
+        """
+        Open a shard directory.
+
+        Args:
+            root: Directory written by build_shards
+            seq_len: Tokens per window (the last window of a shard may be shorter)
+        """
+        self.root = root
+        self.seq_len = seq_len
+        self.meta = load_meta(root)
+        self.dtype = np.dtype(self.meta["dtype"])
+        self.shards = self.meta["shards"]
+        windows = [-(-s["tokens"] // seq_len) for s in self.shards]
+        self.cum = np.cumsum(windows)
+        self.docs = self.meta["docs"]
+        self.tokens = self.meta["tokens"]
+        # Se abren al primer acceso: cada worker del DataLoader tiene sus propios memmaps
+        self._tokens: Dict[int, np.memmap] = {}
+        self._offsets: Dict[int, np.ndarray] = {}
+
+    def _shard(self, k: int):
+        if k not in self._tokens:
+            s = self.shards[k]
+            self._tokens[k] = np.memmap(os.path.join(self.root, s["file"]), dtype=self.dtype, mode="r",
+                                        shape=(s["tokens"],))
+            self._offsets[k] = np.load(os.path.join(self.root, s["file"][:-4] + ".idx.npy"), mmap_mode="r")
+        return self._tokens[k], self._offsets[k]
+
+    def __len__(self) -> int:
+        return int(self.cum[-1]) if len(self.cum) else 0
+
+    def __getitem__(self, i: int) -> Dict[str, List[int]]:
+        if i < 0:
+            i += len(self)
+        k = int(np.searchsorted(self.cum, i, side="right"))
+        local = i - (int(self.cum[k - 1]) if k else 0)
+        tokens, offsets = self._shard(k)
+        start = local * self.seq_len
+        end = min(start + self.seq_len, len(tokens))
+        ids = np.asarray(tokens[start:end], dtype=np.int64)
+        g = np.arange(start, end)
+        doc_start = np.asarray(offsets)[np.searchsorted(offsets, g, side="right") - 1]
+        # Posiciones relativas al documento (o al inicio de la ventana si el documento empezó antes)
+        pos = g - np.maximum(doc_start, start)
+        labels = ids.copy()
+        labels[pos == 0] = IGNORE_INDEX
+        return {"input_ids": ids.tolist(), "labels": labels.tolist(), "position_ids": pos.tolist()}
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Pre-tokenizar un corpus en shards de tokens")
+    ap.add_argument("--data", nargs="+", required=True, help="JSONL (un documento por fila) o textos planos")
+    ap.add_argument("--text_col", default=None, help="Columna de texto del JSONL (por defecto: filas Alpaca con format_row)")
+    ap.add_argument("--tokenizer", required=True)
+    ap.add_argument("--out", required=True)
+    ap.add_argument("--shard_tokens", type=int, default=SHARD_TOKENS)
+    a = ap.parse_args()
+
+    from transformers import AutoTokenizer
+    tok = AutoTokenizer.from_pretrained(a.tokenizer, use_fast=True)
+    build_shards(iter_documents(a.data, a.text_col), tok, a.out, a.shard_tokens)
@@ -0,0 +1,309 @@
+"""
+Content-defined chunking and a deduplicated chunk store for checkpoints.
+
+Files are split where a rolling gear hash over the last 32 bytes hits a
+target pattern, so boundaries follow content: an insertion or edit only
+changes the chunks around it. Chunks are stored once per bucket under
+``chunks/<sha[:2]>/<sha>`` and each checkpoint is a snapshot manifest listing
+its files as sequences of chunk hashes. Consecutive checkpoints therefore
+upload only what changed (typically adapter weights and optimizer state,
+not tokenizer files and configs), and restores read chunks through the local
+cache.
+
+Chunks are shared by every snapshot in the bucket and never deleted on
+upload; ``ChunkStore.gc`` removes the ones no kept snapshot references.
+"""
+
+import hashlib
+import json
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timezone
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from ..config import cfg
+from .progress import Progress
+from .retry import retry_call
+from .storage import CachedStorage, Storage
+
+WINDOW = 32                     # bytes que ve el hash rodante
+MIN_CHUNK = 256 * 1024
+AVG_CHUNK = 1024 * 1024         # potencia de 2
+MAX_CHUNK = 4 * 1024 * 1024
+READ_BLOCK = 16 * 1024 * 1024
+COMPRESS_SAMPLE = 64 * 1024
+SNAPSHOT_SUFFIX = ".snapshot.json"
+GC_MIN_AGE = 24 * 3600          # segundos: chunks más nuevos pueden ser de una subida en curso
+
+# Tabla gear fija: cambiarla cambia todos los cortes (y anula la deduplicación)
+GEAR = np.random.default_rng(0x6A6F74).integers(0, 2**32, 256, dtype=np.uint64).astype(np.uint32)
+
+def _gear_hash(buf: np.ndarray) -> np.ndarray:
+    """
+    Gear hash ending at every byte: h[i] = sum(GEAR[buf[i-j]] << j for j < 32) mod 2**32.
+
+    Computed by doubling (window 1, 2, 4, ..., 32) in five vectorized passes.
+    """
+    h = GEAR[buf]
+    k = 1
+    while k < WINDOW:
+        h[k:] += h[:-k] << np.uint32(k)  # el lado derecho se evalúa antes de escribir
+        k *= 2
+    return h
+
+def iter_chunks(f: BinaryIO, min_size: int = MIN_CHUNK, avg_size: int = AVG_CHUNK,
+                max_size: int = MAX_CHUNK) -> Iterator[bytes]:
+    """
+    Split a stream into content-defined chunks.
+
+    Args:
+        f: Binary file object
+        min_size: Smallest chunk (except the last)
+        avg_size: Target average distance between cut points (power of 2)
+        max_size: Largest chunk
+
+    Yields:
+        Chunks, in order; concatenated they equal the stream
+    """
+    bits = avg_size.bit_length() - 1
+    # Bits altos: son los únicos que dependen de los 32 bytes de la ventana
+    mask = np.uint32(((1 << bits) - 1) << (32 - bits))
+    pending = bytearray()
+    ctx = b""
+    while True:
+        block = f.read(READ_BLOCK)
+        if not block:
+            break
+        h = _gear_hash(np.frombuffer(ctx + block, dtype=np.uint8))[len(ctx):]
+        cuts = np.flatnonzero((h & mask) == 0) + 1 + len(pending)
+        pending += block
+        last = 0
+        for pos in cuts.tolist():
+            if pos - last < min_size:
+                continue
+            while pos - last > max_size:
+                yield bytes(pending[last:last + max_size])
+                last += max_size
+            yield bytes(pending[last:pos])
+            last = pos
+        # Sin corte posible a menos de max_size: el corte forzado ya es definitivo
+        while len(pending) - last > max_size:
+            yield bytes(pending[last:last + max_size])
+            last += max_size
+        del pending[:last]
+        ctx = (ctx + block)[-(WINDOW - 1):]
+    if pending:
+        yield bytes(pending)
+
+def chunk_path(sha: str) -> str:
+    return f"chunks/{sha[:2]}/{sha}"
+
+def safe_relpath(path: str) -> str:
+    """
+    Validate a '/'-separated relative path from a remote manifest.
+
+    Raises:
+        ValueError: If the path is empty, absolute or has "." / ".." parts (it could write outside the restore root)
+    """
+    parts = path.replace("\\", "/").split("/")
+    if not path or path.startswith(("/", "\\")) or ":" in parts[0] or any(p in ("", ".", "..") for p in parts):
+        raise ValueError(f"Unsafe path in snapshot manifest: {path!r}")
+    return path
+
+class ChunkStore:
+    """Deduplicated snapshots of checkpoint directories on top of a Storage."""
+
+    def __init__(self, storage: Storage, cache_dir: Optional[str] = None,
+                 cache_gb: Optional[float] = None, workers: int = 4):
+        """
+        Initialize the chunk store.
+
+        Args:
+            storage: Storage that holds chunks and snapshot manifests
+            cache_dir: Local chunk cache (defaults to CKPT_CACHE_DIR or ~/.cache/jotica)
+            cache_gb: Cache size limit (defaults to cfg.ckpt_cache_gb)
+            workers: Chunks uploaded/downloaded in parallel
+        """
+        if not isinstance(storage, CachedStorage):
+            base = cache_dir or cfg.ckpt_cache_dir or os.path.expanduser("~/.cache/jotica")
+            limit = int((cache_gb or cfg.ckpt_cache_gb) * 1024**3)
+            scope = hashlib.sha1(repr(storage).encode()).hexdigest()[:12]
+            storage = CachedStorage(storage, os.path.join(base, "chunks", scope), limit)
+        self.storage = storage
+        self.workers = workers
+
+    def _put_chunk(self, sha: str, data: bytes) -> Dict[str, Any]:
+        path = chunk_path(sha)
+        # Decisión determinista por muestra: pesos y estados del optimizador casi no comprimen
+        sample = data[:COMPRESS_SAMPLE]
+        compressed = len(zlib.compress(sample, 1)) < 0.9 * len(sample)
+        pack = lambda: zlib.compress(data, 1) if compressed else data
+        stored = None
+        try:
+            stored_size, uploaded = self.storage.remote.size(path), 0
+        except FileNotFoundError:
+            stored = pack()
+            retry_call(self.storage.put, path, stored,
+                       on_retry=lambda n, e: print(f"⚠️ Chunk {sha[:12]} retry {n}: {e}"))
+            stored_size = uploaded = len(stored)
+        # Lo que acabamos de leer del disco también sirve para restaurar en esta máquina
+        if not self.storage.cache.exists(path):
+            self.storage.cache.put(path, stored if stored is not None else pack())
+        return {"size": len(data), "stored": stored_size, "zlib": compressed, "uploaded": uploaded}
+
+    def put_dir(self, local_dir: str, remote_path: str, meta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Snapshot a directory: upload its new chunks, then its manifest.
+
+        Args:
+            local_dir: Checkpoint directory
+            remote_path: Manifest object path (should end in SNAPSHOT_SUFFIX)
+            meta: Extra fields stored in the manifest
+
+        Returns:
+            Snapshot manifest (with upload statistics under "stats")
+        """
+        files, futures, inflight = [], {}, set()
+        names = sorted(os.path.relpath(os.path.join(d, n), local_dir)
+                       for d, _, ns in os.walk(local_dir) for n in ns)
+        progress = Progress(len(names), f"snapshot {os.path.basename(local_dir)}", unit="files")
+        with ThreadPoolExecutor(max_workers=self.workers) as ex:
+            for rel in names:
+                full = os.path.join(local_dir, rel)
+                entry = {"path": rel.replace(os.sep, "/"), "size": os.path.getsize(full),
+                         "mode": os.stat(full).st_mode & 0o777, "chunks": []}
+                with open(full, "rb") as f:
+                    for data in iter_chunks(f):
+                        sha = hashlib.sha256(data).hexdigest()
+                        entry["chunks"].append(sha)
+                        if sha not in futures:
+                            # Acotar los chunks en memoria esperando a que suban
+                            while len(inflight) >= 2 * self.workers:
+                                _, inflight = wait(inflight, return_when=FIRST_COMPLETED)
+                            futures[sha] = ex.submit(self._put_chunk, sha, data)
+                            inflight.add(futures[sha])
+                files.append(entry)
+                progress.update()
+            chunks = {sha: fut.result() for sha, fut in futures.items()}
+        progress.close()
+        self.storage.evict()
+
+        total = sum(f["size"] for f in files)
+        uploaded = {sha: c.pop("uploaded") for sha, c in chunks.items()}
+        manifest = {
+            "version": 1,
+            "root": os.path.basename(os.path.normpath(local_dir)),
+            "files": files,
+            "chunks": chunks,
+            "size": total,
+            "sha256": hashlib.sha256("".join(sha for f in files for sha in f["chunks"]).encode()).hexdigest(),
+            "created": datetime.now().isoformat(),
+            **(meta or {}),
+        }
+        retry_call(self.storage.put, remote_path, json.dumps(manifest).encode("utf-8"), "application/json")
+        manifest["stats"] = {"bytes": total, "chunks": len(chunks),
+                             "new_chunks": sum(1 for u in uploaded.values() if u),
+                             "uploaded_bytes": sum(uploaded.values())}
+        return manifest
+
+    def read_snapshot(self, remote_path: str) -> Dict[str, Any]:
+        return json.loads(self.storage.get(remote_path))
+
+    def _get_chunk(self, sha: str, info: Dict[str, Any]) -> bytes:
+        stored = retry_call(self.storage.get, chunk_path(sha))
+        data = zlib.decompress(stored) if info["zlib"] else stored
+        if hashlib.sha256(data).hexdigest() != sha:
+            self.storage.cache.delete([chunk_path(sha)])
+            raise IOError(f"Checksum mismatch in chunk {sha[:12]}")
+        return data
+
+    def get_dir(self, remote_path: str, dest_dir: str) -> Dict[str, Any]:
+        """
+        Restore a snapshot into dest_dir/<root>, reading chunks through the local cache.
+
+        Args:
+            remote_path: Snapshot manifest path
+            dest_dir: Parent directory of the restored checkpoint
+
+        Returns:
+            Snapshot manifest
+        """
+        manifest = self.read_snapshot(remote_path)
+        # Rutas del manifiesto remoto: nada de absolutas ni "..", que escribirían fuera de dest_dir
+        if "/" in safe_relpath(manifest["root"]):
+            raise ValueError(f"Unsafe root in snapshot manifest: {manifest['root']!r}")
+        for entry in manifest["files"]:
+            safe_relpath(entry["path"])
+        root = os.path.join(dest_dir, manifest["root"])
+        hits, misses = self.storage.hits, self.storage.misses
+        progress = Progress(len(manifest["files"]), f"restore {manifest['root']}", unit="files")
+        with ThreadPoolExecutor(max_workers=self.workers) as ex:
+            for entry in manifest["files"]:
+                out = os.path.join(root, *entry["path"].split("/"))
+                os.makedirs(os.path.dirname(out), exist_ok=True)
+                tmp = f"{out}.partial"
+                with open(tmp, "wb") as f:
+                    # Ventanas en orden: los workers traen los siguientes chunks mientras se escribe
+                    step = 2 * self.workers
+                    for i in range(0, len(entry["chunks"]), step):
+                        window = entry["chunks"][i:i + step]
+                        for data in ex.map(lambda s: self._get_chunk(s, manifest["chunks"][s]), window):
+                            f.write(data)
+                if os.path.getsize(tmp) != entry["size"]:
+                    raise IOError(f"Size mismatch restoring {entry['path']}")
+                os.chmod(tmp, entry.get("mode", 0o644))
+                os.replace(tmp, out)
+                progress.update()
+        progress.close()
+        print(f"🗄️ Chunk cache: {self.storage.hits - hits} hits, {self.storage.misses - misses} downloaded")
+        return manifest
+
+    def gc(self, keep_manifests: List[str], min_age: float = GC_MIN_AGE, dry_run: bool = False) -> Dict[str, Any]:
+        """
+        Delete the chunks that none of the kept snapshots reference.
+
+        Chunks are shared across runs, so keep_manifests must list every
+        snapshot to keep in the bucket, not just one run's. Chunks newer than
+        min_age are left alone: they may belong to a snapshot whose manifest is
+        not uploaded yet. Do not run it while another upload may be reusing
+        old chunks.
+
+        Args:
+            keep_manifests: Snapshot manifest paths whose chunks must survive
+            min_age: Seconds a chunk must have existed to be deleted
+            dry_run: Only count what would be deleted
+
+        Returns:
+            {"chunks", "kept", "deleted", "deleted_bytes"}
+        """
+        referenced = set()
+        for path in keep_manifests:
+            referenced.update(self.read_snapshot(path)["chunks"])
+        now = datetime.now(timezone.utc)
+        total, garbage, freed = 0, [], 0
+        for folder in self.storage.list("chunks"):
+            for obj in self.storage.list(f"chunks/{folder['name']}"):
+                if obj["size"] is None:
+                    continue
+                total += 1
+                if obj["name"] in referenced:
+                    continue
+                try:
+                    updated = datetime.fromisoformat(str(obj["updated_at"]).replace("Z", "+00:00"))
+                except ValueError:
+                    continue   # sin fecha fiable no se borra
+                if updated.tzinfo is None:
+                    updated = updated.replace(tzinfo=timezone.utc)
+                if (now - updated).total_seconds() < min_age:
+                    continue
+                garbage.append(chunk_path(obj["name"]))
+                freed += obj["size"]
+        if garbage and not dry_run:
+            for i in range(0, len(garbage), 1000):
+                self.storage.delete(garbage[i:i + 1000])
+        print(f"🧹 Chunk GC: {len(garbage)}/{total} chunks unreferenced, {freed / (1024*1024):.2f} MB"
+              + (" (dry run)" if dry_run else " deleted"))
+        return {"chunks": total, "kept": total - len(garbage), "deleted": len(garbage), "deleted_bytes": freed}
@@ -0,0 +1,222 @@
+"""
+Token-aware text chunking on sentence and paragraph boundaries.
+
+Text is split into sentences (paragraph breaks are remembered), each sentence
+is measured with the tiktoken encoding of the embedding model, and sentences
+are packed greedily into chunks whose joined text (separators included) has
+at most ``max_tokens``. Chunks
+are returned as ``(start, end)`` character offsets into the source, so callers
+slice only what they keep. Files are read in blocks cut at paragraph breaks,
+so memory stays around one block whatever the file size.
+"""
+
+import re
+from functools import lru_cache
+from typing import Iterable, Iterator, List, Tuple, Union
+
+ENCODING = "cl100k_base"   # el de text-embedding-3-small
+MAX_TOKENS = 512
+OVERLAP_TOKENS = 64
+READ_BLOCK = 1024 * 1024   # caracteres por lectura al recorrer archivos
+
+# Fin de oración (con comillas o paréntesis de cierre) seguido de espacio, o línea en blanco
+_BOUNDARY = re.compile(r"[.!?…]+[\"'»”’)\]]*(?=\s)|\n[ \t]*\n\s*")
+_WORD = re.compile(r"\S+")
+
+Span = Tuple[int, int]
+
+@lru_cache(maxsize=4)
+def get_encoding(name: str = ENCODING):
+    import tiktoken
+    return tiktoken.get_encoding(name)
+
+def _encoder(encoding):
+    # Nombre de encoding de tiktoken u objeto con encode_ordinary (p. ej. en pruebas)
+    return get_encoding(encoding) if isinstance(encoding, str) else encoding
+
+def count_tokens(text: str, encoding=ENCODING) -> int:
+    """Number of tokens of text under the given encoding."""
+    return len(_encoder(encoding).encode_ordinary(text))
+
+def _strip(text: str, start: int, end: int) -> Span:
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return start, end
+
+def iter_sentences(text: str) -> Iterator[Tuple[int, int, bool]]:
+    """
+    Sentence spans of text.
+
+    Yields:
+        (start, end, paragraph_end) with surrounding whitespace excluded
+    """
+    held = None
+    pos = 0
+    for m in _BOUNDARY.finditer(text):
+        para = m.group().startswith("\n")
+        start, end = _strip(text, pos, m.start() if para else m.end())
+        pos = m.end()
+        if start == end:
+            # Línea en blanco justo después de un punto: cierra el párrafo de la oración anterior
+            if para and held is not None:
+                held = (held[0], held[1], True)
+            continue
+        if held is not None:
+            yield held
+        held = (start, end, para)
+    if held is not None:
+        yield held
+    start, end = _strip(text, pos, len(text))
+    if start < end:
+        yield start, end, True
+
+def _split_long(text: str, start: int, end: int, max_tokens: int, enc) -> Iterator[Tuple[int, int, int]]:
+    # Oración que no cabe en un chunk: cortar entre palabras (y una palabra enorme, por caracteres)
+    cur_start, cur_end, cur_tokens = None, None, 0
+    for m in _WORD.finditer(text, start, end):
+        ws, we = m.span()
+        n = len(enc.encode_ordinary(text[ws:we])) + 1  # +1: el espacio que la une a la anterior
+        if n > max_tokens:
+            if cur_start is not None:
+                yield cur_start, cur_end, cur_tokens
+                cur_start, cur_tokens = None, 0
+            # Cada token ocupa al menos un carácter
+            for s in range(ws, we, max_tokens):
+                e = min(s + max_tokens, we)
+                yield s, e, len(enc.encode_ordinary(text[s:e]))
+            continue
+        if cur_start is not None and cur_tokens + n > max_tokens:
+            yield cur_start, cur_end, cur_tokens
+            cur_start, cur_tokens = None, 0
+        if cur_start is None:
+            cur_start = ws
+        cur_end, cur_tokens = we, cur_tokens + n
+    if cur_start is not None:
+        yield cur_start, cur_end, cur_tokens
+
+def _pack(text: str, units: Iterable[Tuple[int, int, int, bool]], max_tokens: int, overlap_tokens: int,
+          enc) -> Iterator[Span]:
+    """Greedy packing of (start, end, tokens, paragraph_end) units into chunk spans."""
+    # Se mide el texto unido de cada candidato: los espacios y saltos entre oraciones
+    # también son tokens y la suma por oración se queda corta
+    measure = lambda start, end: len(enc.encode_ordinary(text[start:end]))
+    chunk: List[Tuple[int, int, int, bool]] = []
+    total = 0
+    for unit in units:
+        n = unit[2]
+        candidate = measure(chunk[0][0], unit[1]) if chunk else n
+        if chunk and candidate > max_tokens:
+            yield chunk[0][0], chunk[-1][1]
+            # Solapamiento: oraciones finales completas que quepan en overlap_tokens
+            keep, kept = [], 0
+            for u in reversed(chunk):
+                if kept + u[2] > overlap_tokens:
+                    break
+                keep.insert(0, u)
+                kept += u[2]
+            # ...y que dejen entrar a la oración nueva
+            candidate = n
+            while keep:
+                candidate = measure(keep[0][0], unit[1])
+                if candidate <= max_tokens:
+                    break
+                keep.pop(0)
+                candidate = n
+            chunk = keep
+        chunk.append(unit)
+        total = candidate
+        # Un párrafo que ya llena medio chunk se cierra ahí en vez de mezclarse con el siguiente
+        if unit[3] and total >= max_tokens // 2:
+            yield chunk[0][0], chunk[-1][1]
+            chunk, total = [], 0
+    if chunk:
+        yield chunk[0][0], chunk[-1][1]
+
+def _units(text: str, max_tokens: int, enc) -> Iterator[Tuple[int, int, int, bool]]:
+    for start, end, para in iter_sentences(text):
+        n = len(enc.encode_ordinary(text[start:end]))
+        if n <= max_tokens:
+            yield start, end, n, para
+            continue
+        parts = list(_split_long(text, start, end, max_tokens, enc))
+        for i, (s, e, k) in enumerate(parts):
+            yield s, e, k, para and i == len(parts) - 1
+
+def chunk_spans(text: str, max_tokens: int = MAX_TOKENS, overlap_tokens: int = OVERLAP_TOKENS,
+                encoding: Union[str, object] = ENCODING) -> List[Span]:
+    """
+    Split text into chunks of at most max_tokens, cutting between sentences.
+
+    Args:
+        text: Text to chunk
+        max_tokens: Token budget per chunk
+        overlap_tokens: Tokens of trailing whole sentences repeated at the start of the next chunk
+        encoding: tiktoken encoding name (or an object with encode_ordinary)
+
+    Returns:
+        List of (start, end) character offsets into text
+    """
+    enc = _encoder(encoding)
+    return list(_pack(text, _units(text, max_tokens, enc), max_tokens, overlap_tokens, enc))
+
+def chunk_by_tokens(text: str, max_tokens: int = MAX_TOKENS, overlap_tokens: int = OVERLAP_TOKENS,
+                    encoding: Union[str, object] = ENCODING) -> List[str]:
+    """
+    Split text into chunks of at most max_tokens, cutting between sentences.
+
+    Same as chunk_spans but returns the chunk texts.
+    """
+    return [text[start:end] for start, end in chunk_spans(text, max_tokens, overlap_tokens, encoding)]
+
+def _last_cut(buf: str) -> int:
+    # Último corte seguro del bloque: línea en blanco, si no fin de oración, si no espacio
+    para = buf.rfind("\n\n")
+    if para > 0:
+        return para + 2
+    last = None
+    for m in _BOUNDARY.finditer(buf):
+        last = m
+    if last is not None:
+        return last.end()
+    return buf.rfind(" ") + 1
+
+def iter_file_chunks(path: str, max_tokens: int = MAX_TOKENS, overlap_tokens: int = OVERLAP_TOKENS,
+                     encoding: Union[str, object] = ENCODING, block_chars: int = READ_BLOCK,
+                     ) -> Iterator[Tuple[int, int, str]]:
+    """
+    Chunk a text file without loading it whole.
+
+    The file is read in blocks and cut at the last paragraph break of each
+    block (a sentence end or a space if there is none); every piece is chunked
+    on its own, so memory stays around one block whatever the file size.
+
+    Args:
+        path: UTF-8 text file
+        max_tokens: Token budget per chunk
+        overlap_tokens: Tokens of trailing whole sentences repeated in the next chunk
+        encoding: tiktoken encoding name (or an object with encode_ordinary)
+        block_chars: Characters read per block
+
+    Yields:
+        (start, end, text) with character offsets into the file
+    """
+    enc = _encoder(encoding)
+    buf, base = "", 0
+    with open(path, encoding="utf-8") as f:
+        while True:
+            block = f.read(block_chars)
+            buf += block
+            # En modo texto read() solo devuelve menos de lo pedido al llegar al final
+            final = len(block) < block_chars
+            cut = len(buf) if final else _last_cut(buf)
+            if cut <= 0 and len(buf) < 4 * block_chars:
+                continue
+            piece = buf[:cut or len(buf)]
+            for start, end in chunk_spans(piece, max_tokens, overlap_tokens, enc):
+                yield base + start, base + end, piece[start:end]
+            base += len(piece)
+            buf = buf[len(piece):]
+            if final:
+                return
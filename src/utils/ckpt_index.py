@@ -0,0 +1,164 @@
+"""
+Per-run checkpoint index.
+
+Each run keeps one small JSON document listing its checkpoints (path, size,
+checksum, step, metrics). Updates are optimistic: a writer publishes version
+N+1 as a create-only object ``<run>/index/v<N+1>.json``; if another writer got
+there first the write fails, the newer version is read, the entry re-applied
+and the next number tried. ``<run>/index.json`` points at the latest version
+as a hint: readers revalidate it against a local copy by ETag and then check
+that no newer version object exists, so they never act on a stale index even
+if two writers raced on the pointer. Writers re-check for newer versions after
+moving the pointer and carry it forward, so once writers finish it names the
+highest version again.
+"""
+
+import hashlib
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from ..config import cfg
+from .storage import Storage
+
+INDEX_VERSION = 1
+KEEP_VERSIONS = 20   # versiones históricas conservadas además de la actual
+
+def _empty(run: str) -> Dict[str, Any]:
+    return {"format": INDEX_VERSION, "run": run, "version": 0, "updated": None, "checkpoints": []}
+
+class CheckpointIndex:
+    """Versioned checkpoint list for one run, stored next to its checkpoints."""
+
+    def __init__(self, run: str, storage: Storage, cache_dir: Optional[str] = None):
+        """
+        Initialize the index.
+
+        Args:
+            run: Run folder in the bucket ("" for the bucket root)
+            storage: Storage that holds the run
+            cache_dir: Where the local copy and its ETag live
+        """
+        self.run = run.strip("/")
+        self.storage = storage
+        base = cache_dir or os.path.join(cfg.ckpt_cache_dir or os.path.expanduser("~/.cache/jotica"), "index")
+        scope = hashlib.sha1(repr(storage).encode()).hexdigest()[:12]
+        self.cache_file = os.path.join(base, scope, self.run or "_root", "index.json")
+
+    def _key(self, name: str) -> str:
+        return f"{self.run}/{name}" if self.run else name
+
+    @property
+    def pointer_path(self) -> str:
+        return self._key("index.json")
+
+    def version_path(self, version: int) -> str:
+        return self._key(f"index/v{version:06d}.json")
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_file, encoding="utf-8") as f:
+                cached = json.load(f)
+            return cached["etag"], cached["index"]
+        except (OSError, ValueError, KeyError):
+            return None, None
+
+    def _save_cache(self, etag: str, index: Dict[str, Any]) -> None:
+        os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+        tmp = f"{self.cache_file}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"etag": etag, "index": index}, f)
+        os.replace(tmp, self.cache_file)
+
+    def read(self) -> Dict[str, Any]:
+        """
+        Current index (one conditional read; the body is skipped if unchanged).
+
+        Returns:
+            Index dictionary; empty index if the run has none yet
+        """
+        etag, cached = self._load_cache()
+        try:
+            data, new_etag = self.storage.get_if_changed(self.pointer_path, etag if cached else None)
+        except FileNotFoundError:
+            return _empty(self.run)
+        index = cached if data is None else json.loads(data)
+        newer = self._newer(index)
+        if data is not None or newer is not index:
+            self._save_cache(new_etag, newer)
+        return newer
+
+    def _newer(self, index: Dict[str, Any]) -> Dict[str, Any]:
+        # El puntero puede ir atrasado (escritor lento o carrera): seguir las versiones hacia adelante
+        while True:
+            try:
+                index = json.loads(self.storage.get(self.version_path(index["version"] + 1)))
+            except FileNotFoundError:
+                return index
+
+    def checkpoints(self) -> List[Dict[str, Any]]:
+        """Checkpoints ordered by step, then upload time."""
+        entries = self.read()["checkpoints"]
+        return sorted(entries, key=lambda e: (e.get("step") is None, e.get("step") or 0, e.get("created") or ""))
+
+    def latest(self) -> Optional[Dict[str, Any]]:
+        """Most recent checkpoint entry, or None."""
+        entries = self.checkpoints()
+        return entries[-1] if entries else None
+
+    def add(self, entry: Dict[str, Any], attempts: int = 50) -> Dict[str, Any]:
+        """
+        Add or replace a checkpoint entry (matched by path) and publish a new version.
+
+        Args:
+            entry: Checkpoint entry; must contain "path"
+            attempts: Version numbers tried before giving up
+
+        Returns:
+            The published index
+        """
+        index = self.read()
+        for _ in range(attempts):
+            version = index["version"] + 1
+            new = dict(index, version=version, updated=datetime.now().isoformat(),
+                       checkpoints=[e for e in index["checkpoints"] if e["path"] != entry["path"]] + [entry])
+            try:
+                self.storage.put(self.version_path(version), json.dumps(new, indent=2).encode("utf-8"),
+                                 "application/json", overwrite=False)
+            except FileExistsError:
+                # Otro escritor publicó esta versión: partir de ella y probar la siguiente
+                index = json.loads(self.storage.get(self.version_path(version)))
+                continue
+            self._publish(new)
+            return new
+        raise RuntimeError(f"Could not update checkpoint index for '{self.run}' after {attempts} attempts")
+
+    def _publish(self, index: Dict[str, Any]) -> None:
+        """
+        Move the pointer to index (or a newer version) and prune old versions.
+
+        The put is not conditional, so a writer holding an older version can
+        overwrite a newer pointer. After each put the next version is checked:
+        if it exists, its writer may have lost the race, and the pointer is
+        rewritten with it. The last writer to put has therefore seen every
+        version created before its check, and later versions are published by
+        their own writers.
+        """
+        try:
+            current = json.loads(self.storage.get(self.pointer_path))["version"]
+        except FileNotFoundError:
+            current = 0
+        if current >= index["version"]:
+            # Ya lo movió un escritor más nuevo, que también poda
+            return
+        while True:
+            self.storage.put(self.pointer_path, json.dumps(index, indent=2).encode("utf-8"), "application/json")
+            newer = self._newer(index)
+            if newer is index:
+                break
+            index = newer
+        # Podar las versiones que este movimiento del puntero dejó atrás
+        old = range(max(1, current + 1 - KEEP_VERSIONS), index["version"] - KEEP_VERSIONS + 1)
+        if old:
+            self.storage.delete([self.version_path(v) for v in old])
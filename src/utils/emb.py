@@ -1,8 +1,19 @@
+from functools import lru_cache
 from openai import OpenAI
 from ..config import cfg
 
-client = OpenAI(api_key=cfg.openai_key)
+EMBED_MODEL = "text-embedding-3-small"
+
+@lru_cache(maxsize=1)
+def get_openai():
+    # Creado al primer uso: importar este módulo no requiere OPENAI_API_KEY
+    return OpenAI(api_key=cfg.openai_key)
 
 def embed(text:str)->list[float]:
-    r = client.embeddings.create(model="text-embedding-3-small", input=text)
-    return r.data[0].embedding
\ No newline at end of file
+    r = get_openai().embeddings.create(model=EMBED_MODEL, input=text)
+    return r.data[0].embedding
+
+def embed_batch(texts:list[str])->list[list[float]]:
+    # Una sola llamada para todo el lote; la API devuelve los vectores con su índice
+    r = get_openai().embeddings.create(model=EMBED_MODEL, input=texts)
+    return [d.embedding for d in sorted(r.data, key=lambda d: d.index)]
\ No newline at end of file
@@ -12,6 +12,13 @@ def basename(p):
     
 def read_jsonl(p):
     return [json.loads(x) for x in open(p,encoding="utf-8")]
+
+def iter_jsonl(p):
+    # Una fila a la vez: memoria constante sin importar el tamaño del archivo
+    with open(p,encoding="utf-8") as f:
+        for x in f:
+            if x.strip():
+                yield json.loads(x)
     
 def write_jsonl(p,rows):
     with open(p,"w",encoding="utf-8") as f:
@@ -0,0 +1,57 @@
+"""
+Lightweight progress and throughput reporting.
+"""
+
+import threading
+import time
+from typing import Optional
+
+class Progress:
+    """Thread-safe counter that periodically prints progress and throughput."""
+
+    def __init__(self, total: Optional[int], label: str, unit: str = "rows", every: float = 5.0):
+        """
+        Initialize progress reporter.
+
+        Args:
+            total: Expected number of items (None if unknown)
+            label: Name shown in the report
+            unit: Unit shown in the report
+            every: Minimum seconds between reports
+        """
+        self.total = total
+        self.label = label
+        self.unit = unit
+        self.every = every
+        self.done = 0
+        self.started = time.perf_counter()
+        self._last_report = self.started
+        self._lock = threading.Lock()
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    @property
+    def rate(self) -> float:
+        elapsed = self.elapsed
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def update(self, n: int = 1) -> None:
+        """Record n finished items and report if enough time has passed."""
+        with self._lock:
+            self.done += n
+            now = time.perf_counter()
+            if now - self._last_report < self.every:
+                return
+            self._last_report = now
+        self.report()
+
+    def report(self) -> None:
+        total = f"/{self.total}" if self.total is not None else ""
+        print(f"⏱️ {self.label}: {self.done}{total} {self.unit} "
+              f"({self.rate:.1f} {self.unit}/s, {self.elapsed:.1f}s)")
+
+    def close(self) -> None:
+        """Print the final report."""
+        self.report()
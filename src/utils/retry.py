@@ -0,0 +1,55 @@
+"""
+Retry helpers with jittered exponential backoff.
+"""
+
+import random
+import time
+from typing import Any, Callable, Optional, Tuple, Type
+
+def backoff_delay(attempt: int, base_delay: float = 0.5, max_delay: float = 30.0) -> float:
+    """
+    Full-jitter exponential backoff delay.
+
+    Args:
+        attempt: Zero-based retry attempt
+        base_delay: Delay scale in seconds
+        max_delay: Upper bound in seconds
+
+    Returns:
+        Seconds to sleep before the next attempt
+    """
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+def retry_call(fn: Callable[..., Any], *args: Any,
+               attempts: int = 5,
+               base_delay: float = 0.5,
+               max_delay: float = 30.0,
+               retry_on: Tuple[Type[BaseException], ...] = (Exception,),
+               on_retry: Optional[Callable[[int, BaseException], None]] = None,
+               **kwargs: Any) -> Any:
+    """
+    Call a function, retrying on failure.
+
+    Args:
+        fn: Function to call
+        attempts: Total number of attempts
+        base_delay: Backoff scale in seconds
+        max_delay: Maximum backoff in seconds
+        retry_on: Exception types that trigger a retry
+        on_retry: Optional callback invoked with (attempt, error) before sleeping
+
+    Returns:
+        Return value of fn
+
+    Raises:
+        The last error once all attempts are exhausted
+    """
+    for attempt in range(attempts):
+        try:
+            return fn(*args, **kwargs)
+        except retry_on as e:
+            if attempt == attempts - 1:
+                raise
+            if on_retry:
+                on_retry(attempt + 1, e)
+            time.sleep(backoff_delay(attempt, base_delay, max_delay))
@@ -0,0 +1,162 @@
+"""
+Similarity search over the embedded corpus.
+
+Queries run inside Postgres through the ``match_verses`` / ``match_refs``
+functions created by scripts/setup_supabase.py, so only the top-k rows cross
+the network. Only verse search degrades gracefully: ``search_verses`` falls
+back to the local pickle searcher (``EmbeddingGenerator.search_similar_verses``)
+when the database is not reachable or the functions are missing. There is no
+local copy of the reference-work embeddings, so ``match_refs`` has no fallback
+and raises when the database is unavailable. ``refs_for_verse`` skips vector
+search entirely: it reads the chunks citing a verse from the verse index built
+at ingest time.
+"""
+
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+from ..config import cfg
+from .emb import embed
+from .supa import get_client
+from .verse_index import VerseIndex
+
+REFS_BATCH = 50   # claves por consulta: URL acotada y muy por debajo del tope de 1000 filas de PostgREST
+
+def _rpc(fn: str, params: Dict[str, Any], client=None) -> List[Dict[str, Any]]:
+    client = client or get_client()
+    return client.rpc(fn, params).execute().data or []
+
+def match_verses(query: str, top_k: int = 10, book: Optional[str] = None, chapter: Optional[int] = None,
+                 min_similarity: float = 0.0, query_embedding: Optional[List[float]] = None,
+                 client=None) -> List[Dict[str, Any]]:
+    """
+    Top-k verses by cosine similarity, computed in the database.
+
+    Args:
+        query: Search text (ignored when query_embedding is given)
+        top_k: Number of rows to return
+        book: Only verses from this book
+        chapter: Only verses from this chapter
+        min_similarity: Drop rows below this cosine similarity
+        query_embedding: Precomputed query vector
+        client: Supabase client (defaults to the shared one)
+
+    Returns:
+        Rows with id, book, chapter, verse, text and similarity, best first
+    """
+    return _rpc("match_verses", {
+        "query_embedding": query_embedding or embed(query),
+        "match_count": top_k,
+        "min_similarity": min_similarity,
+        "filter_book": book,
+        "filter_chapter": chapter,
+    }, client)
+
+def match_refs(query: str, top_k: int = 10, work: Optional[str] = None, ref_key: Optional[str] = None,
+               min_similarity: float = 0.0, query_embedding: Optional[List[float]] = None,
+               client=None) -> List[Dict[str, Any]]:
+    """
+    Top-k reference-work chunks by cosine similarity, computed in the database.
+
+    Args:
+        query: Search text (ignored when query_embedding is given)
+        top_k: Number of rows to return
+        work: Only chunks from this work
+        ref_key: Only chunks attached to this reference key
+        min_similarity: Drop rows below this cosine similarity
+        query_embedding: Precomputed query vector
+        client: Supabase client (defaults to the shared one)
+
+    Returns:
+        Rows with id, work, ref_key, seq, content and similarity, best first
+
+    Raises:
+        Exception: The client's error when the database or the function is unavailable (no local fallback)
+    """
+    return _rpc("match_refs", {
+        "query_embedding": query_embedding or embed(query),
+        "match_count": top_k,
+        "min_similarity": min_similarity,
+        "filter_work": work,
+        "filter_ref_key": ref_key,
+    }, client)
+
+@lru_cache(maxsize=1)
+def _local_searcher():
+    from ..ingest.create_embeddings import EmbeddingGenerator
+    return EmbeddingGenerator()
+
+def _local_verses(query: str, top_k: int, book: Optional[str], chapter: Optional[int],
+                  min_similarity: float) -> List[Dict[str, Any]]:
+    filtered = book is not None or chapter is not None
+    # Con filtros se puntúa todo el corpus y se filtra después
+    hits = _local_searcher().search_similar_verses(query, top_k=None if filtered else top_k)
+    rows = []
+    for h in hits:
+        v = h["verse"]
+        if (book is not None and v.book != book) or (chapter is not None and v.chapter != chapter):
+            continue
+        if h["similarity"] < min_similarity:
+            break
+        rows.append({"id": None, "book": v.book, "chapter": v.chapter, "verse": v.verse,
+                     "text": v.text, "similarity": float(h["similarity"])})
+        if len(rows) == top_k:
+            break
+    return rows
+
+def search_verses(query: str, top_k: int = 10, book: Optional[str] = None, chapter: Optional[int] = None,
+                  min_similarity: float = 0.0, client=None) -> List[Dict[str, Any]]:
+    """
+    Top-k similar verses: database RPC first, local embeddings file as fallback.
+
+    Args:
+        query: Search text
+        top_k: Number of rows to return
+        book: Only verses from this book
+        chapter: Only verses from this chapter
+        min_similarity: Drop rows below this cosine similarity
+        client: Supabase client (defaults to the shared one)
+
+    Returns:
+        Rows with book, chapter, verse, text and similarity, best first
+    """
+    try:
+        return match_verses(query, top_k, book, chapter, min_similarity, client=client)
+    except Exception as e:
+        print(f"⚠️ match_verses RPC unavailable ({e}); using local embeddings")
+    return _local_verses(query, top_k, book, chapter, min_similarity)
+
+@lru_cache(maxsize=4)
+def _verse_index(prefix: str) -> VerseIndex:
+    return VerseIndex(prefix)
+
+def _quoted(value: Any) -> str:
+    # Valor entre comillas para filtros or=(...) de PostgREST: ref_key puede traer comas, puntos o paréntesis
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+def refs_for_verse(reference: str, index_prefix: Optional[str] = None, client=None) -> List[Dict[str, Any]]:
+    """
+    Commentary chunks that cite a verse, from the ingest-time verse index.
+
+    Only the indexed (work, ref_key, seq) rows are fetched, REFS_BATCH keys
+    per query, so every batch fits in one PostgREST response.
+
+    Args:
+        reference: Verse reference ("Juan 3:16", "Jn 3,16")
+        index_prefix: Verse index prefix (defaults to cfg.verse_index)
+        client: Supabase client (defaults to the shared one)
+
+    Returns:
+        bible_refs rows (id, work, ref_key, seq, content) in index order
+    """
+    keys = [(k["work"], k["ref_key"], k["seq"]) for k in _verse_index(index_prefix or cfg.verse_index).chunks(reference)]
+    if not keys:
+        return []
+    client = client or get_client()
+    found = {}
+    for i in range(0, len(keys), REFS_BATCH):
+        cond = ",".join(f"and(work.eq.{_quoted(w)},ref_key.eq.{_quoted(r)},seq.eq.{int(q)})"
+                        for w, r, q in keys[i:i + REFS_BATCH])
+        data = client.table("bible_refs").select("id,work,ref_key,seq,content").or_(cond).execute().data or []
+        found.update(((r["work"], r["ref_key"], r["seq"]), r) for r in data)
+    return [found[k] for k in keys if k in found]
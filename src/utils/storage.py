@@ -0,0 +1,482 @@
+"""
+Object storage backends for checkpoints and data files.
+
+``Storage`` is the interface the rest of the project talks to. Backends:
+
+- ``SupabaseStorage``: a Supabase Storage bucket
+- ``LocalStorage``: a directory (offline runs, NFS caches, benchmarks)
+- ``CachedStorage``: read-through local disk cache with size-based LRU
+  eviction in front of another backend
+"""
+
+import errno
+import hashlib
+import os
+import shutil
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple, Union
+from urllib.parse import quote
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+    fcntl = None
+
+CHUNK_SIZE = 1024 * 1024
+
+Payload = Union[bytes, bytearray, memoryview, str, Path, BinaryIO]
+
+class Storage(ABC):
+    """Minimal object-store interface (paths are bucket-relative, '/'-separated)."""
+
+    kind = "abstract"
+
+    @abstractmethod
+    def put(self, path: str, data: Payload, content_type: str = "application/octet-stream",
+            overwrite: bool = True) -> None:
+        """
+        Create or overwrite an object from bytes, a local file path or a file object.
+
+        With overwrite=False the write is create-only and raises FileExistsError
+        if the object already exists (used for optimistic versioning).
+        """
+
+    @abstractmethod
+    def stream(self, path: str, start: int = 0, end: Optional[int] = None, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        """Yield bytes [start, end) of an object in chunks."""
+
+    @abstractmethod
+    def list(self, prefix: str = "") -> List[Dict[str, Any]]:
+        """List the direct children of a folder as dicts with name, size and updated_at (size None for folders)."""
+
+    @abstractmethod
+    def size(self, path: str) -> int:
+        """Size of an object in bytes."""
+
+    @abstractmethod
+    def delete(self, paths: List[str]) -> None:
+        """Delete objects (missing paths are ignored)."""
+
+    def get(self, path: str) -> bytes:
+        """Read a whole object."""
+        return b"".join(self.stream(path))
+
+    def get_range(self, path: str, start: int, end: int) -> bytes:
+        """Read bytes [start, end) of an object."""
+        return b"".join(self.stream(path, start, end))
+
+    def get_if_changed(self, path: str, etag: Optional[str] = None) -> Tuple[Optional[bytes], str]:
+        """
+        Conditional read for small, frequently polled objects.
+
+        Args:
+            path: Object path
+            etag: ETag from a previous read
+
+        Returns:
+            Tuple of (content, or None if unchanged since etag; current ETag)
+        """
+        data = self.get(path)
+        tag = f'"{hashlib.md5(data).hexdigest()}"'
+        return (None, tag) if tag == etag else (data, tag)
+
+    def exists(self, path: str) -> bool:
+        try:
+            self.size(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+class LocalStorage(Storage):
+    """Directory-backed object store; writes are atomic (temp file + rename)."""
+
+    kind = "local"
+
+    def __init__(self, root: str):
+        """
+        Initialize local storage.
+
+        Args:
+            root: Directory that holds the objects
+        """
+        self.root = Path(root).resolve()
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def __repr__(self) -> str:
+        return f"LocalStorage({self.root})"
+
+    def _path(self, path: str) -> Path:
+        p = (self.root / path.lstrip("/")).resolve()
+        if self.root not in p.parents and p != self.root:
+            raise ValueError(f"Path escapes storage root: {path}")
+        return p
+
+    def put(self, path: str, data: Payload, content_type: str = "application/octet-stream",
+            overwrite: bool = True) -> None:
+        dest = self._path(path)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_name(f".{dest.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            if isinstance(data, (bytes, bytearray, memoryview)):
+                tmp.write_bytes(data)
+            elif isinstance(data, (str, Path)):
+                shutil.copyfile(data, tmp)
+            else:
+                with open(tmp, "wb") as out:
+                    shutil.copyfileobj(data, out, CHUNK_SIZE)
+            if overwrite:
+                os.replace(tmp, dest)
+            else:
+                os.link(tmp, dest)  # atómico: falla con FileExistsError si ya existe
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+
+    def stream(self, path: str, start: int = 0, end: Optional[int] = None, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        p = self._path(path)
+        if not p.is_file():
+            raise FileNotFoundError(f"Object not found: {path}")
+        with open(p, "rb") as f:
+            f.seek(start)
+            remaining = None if end is None else end - start
+            while remaining is None or remaining > 0:
+                chunk = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+                if not chunk:
+                    return
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def list(self, prefix: str = "") -> List[Dict[str, Any]]:
+        folder = self._path(prefix)
+        if not folder.is_dir():
+            return []
+        entries = []
+        for child in sorted(folder.iterdir(), key=lambda c: c.name):
+            if child.name.startswith("."):
+                continue
+            if child.is_dir():
+                entries.append({"name": child.name, "size": None, "updated_at": None})
+            else:
+                st = child.stat()
+                stamp = datetime.fromtimestamp(st.st_mtime, tz=timezone.utc).isoformat()
+                entries.append({"name": child.name, "size": st.st_size, "updated_at": stamp})
+        return entries
+
+    def size(self, path: str) -> int:
+        p = self._path(path)
+        if not p.is_file():
+            raise FileNotFoundError(f"Object not found: {path}")
+        return p.stat().st_size
+
+    def get_if_changed(self, path: str, etag: Optional[str] = None) -> Tuple[Optional[bytes], str]:
+        p = self._path(path)
+        if not p.is_file():
+            raise FileNotFoundError(f"Object not found: {path}")
+        st = p.stat()
+        tag = f'"{st.st_ino:x}-{st.st_mtime_ns:x}-{st.st_size:x}"'
+        return (None, tag) if tag == etag else (p.read_bytes(), tag)
+
+    def delete(self, paths: List[str]) -> None:
+        for path in paths:
+            p = self._path(path)
+            if p.is_file():
+                p.unlink()
+
+def _not_found(e: Exception) -> bool:
+    return str(getattr(e, "status", "")) in ("400", "404")
+
+def _payload_size(data: Payload) -> Optional[int]:
+    # Bytes por leer de un archivo o file object; None si no se puede saber sin leerlo
+    if isinstance(data, (str, Path)):
+        return os.path.getsize(data)
+    try:
+        return os.fstat(data.fileno()).st_size - data.tell()
+    except (AttributeError, OSError, ValueError):
+        pass
+    try:
+        if data.seekable():
+            pos = data.tell()
+            end = data.seek(0, os.SEEK_END)
+            data.seek(pos)
+            return end - pos
+    except (AttributeError, OSError, ValueError):
+        pass
+    return None
+
+class SupabaseStorage(Storage):
+    """Supabase Storage bucket, using the shared pooled client."""
+
+    kind = "supabase"
+    LIST_PAGE = 1000
+    SIGNED_URL_TTL = 3600
+
+    def __init__(self, bucket: str):
+        """
+        Initialize Supabase storage.
+
+        Args:
+            bucket: Bucket name
+        """
+        self.bucket = bucket
+
+    def __repr__(self) -> str:
+        return f"SupabaseStorage({self.bucket})"
+
+    @property
+    def _api(self):
+        from .supa import get_client
+        return get_client().storage.from_(self.bucket)
+
+    def put(self, path: str, data: Payload, content_type: str = "application/octet-stream",
+            overwrite: bool = True) -> None:
+        """
+        Create or overwrite an object (see Storage.put).
+
+        Files and file objects over one part (supa.PART_SIZE), or of unknown
+        size, are not read into memory: they are uploaded as parts plus a
+        manifest (supa.upload_chunked / upload_stream), which supa.iter_ckpt
+        and download_ckpt read back.
+        """
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            from . import supa
+            size = _payload_size(data)
+            if size is None or size > supa.PART_SIZE:
+                return self._put_parts(path, data, overwrite)
+        options = {"content-type": content_type, "upsert": "true" if overwrite else "false"}
+        try:
+            if isinstance(data, (bytes, bytearray, memoryview)):
+                self._api.upload(path, bytes(data), options)
+            elif isinstance(data, (str, Path)):
+                with open(data, "rb") as f:
+                    self._api.upload(path, f, options)
+            else:
+                self._api.upload(path, data.read(), options)
+        except Exception as e:
+            # Sin upsert, Storage responde 409 "Duplicate" si el objeto ya existe
+            if not overwrite and str(getattr(e, "status", "")) in ("400", "409") and "uplicate" in str(e):
+                raise FileExistsError(f"Object exists: {self.bucket}/{path}") from e
+            raise
+
+    def _put_parts(self, path: str, data: Payload, overwrite: bool) -> None:
+        from . import supa
+        # Sin escritura condicional para un objeto en partes: create-only solo comprueba antes de subir
+        if not overwrite and self.exists(supa.manifest_path(path)):
+            raise FileExistsError(f"Object exists: {self.bucket}/{path}")
+        if isinstance(data, (str, Path)):
+            supa.upload_chunked(str(data), path, self, part_size=supa.PART_SIZE)
+        else:
+            supa.upload_stream(data, path, self, part_size=supa.PART_SIZE)
+
+    def stream(self, path: str, start: int = 0, end: Optional[int] = None, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        from .supa import _http_pool
+
+        # URL firmada + GET en streaming con Range: nunca se carga el objeto entero
+        try:
+            signed = self._api.create_signed_url(path, self.SIGNED_URL_TTL)
+        except Exception as e:
+            if _not_found(e):
+                raise FileNotFoundError(f"Object not found: {self.bucket}/{path}") from e
+            raise
+        url = signed.get("signedURL") or signed.get("signedUrl")
+        headers = {"Range": f"bytes={start}-{'' if end is None else end - 1}"} if (start or end is not None) else {}
+        with _http_pool().stream("GET", url, headers=headers) as r:
+            if r.status_code in (400, 404):
+                raise FileNotFoundError(f"Object not found: {self.bucket}/{path}")
+            r.raise_for_status()
+            # Un servidor que ignora Range responde 200 con el objeto entero
+            pos = start if r.status_code == 206 else 0
+            for chunk in r.iter_bytes(chunk_size):
+                lo, hi = max(start - pos, 0), len(chunk) if end is None else min(len(chunk), end - pos)
+                pos += len(chunk)
+                if lo < hi:
+                    yield chunk[lo:hi]
+                if end is not None and pos >= end:
+                    return
+
+    def get(self, path: str) -> bytes:
+        try:
+            return self._api.download(path)
+        except Exception as e:
+            if _not_found(e):
+                raise FileNotFoundError(f"Object not found: {self.bucket}/{path}") from e
+            raise
+
+    def get_if_changed(self, path: str, etag: Optional[str] = None) -> Tuple[Optional[bytes], str]:
+        from ..config import cfg
+        from .supa import _http_pool
+
+        # GET autenticado con If-None-Match contra la API REST pública: si no cambió, 304 sin cuerpo
+        url = f"{cfg.supabase_url.rstrip('/')}/storage/v1/object/authenticated/{quote(self.bucket)}/{quote(path)}"
+        headers = {"Authorization": f"Bearer {cfg.supabase_service}", "apikey": cfg.supabase_service}
+        if etag:
+            headers["If-None-Match"] = etag
+        r = _http_pool().get(url, headers=headers)
+        if r.status_code == 304:
+            return None, etag
+        if r.status_code in (400, 404):
+            raise FileNotFoundError(f"Object not found: {self.bucket}/{path}")
+        r.raise_for_status()
+        return r.content, r.headers.get("ETag") or f'"{hashlib.md5(r.content).hexdigest()}"'
+
+    def list(self, prefix: str = "") -> List[Dict[str, Any]]:
+        out, offset = [], 0
+        while True:
+            page = self._api.list(prefix, {"limit": self.LIST_PAGE, "offset": offset})
+            for e in page:
+                meta = e.get("metadata")
+                out.append({
+                    "name": e["name"],
+                    "size": meta.get("size") if meta else None,
+                    "updated_at": e.get("updated_at") or e.get("created_at"),
+                })
+            if len(page) < self.LIST_PAGE:
+                return out
+            offset += self.LIST_PAGE
+
+    def size(self, path: str) -> int:
+        try:
+            info = self._api.info(path)
+        except Exception as e:
+            if _not_found(e):
+                raise FileNotFoundError(f"Object not found: {self.bucket}/{path}") from e
+            raise
+        return int(info.get("size") or (info.get("metadata") or {}).get("size") or 0)
+
+    def delete(self, paths: List[str]) -> None:
+        if paths:
+            self._api.remove(paths)
+
+class CachedStorage(Storage):
+    """
+    Read-through disk cache in front of another backend.
+
+    Reads of cacheable paths (whole or ranged) fetch the full object into
+    ``cache_dir`` once and are served from disk afterwards; least-recently-used files are evicted once the cache
+    exceeds ``max_bytes``. Several processes can share one cache directory:
+    fills are serialized per object with a lock file and published by rename.
+    By default JSON objects (manifests, indexes) are not cached because they
+    are updated in place; content-addressed parts and archives are.
+    """
+
+    def __init__(self, remote: Storage, cache_dir: str, max_bytes: int,
+                 cacheable: Optional[Callable[[str], bool]] = None):
+        """
+        Initialize cached storage.
+
+        Args:
+            remote: Backend that holds the objects
+            cache_dir: Local cache directory
+            max_bytes: Cache size limit in bytes
+            cacheable: Predicate deciding which paths are cached
+        """
+        self.remote = remote
+        self.cache = LocalStorage(cache_dir)
+        self.max_bytes = max_bytes
+        self.cacheable = cacheable or (lambda p: not p.endswith(".json"))
+        self.kind = remote.kind
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self) -> str:
+        return f"CachedStorage({self.remote!r}, {self.cache.root})"
+
+    def _fill(self, path: str) -> Path:
+        """Ensure path is in the cache and return its local file."""
+        local = self.cache._path(path)
+        if local.is_file():
+            self.hits += 1
+            os.utime(local)  # marca de uso para el LRU
+            return local
+
+        local.parent.mkdir(parents=True, exist_ok=True)
+        lock_path = local.with_name(f".{local.name}.lock")
+        with open(lock_path, "w") as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if local.is_file():  # otro proceso lo descargó mientras esperábamos
+                    self.hits += 1
+                    os.utime(local)
+                    return local
+                self.misses += 1
+                tmp = local.with_name(f".{local.name}.{uuid.uuid4().hex}.tmp")
+                try:
+                    with open(tmp, "wb") as out:
+                        for chunk in self.remote.stream(path):
+                            out.write(chunk)
+                    os.replace(tmp, local)
+                finally:
+                    if tmp.exists():
+                        tmp.unlink()
+            finally:
+                if fcntl:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+        self.evict(keep=local)
+        return local
+
+    def evict(self, keep: Optional[Path] = None) -> int:
+        """Delete least-recently-used cache files until under max_bytes; returns bytes freed."""
+        files = []
+        for dirpath, _, names in os.walk(self.cache.root):
+            for n in names:
+                if n.startswith("."):
+                    continue
+                p = Path(dirpath) / n
+                try:
+                    st = p.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((st.st_mtime, st.st_size, p))
+        total = sum(f[1] for f in files)
+        freed = 0
+        for _, size, p in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if p == keep:
+                continue
+            try:
+                p.unlink()
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+            total -= size
+            freed += size
+        return freed
+
+    def put(self, path: str, data: Payload, content_type: str = "application/octet-stream",
+            overwrite: bool = True) -> None:
+        self.remote.put(path, data, content_type, overwrite)
+        self.cache.delete([path])
+
+    def stream(self, path: str, start: int = 0, end: Optional[int] = None, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        if not self.cacheable(path):
+            yield from self.remote.stream(path, start, end, chunk_size)
+            return
+        # Rangos incluidos: se trae el objeto entero una vez y se sirve desde disco
+        self._fill(path)
+        yield from self.cache.stream(path, start, end, chunk_size)
+
+    def get(self, path: str) -> bytes:
+        if not self.cacheable(path):
+            return self.remote.get(path)
+        return self._fill(path).read_bytes()
+
+    def get_if_changed(self, path: str, etag: Optional[str] = None) -> Tuple[Optional[bytes], str]:
+        return self.remote.get_if_changed(path, etag)
+
+    def list(self, prefix: str = "") -> List[Dict[str, Any]]:
+        return self.remote.list(prefix)
+
+    def size(self, path: str) -> int:
+        local = self.cache._path(path)
+        if self.cacheable(path) and local.is_file():
+            return local.stat().st_size
+        return self.remote.size(path)
+
+    def delete(self, paths: List[str]) -> None:
+        self.remote.delete(paths)
+        self.cache.delete(paths)
@@ -1,23 +1,310 @@
-from supabase import create_client
+import httpx
 from . import io_utils
+from .chunk_store import SNAPSHOT_SUFFIX, ChunkStore
+from .ckpt_index import CheckpointIndex
+from .progress import Progress
+from .retry import backoff_delay, retry_call
+from .storage import CachedStorage, LocalStorage, Storage, SupabaseStorage
 from ..config import cfg
 import os
+import io
 import json
+import hashlib
+import tarfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
-# Create Supabase client
-sb = create_client(cfg.supabase_url, cfg.supabase_service)
+PART_SIZE = 16 * 1024 * 1024   # bytes por parte en subidas por partes
+UPLOAD_WORKERS = 4             # partes subiéndose en paralelo
+STREAM_CHUNK = 1024 * 1024     # bytes por lectura en descargas en streaming
 
-def upload_ckpt(local_path: str, prefix: str = "", bucket: str = None):
-    """Upload checkpoint to Supabase Storage with detailed logging"""
+# Clientes por (url, key), creados al primer uso y compartidos por todo el proceso
+_clients = {}
+_storages = {}
+_clients_lock = threading.RLock()
+_http = None
+
+class RetryTransport(httpx.BaseTransport):
+    """httpx transport that retries transient failures with jittered backoff."""
+
+    RETRY_STATUS = {408, 425, 429, 502, 503, 504}
+    IDEMPOTENT = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+    def __init__(self, transport, attempts: int = 5, base_delay: float = 0.5, max_delay: float = 20.0):
+        self._transport = transport
+        self.attempts = max(1, attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def handle_request(self, request):
+        # Cuerpos en streaming (p.ej. archivos grandes) no se pueden reenviar
+        replayable = isinstance(request.stream, httpx.ByteStream)
+        last = self.attempts - 1
+        for attempt in range(self.attempts):
+            try:
+                response = self._transport.handle_request(request)
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout, httpx.RemoteProtocolError):
+                if not replayable or attempt == last:
+                    raise
+                time.sleep(backoff_delay(attempt, self.base_delay, self.max_delay))
+                continue
+            except httpx.ReadTimeout:
+                # El servidor pudo haber aplicado la petición: solo se repiten las idempotentes
+                if not replayable or attempt == last or request.method not in self.IDEMPOTENT:
+                    raise
+                time.sleep(backoff_delay(attempt, self.base_delay, self.max_delay))
+                continue
+
+            if response.status_code not in self.RETRY_STATUS or not replayable or attempt == last:
+                return response
+            response.close()
+            retry_after = response.headers.get("Retry-After", "")
+            delay = float(retry_after) if retry_after.isdigit() else backoff_delay(attempt, self.base_delay, self.max_delay)
+            time.sleep(min(delay, self.max_delay))
+
+    def close(self):
+        self._transport.close()
+
+def _http_pool() -> httpx.Client:
+    """The pooled httpx client (also used for signed-URL downloads)."""
+    global _http
+    if _http is None:
+        with _clients_lock:
+            if _http is None:
+                timeout = httpx.Timeout(cfg.supabase_timeout, connect=min(10.0, cfg.supabase_timeout))
+                limits = httpx.Limits(max_connections=cfg.supabase_pool_size,
+                                      max_keepalive_connections=cfg.supabase_pool_size,
+                                      keepalive_expiry=60.0)
+                transport = RetryTransport(httpx.HTTPTransport(limits=limits), attempts=cfg.supabase_retries)
+                _http = httpx.Client(timeout=timeout, limits=limits, transport=transport, follow_redirects=True)
+    return _http
+
+def _build_client(url: str, key: str):
+    from supabase import create_client, ClientOptions
+
+    try:
+        options = ClientOptions(httpx_client=_http_pool())
+    except TypeError:
+        # supabase-py sin soporte para httpx_client: al menos aplicar los timeouts
+        options = ClientOptions(postgrest_client_timeout=cfg.supabase_timeout,
+                                storage_client_timeout=int(cfg.supabase_timeout))
+    return create_client(url, key, options)
+
+def get_client(url: str = None, key: str = None):
+    """
+    Shared Supabase client, created on first use.
+
+    All callers reuse one HTTP connection pool (keep-alive) with the timeouts
+    and retry policy from cfg, so importing this module costs nothing and
+    works without credentials.
+
+    Args:
+        url: Supabase URL (defaults to cfg.supabase_url)
+        key: Service role key (defaults to cfg.supabase_service)
+
+    Returns:
+        supabase Client
+    """
+    url = url or cfg.supabase_url
+    key = key or cfg.supabase_service
+    client = _clients.get((url, key))
+    if client is None:
+        with _clients_lock:
+            client = _clients.get((url, key))
+            if client is None:
+                if not url or not key:
+                    raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set")
+                client = _clients[(url, key)] = _build_client(url, key)
+    return client
+
+def get_storage(bucket=None) -> Storage:
+    """
+    Storage backend for a bucket, created on first use.
+
+    cfg.storage_backend selects Supabase Storage or a local directory
+    (STORAGE_LOCAL_ROOT/<bucket>); with CKPT_CACHE_DIR set, reads go through a
+    shared on-disk LRU cache. Storage instances are returned unchanged.
+
+    Args:
+        bucket: Bucket name or Storage instance (defaults to cfg.bucket_ckpt)
+
+    Returns:
+        Storage
+    """
+    if isinstance(bucket, Storage):
+        return bucket
+    bucket = bucket or cfg.bucket_ckpt
+    storage = _storages.get(bucket)
+    if storage is None:
+        with _clients_lock:
+            storage = _storages.get(bucket)
+            if storage is None:
+                if cfg.storage_backend == "local":
+                    storage = LocalStorage(os.path.join(cfg.storage_local_root, bucket))
+                elif cfg.storage_backend == "supabase":
+                    storage = SupabaseStorage(bucket)
+                else:
+                    raise ValueError(f"Unknown STORAGE_BACKEND: {cfg.storage_backend}")
+                if cfg.ckpt_cache_dir:
+                    storage = CachedStorage(storage, os.path.join(cfg.ckpt_cache_dir, bucket),
+                                            int(cfg.ckpt_cache_gb * 1024**3))
+                _storages[bucket] = storage
+    return storage
+
+def _read_part(local_path: str, index: int, part_size: int) -> bytes:
+    with open(local_path, "rb") as f:
+        f.seek(index * part_size)
+        return f.read(part_size)
+
+def manifest_path(remote_path: str) -> str:
+    return f"{remote_path}.manifest.json"
+
+def upload_chunked(local_path: str, remote_path: str, bucket=None,
+                   part_size: int = PART_SIZE, workers: int = UPLOAD_WORKERS):
+    """
+    Upload a file as fixed-size parts plus a manifest that assembles them.
+
+    Parts are stored as ``<remote_path>.parts/<index>.<sha256>`` so a retried
+    upload skips every part already present with the same checksum and size.
+    The manifest is written last; an object without one is incomplete.
+
+    Args:
+        local_path: File to upload
+        remote_path: Object path of the assembled file
+        bucket: Bucket name or Storage (defaults to cfg.bucket_ckpt)
+        part_size: Bytes per part
+        workers: Parts uploaded in parallel
+
+    Returns:
+        Manifest dictionary
+    """
+    storage = get_storage(bucket)
+    size = os.path.getsize(local_path)
+    count = max(1, -(-size // part_size))
+    parts_dir = f"{remote_path}.parts"
+    existing = {e["name"]: e["size"] for e in storage.list(parts_dir)}
+    progress = Progress(count, f"upload {io_utils.basename(remote_path)}", unit="parts")
+    skipped = []
+
+    def put(index):
+        data = _read_part(local_path, index, part_size)
+        digest = hashlib.sha256(data).hexdigest()
+        name = f"{index:05d}.{digest}"
+        entry = {"index": index, "path": f"{parts_dir}/{name}", "size": len(data), "sha256": digest}
+        if existing.get(name) == len(data):
+            skipped.append(index)
+        else:
+            retry_call(storage.put, entry["path"], data,
+                       on_retry=lambda n, e: print(f"⚠️ Part {index} retry {n}: {e}"))
+        progress.update()
+        return entry
+
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        parts = list(ex.map(put, range(count)))
+    progress.close()
+    if skipped:
+        print(f"♻️ Resumed upload: {len(skipped)}/{count} parts already present")
+
+    manifest = {
+        "version": 1,
+        "filename": io_utils.basename(remote_path),
+        "size": size,
+        "part_size": part_size,
+        # Hash de los hashes de las partes: verificable sin releer el archivo en orden
+        "sha256": hashlib.sha256("".join(p["sha256"] for p in parts).encode()).hexdigest(),
+        "parts": parts,
+        "created": datetime.now().isoformat(),
+    }
+    retry_call(storage.put, manifest_path(remote_path), json.dumps(manifest, indent=2).encode("utf-8"),
+               "application/json")
+    return manifest
+
+def upload_stream(stream, remote_path: str, bucket=None,
+                  part_size: int = PART_SIZE, workers: int = UPLOAD_WORKERS):
+    """
+    Upload a stream of unknown length (e.g. an archive being compressed) as parts plus a manifest.
+
+    Parts are read sequentially and uploaded by a thread pool with at most
+    2 * workers parts in memory, so producing and uploading overlap and
+    nothing touches the local disk. Same layout and manifest as upload_chunked.
+
+    Args:
+        stream: Readable binary file object
+        remote_path: Object path of the assembled file
+        bucket: Bucket name or Storage (defaults to cfg.bucket_ckpt)
+        part_size: Bytes per part
+        workers: Parts uploaded in parallel
+
+    Returns:
+        Manifest dictionary
+    """
+    storage = get_storage(bucket)
+    parts_dir = f"{remote_path}.parts"
+    slots = threading.BoundedSemaphore(2 * max(1, workers))
+
+    def put(index, data):
+        try:
+            digest = hashlib.sha256(data).hexdigest()
+            entry = {"index": index, "path": f"{parts_dir}/{index:05d}.{digest}", "size": len(data), "sha256": digest}
+            retry_call(storage.put, entry["path"], data,
+                       on_retry=lambda n, e: print(f"⚠️ Part {index} retry {n}: {e}"))
+            return entry
+        finally:
+            slots.release()
+
+    futures = []
+    size = 0
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        while True:
+            data = stream.read(part_size)
+            # Una lectura de un pipe puede devolver menos: completar la parte
+            while data and len(data) < part_size:
+                more = stream.read(part_size - len(data))
+                if not more:
+                    break
+                data += more
+            if not data and futures:
+                break
+            slots.acquire()
+            futures.append(ex.submit(put, len(futures), data))
+            size += len(data)
+            if len(data) < part_size:
+                break
+        parts = [f.result() for f in futures]
+
+    manifest = {
+        "version": 1,
+        "filename": io_utils.basename(remote_path),
+        "size": size,
+        "part_size": part_size,
+        "sha256": hashlib.sha256("".join(p["sha256"] for p in parts).encode()).hexdigest(),
+        "parts": parts,
+        "created": datetime.now().isoformat(),
+    }
+    retry_call(storage.put, manifest_path(remote_path), json.dumps(manifest, indent=2).encode("utf-8"),
+               "application/json")
+    return manifest
+
+def read_manifest(remote_path: str, bucket=None):
+    """Return the chunked-upload manifest for remote_path, or None for plain objects."""
+    try:
+        return json.loads(get_storage(bucket).get(manifest_path(remote_path)))
+    except FileNotFoundError:
+        return None
+
+def upload_ckpt(local_path: str, prefix: str = "", bucket=None,
+                part_size: int = PART_SIZE, workers: int = UPLOAD_WORKERS,
+                step: int = None, metrics: dict = None):
+    """Upload checkpoint to storage (chunked, resumable) and record it in the run's index"""
     
-    if bucket is None:
-        bucket = cfg.bucket_ckpt
+    storage = get_storage(bucket)
     
     try:
-        print(f"📦 Uploading checkpoint to Supabase...")
+        print(f"📦 Uploading checkpoint to {storage.kind} storage...")
         print(f"   Local file: {local_path}")
-        print(f"   Bucket: {bucket}")
+        print(f"   Bucket: {storage}")
         
         # Check if file exists
         if not os.path.exists(local_path):
@@ -32,93 +319,337 @@ def upload_ckpt(local_path: str, prefix: str = "", bucket: str = None):
         remote_path = f"{prefix}{filename}" if prefix else filename
         print(f"   Remote path: {remote_path}")
         
-        # Upload file
-        with open(local_path, "rb") as f:
-            result = sb.storage.from_(bucket).upload(
-                path=remote_path,
-                file=f,
-                file_options={
-                    "content-type": "application/gzip",
-                    "upsert": True  # Overwrite if exists
-                }
-            )
-        
-        print(f"✅ Upload successful: {result}")
-        
-        # Save metadata
-        metadata = {
-            "filename": filename,
-            "remote_path": remote_path,
-            "bucket": bucket,
-            "file_size_bytes": file_size,
-            "upload_timestamp": datetime.now().isoformat(),
-            "local_path": local_path,
-            "run_prefix": prefix
+        # Upload file in parts
+        manifest = upload_chunked(local_path, remote_path, storage, part_size=part_size, workers=workers)
+        
+        print(f"✅ Upload successful: {len(manifest['parts'])} parts, sha256 {manifest['sha256'][:12]}")
+        
+        return _register_ckpt(storage, bucket, prefix, remote_path, manifest, step, metrics)
+        
+    except Exception as e:
+        print(f"❌ Upload failed: {str(e)}")
+        return {
+            "success": False,
+            "error": str(e)
         }
+
+def upload_ckpt_stream(stream, filename: str, prefix: str = "", bucket=None,
+                       part_size: int = PART_SIZE, workers: int = UPLOAD_WORKERS,
+                       step: int = None, metrics: dict = None):
+    """
+    Upload a checkpoint archive as it is produced (no local file) and record it in the run's index.
+
+    Args:
+        stream: Readable binary file object (e.g. the read end of a pipe)
+        filename: Object name under prefix
+        prefix: Run folder in the bucket (e.g. "<run_name>/")
+        bucket: Bucket name or Storage (defaults to cfg.bucket_ckpt)
+        part_size: Bytes per part
+        workers: Parts uploaded in parallel
+        step: Global step of the checkpoint
+        metrics: Metrics to record in the index
+
+    Returns:
+        Result dictionary like upload_ckpt
+    """
+    storage = get_storage(bucket)
+    
+    try:
+        remote_path = f"{prefix}{filename}" if prefix else filename
+        print(f"📦 Streaming checkpoint archive to {storage.kind} storage...")
+        print(f"   Remote path: {remote_path}")
         
-        # Save metadata to bucket
-        metadata_path = f"{prefix}metadata_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        metadata_content = json.dumps(metadata, indent=2).encode('utf-8')
+        t0 = time.perf_counter()
+        manifest = upload_stream(stream, remote_path, storage, part_size=part_size, workers=workers)
         
-        sb.storage.from_(bucket).upload(
-            path=metadata_path,
-            file=metadata_content,
-            file_options={
-                "content-type": "application/json",
-                "upsert": True
-            }
-        )
+        print(f"✅ Upload successful in {time.perf_counter() - t0:.1f}s: {manifest['size'] / (1024*1024):.2f} MB, "
+              f"{len(manifest['parts'])} parts, sha256 {manifest['sha256'][:12]}")
         
-        print(f"✅ Metadata saved: {metadata_path}")
+        return _register_ckpt(storage, bucket, prefix, remote_path, manifest, step, metrics)
         
-        # Log to Supabase table (if exists)
+    except Exception as e:
+        print(f"❌ Upload failed: {str(e)}")
+        return {
+            "success": False,
+            "error": str(e)
+        }
+
+def _register_ckpt(storage, bucket, prefix, remote_path, manifest, step, metrics):
+    """Record an uploaded archive in the run's index (and the Supabase table) and build the result."""
+    filename = io_utils.basename(remote_path)
+    
+    # Registrar en el índice del run (una sola lectura para encontrar el último)
+    index = CheckpointIndex(prefix, storage).add({
+        "path": remote_path,
+        "filename": filename,
+        "size": manifest["size"],
+        "sha256": manifest["sha256"],
+        "parts": len(manifest["parts"]),
+        "step": step,
+        "metrics": metrics or {},
+        "created": datetime.now().isoformat(),
+    })
+    
+    print(f"✅ Index updated: v{index['version']}, {len(index['checkpoints'])} checkpoints")
+    
+    # Log to Supabase table (if exists)
+    if storage.kind == "supabase":
         try:
-            sb.table("training_checkpoints").insert({
+            get_client().table("training_checkpoints").insert({
                 "run_name": cfg.run_name,
                 "filename": filename,
                 "remote_path": remote_path,
-                "bucket": bucket,
-                "file_size_bytes": file_size,
+                "bucket": bucket or cfg.bucket_ckpt,
+                "file_size_bytes": manifest["size"],
                 "model_type": "LoRA",
                 "status": "completed"
             }).execute()
             print("✅ Checkpoint logged to database")
         except Exception as e:
             print(f"⚠️ Database logging failed (table may not exist): {e}")
+    
+    return {
+        "success": True,
+        "remote_path": remote_path,
+        "bucket": str(storage),
+        "file_size": manifest["size"],
+        "sha256": manifest["sha256"]
+    }
+
+def upload_ckpt_dir(local_dir: str, prefix: str = "", bucket=None, workers: int = UPLOAD_WORKERS,
+                    step: int = None, metrics: dict = None):
+    """
+    Upload a checkpoint directory as a deduplicated snapshot and record it in the run's index.
+
+    Only chunks not already in the bucket are uploaded, so consecutive
+    checkpoints of a run cost roughly what changed between them.
+
+    Args:
+        local_dir: Checkpoint directory
+        prefix: Run folder in the bucket (e.g. "<run_name>/")
+        bucket: Bucket name or Storage (defaults to cfg.bucket_ckpt)
+        workers: Chunks uploaded in parallel
+        step: Global step of the checkpoint
+        metrics: Metrics to record in the index
+
+    Returns:
+        Result dictionary like upload_ckpt
+    """
+    storage = get_storage(bucket)
+    
+    try:
+        name = os.path.basename(os.path.normpath(local_dir))
+        remote_path = f"{prefix}{name}{SNAPSHOT_SUFFIX}"
+        print(f"📦 Uploading checkpoint snapshot to {storage.kind} storage...")
+        print(f"   Local dir: {local_dir}")
+        print(f"   Remote path: {remote_path}")
+        
+        t0 = time.perf_counter()
+        manifest = ChunkStore(storage, workers=workers).put_dir(local_dir, remote_path, {"step": step})
+        stats = manifest["stats"]
+        print(f"✅ Snapshot uploaded in {time.perf_counter() - t0:.1f}s: {stats['bytes'] / (1024*1024):.2f} MB, "
+              f"{stats['new_chunks']}/{stats['chunks']} new chunks, "
+              f"{stats['uploaded_bytes'] / (1024*1024):.2f} MB sent")
+        
+        CheckpointIndex(prefix, storage).add({
+            "path": remote_path,
+            "filename": name,
+            "format": "snapshot",
+            "size": manifest["size"],
+            "sha256": manifest["sha256"],
+            "parts": stats["chunks"],
+            "step": step,
+            "metrics": metrics or {},
+            "created": manifest["created"],
+        })
         
         return {
             "success": True,
             "remote_path": remote_path,
-            "bucket": bucket,
-            "file_size": file_size
+            "bucket": str(storage),
+            "file_size": manifest["size"],
+            "uploaded_bytes": stats["uploaded_bytes"],
+            "sha256": manifest["sha256"]
         }
         
     except Exception as e:
-        print(f"❌ Upload failed: {str(e)}")
+        print(f"❌ Snapshot upload failed: {str(e)}")
         return {
             "success": False,
             "error": str(e)
         }
 
-def download_ckpt(remote_path: str, local_path: str, bucket: str = None):
-    """Download checkpoint from Supabase Storage"""
+def _ranges(remote_path: str, storage: Storage, manifest):
+    """Byte ranges to fetch: one per part (with checksum) or fixed-size ranges for plain objects."""
+    if manifest is not None:
+        offset, out = 0, []
+        for p in manifest["parts"]:
+            out.append({"path": p["path"], "offset": offset, "start": 0, "end": p["size"], "sha256": p["sha256"]})
+            offset += p["size"]
+        return out, manifest["size"]
+    size = storage.size(remote_path)
+    return [{"path": remote_path, "offset": o, "start": o, "end": min(o + PART_SIZE, size), "sha256": None}
+            for o in range(0, size, PART_SIZE)], size
+
+def iter_ckpt(remote_path: str, bucket=None, chunk_size: int = STREAM_CHUNK):
+    """
+    Stream a checkpoint's bytes in order (plain or chunked upload).
+
+    Parts of chunked uploads are verified against their checksum as they stream.
+
+    Args:
+        remote_path: Object path
+        bucket: Bucket name or Storage
+        chunk_size: Bytes per yielded chunk
+
+    Yields:
+        Chunks of the checkpoint
+    """
+    storage = get_storage(bucket)
+    manifest = read_manifest(remote_path, storage)
+    if manifest is None:
+        yield from storage.stream(remote_path, chunk_size=chunk_size)
+        return
+    for part in manifest["parts"]:
+        h = hashlib.sha256()
+        for chunk in storage.stream(part["path"], chunk_size=chunk_size):
+            h.update(chunk)
+            yield chunk
+        if h.hexdigest() != part["sha256"]:
+            raise IOError(f"Checksum mismatch in part {part['index']}")
+
+class _IterReader(io.RawIOBase):
+    """Read-only file object over an iterator of byte chunks (for tarfile stream mode)."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buf = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buf:
+            try:
+                self._buf = next(self._chunks)
+            except StopIteration:
+                return 0
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        return n
+
+def extract_ckpt(remote_path: str, dest_dir: str, bucket=None):
+    """
+    Stream a .tar.gz / .tar.zst checkpoint straight into a directory.
+
+    The archive is decompressed and unpacked as it arrives (tarfile "r|*"),
+    so it is never held in memory nor written to disk.
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    reader = io.BufferedReader(_IterReader(iter_ckpt(remote_path, bucket)), buffer_size=STREAM_CHUNK)
+    if remote_path.endswith(".zst"):
+        # tarfile no conoce zstd: descomprimir antes con zstandard
+        import zstandard
+        reader = zstandard.ZstdDecompressor().stream_reader(reader)
+    with tarfile.open(fileobj=reader, mode="r|*") as tar:
+        if hasattr(tarfile, "data_filter"):
+            tar.extractall(dest_dir, filter="data")
+        else:
+            tar.extractall(dest_dir)
+
+def download_ckpt(remote_path: str, local_path: str, bucket=None, workers: int = 1, extract_to: str = None):
+    """Download checkpoint from storage, streamed to disk with byte-range resume (snapshots are rebuilt from chunks)"""
     
-    if bucket is None:
-        bucket = cfg.bucket_ckpt
+    storage = get_storage(bucket)
         
     try:
-        print(f"📥 Downloading checkpoint from Supabase...")
-        print(f"   Remote: {bucket}/{remote_path}")
+        print(f"📥 Downloading checkpoint from {storage.kind} storage...")
+        print(f"   Remote: {storage}/{remote_path}")
+        
+        if remote_path.endswith(SNAPSHOT_SUFFIX):
+            # Snapshot deduplicado: se reconstruye el directorio desde los chunks
+            dest = extract_to or local_path
+            print(f"   Restoring to: {dest}")
+            t0 = time.perf_counter()
+            ChunkStore(storage, workers=max(workers, UPLOAD_WORKERS)).get_dir(remote_path, dest)
+            print(f"✅ Snapshot restored in {time.perf_counter() - t0:.1f}s")
+            return True
+        
+        if extract_to:
+            print(f"   Extracting to: {extract_to}")
+            t0 = time.perf_counter()
+            extract_ckpt(remote_path, extract_to, storage)
+            print(f"✅ Streamed and extracted in {time.perf_counter() - t0:.1f}s")
+            return True
+        
         print(f"   Local: {local_path}")
+        manifest = read_manifest(remote_path, storage)
+        ranges, file_size = _ranges(remote_path, storage, manifest)
+        
+        # Estado de reanudación: bytes ya escritos de cada rango
+        partial, state_file = f"{local_path}.partial", f"{local_path}.partial.json"
+        done = {}
+        if os.path.exists(partial) and os.path.exists(state_file):
+            try:
+                with open(state_file, encoding="utf-8") as f:
+                    state = json.load(f)
+                if state.get("size") == file_size:
+                    done = {int(k): int(v) for k, v in state["done"].items()}
+            except (ValueError, TypeError, KeyError, AttributeError):
+                # Estado ilegible (p. ej. JSON cortado): se empieza de cero
+                done = {}
+        if done:
+            print(f"♻️ Resuming: {sum(done.values()) / (1024*1024):.2f} MB already on disk")
+        
+        fd = os.open(partial, os.O_RDWR | os.O_CREAT)
+        # Sin estado aceptado, lo que haya en un .partial viejo (quizá más largo) no vale nada
+        if not done:
+            os.ftruncate(fd, 0)
+        os.ftruncate(fd, file_size)
+        lock = threading.Lock()
+        progress = Progress(len(ranges), "download", unit="ranges")
         
-        # Download file
-        result = sb.storage.from_(bucket).download(remote_path)
+        def save_state():
+            with open(state_file, "w", encoding="utf-8") as f:
+                json.dump({"size": file_size, "done": done}, f)
         
-        # Save to local file
-        with open(local_path, 'wb') as f:
-            f.write(result)
-            
-        file_size = len(result)
+        def fetch(i):
+            rng = ranges[i]
+            have = done.get(i, 0)
+            length = rng["end"] - rng["start"]
+            # Con checksum hay que releer lo ya escrito para poder verificar la parte
+            h = hashlib.sha256() if rng["sha256"] else None
+            if h and have:
+                h.update(os.pread(fd, have, rng["offset"]))
+            pos = have
+            if have < length:
+                for chunk in storage.stream(rng["path"], rng["start"] + have, rng["end"], STREAM_CHUNK):
+                    os.pwrite(fd, chunk, rng["offset"] + pos)
+                    pos += len(chunk)
+                    if h:
+                        h.update(chunk)
+                    with lock:
+                        done[i] = pos
+            if pos != length or (h and h.hexdigest() != rng["sha256"]):
+                with lock:
+                    done.pop(i, None)
+                raise IOError(f"Range {i} incomplete or corrupt ({pos}/{length} bytes)")
+            with lock:
+                save_state()
+            progress.update()
+        
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+                list(ex.map(fetch, range(len(ranges))))
+        finally:
+            with lock:
+                save_state()
+            os.close(fd)
+        progress.close()
+        
+        os.replace(partial, local_path)
+        os.remove(state_file)
         print(f"✅ Download successful: {file_size / (1024*1024):.2f} MB")
         
         return True
@@ -127,27 +658,33 @@ def download_ckpt(remote_path: str, local_path: str, bucket: str = None):
         print(f"❌ Download failed: {str(e)}")
         return False
 
-def list_checkpoints(prefix: str = "", bucket: str = None):
-    """List available checkpoints in Supabase Storage"""
+def list_checkpoints(prefix: str = "", bucket=None):
+    """List available checkpoints of a run (from its index; folder listing for runs without one)"""
     
-    if bucket is None:
-        bucket = cfg.bucket_ckpt
-        
     try:
-        files = sb.storage.from_(bucket).list(prefix)
+        storage = get_storage(bucket)
+        entries = CheckpointIndex(prefix, storage).checkpoints()
+        if entries:
+            return [dict(e, name=e["filename"]) for e in entries]
         
+        # Runs subidos antes del índice
         checkpoints = []
-        for file in files:
-            if file.name.endswith('.tar.gz') or file.name.endswith('.zip'):
+        for file in storage.list(prefix):
+            if file["name"].endswith(('.tar.gz', '.tar.zst', '.zip', SNAPSHOT_SUFFIX)):
                 checkpoints.append({
-                    "name": file.name,
-                    "size": file.metadata.get('size', 0) if file.metadata else 0,
-                    "created": file.created_at,
-                    "path": f"{prefix}/{file.name}" if prefix else file.name
+                    "name": file["name"],
+                    "size": file["size"] or 0,
+                    "created": file["updated_at"],
+                    "path": f"{prefix.rstrip('/')}/{file['name']}" if prefix else file["name"]
                 })
         
         return checkpoints
         
     except Exception as e:
         print(f"❌ Failed to list checkpoints: {str(e)}")
-        return []
\ No newline at end of file
+        return []
+
+def latest_checkpoint(prefix: str = "", bucket=None):
+    """Newest checkpoint entry of a run (highest step), or None"""
+    
+    return CheckpointIndex(prefix, get_storage(bucket)).latest()
@@ -0,0 +1,245 @@
+"""
+Verse → commentary cross-index.
+
+While commentary is ingested, the verse references each chunk mentions
+("Juan 3:16", "Jn 3,16-18", "1 Co 13.4") are extracted and every verse is
+mapped to a fixed ordinal ``(book * 151 + chapter) * 177 + verse``. The pairs
+are written as a CSR index next to the corpus:
+
+- ``<prefix>.offsets.npy``: uint32, one slot per ordinal (+1); the chunks of
+  ordinal o are ``ids[offsets[o]:offsets[o + 1]]``
+- ``<prefix>.ids.npy``: uint32 chunk ids, grouped by ordinal
+- ``<prefix>.catalog.jsonl`` / ``<prefix>.catalog_offsets.npy``: key of each
+  chunk id (work, ref_key, seq, offsets in the source) and its byte offset
+
+so "commentary on Juan 3:16" is two array reads and a seek instead of an ANN
+query.
+"""
+
+import json
+import os
+import re
+import unicodedata
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+BOOKS = (
+    "Génesis", "Éxodo", "Levítico", "Números", "Deuteronomio", "Josué", "Jueces", "Rut",
+    "1 Samuel", "2 Samuel", "1 Reyes", "2 Reyes", "1 Crónicas", "2 Crónicas", "Esdras",
+    "Nehemías", "Ester", "Job", "Salmos", "Proverbios", "Eclesiastés", "Cantares", "Isaías",
+    "Jeremías", "Lamentaciones", "Ezequiel", "Daniel", "Oseas", "Joel", "Amós", "Abdías",
+    "Jonás", "Miqueas", "Nahum", "Habacuc", "Sofonías", "Hageo", "Zacarías", "Malaquías",
+    "Mateo", "Marcos", "Lucas", "Juan", "Hechos", "Romanos", "1 Corintios", "2 Corintios",
+    "Gálatas", "Efesios", "Filipenses", "Colosenses", "1 Tesalonicenses", "2 Tesalonicenses",
+    "1 Timoteo", "2 Timoteo", "Tito", "Filemón", "Hebreos", "Santiago", "1 Pedro", "2 Pedro",
+    "1 Juan", "2 Juan", "3 Juan", "Judas", "Apocalipsis",
+)
+
+# Abreviaturas usuales (español y algunas inglesas de los comentarios), por libro
+_ALIASES = {
+    "Génesis": "gn gen genesis", "Éxodo": "ex exo exodo exodus", "Levítico": "lv lev levitico leviticus",
+    "Números": "nm num numeros numbers", "Deuteronomio": "dt deut deuteronomy", "Josué": "jos josue joshua",
+    "Jueces": "jue jc judges", "Rut": "rt ruth", "1 Samuel": "1s 1sam 1sa", "2 Samuel": "2s 2sam 2sa",
+    "1 Reyes": "1r 1re 1rey 1kings 1ki", "2 Reyes": "2r 2re 2rey 2kings 2ki",
+    "1 Crónicas": "1cr 1cro 1chronicles 1ch", "2 Crónicas": "2cr 2cro 2chronicles 2ch",
+    "Esdras": "esd ezra", "Nehemías": "neh nehemiah", "Ester": "est esther", "Job": "jb",
+    "Salmos": "sal sl salmo ps psalm psalms", "Proverbios": "pr prov proverbs",
+    "Eclesiastés": "ec ecl ecclesiastes", "Cantares": "cnt cant cantar song",
+    "Isaías": "is isa isaiah", "Jeremías": "jer jr jeremiah", "Lamentaciones": "lm lam lamentations",
+    "Ezequiel": "ez eze ezekiel", "Daniel": "dn dan", "Oseas": "os hosea", "Joel": "jl",
+    "Amós": "am", "Abdías": "abd obadiah", "Jonás": "jon jonah", "Miqueas": "mi miq micah",
+    "Nahum": "nah", "Habacuc": "hab habakkuk", "Sofonías": "sof zephaniah", "Hageo": "hag haggai",
+    "Zacarías": "zac zechariah", "Malaquías": "mal malachi",
+    "Mateo": "mt mat matthew", "Marcos": "mr mc mar mark", "Lucas": "lc luc lk luke",
+    "Juan": "jn jua john", "Hechos": "hch hech acts", "Romanos": "ro rom romans",
+    "1 Corintios": "1co 1cor 1corinthians", "2 Corintios": "2co 2cor 2corinthians",
+    "Gálatas": "ga gal galatians", "Efesios": "ef efe ephesians", "Filipenses": "fil flp philippians",
+    "Colosenses": "col colossians", "1 Tesalonicenses": "1ts 1tes 1thessalonians",
+    "2 Tesalonicenses": "2ts 2tes 2thessalonians", "1 Timoteo": "1ti 1tim 1timothy",
+    "2 Timoteo": "2ti 2tim 2timothy", "Tito": "tit titus", "Filemón": "flm filemon philemon",
+    "Hebreos": "he heb hebrews", "Santiago": "stg sant james", "1 Pedro": "1p 1pe 1ped 1peter",
+    "2 Pedro": "2p 2pe 2ped 2peter", "1 Juan": "1jn 1john", "2 Juan": "2jn 2john",
+    "3 Juan": "3jn 3john", "Judas": "jud jude", "Apocalipsis": "ap apoc rev revelation",
+}
+
+# Abreviaturas que también son palabras comunes ("he 3:16", "os 2:1", "mal 3:10"): en texto corrido
+# solo cuentan con mayúscula inicial o seguidas de punto ("He 3:16", "os. 2:1")
+_WORD_ALIASES = frozenset("is he am os mi ex mal sal col dan job est mar song".split())
+
+MAX_CHAPTER = 150   # Salmos
+MAX_VERSE = 176     # Salmo 119
+N_ORDINALS = len(BOOKS) * (MAX_CHAPTER + 1) * (MAX_VERSE + 1)
+MAX_RANGE = 40      # versículos indexados como máximo por rango ("Mt 5:1-7:29" no cuenta como 200 citas)
+
+_REF = re.compile(
+    r"(?<![\w:])([123]\s*)?([^\W\d_]+)(\.?)\s*(\d{1,3})\s*[:.,]\s*(\d{1,3})(?:\s*[-–]\s*(\d{1,3})(?![:.,]\d))?")
+_KEY = re.compile(r"^([123]?[^\W\d_]+)_(\d{1,3})_(\d{1,3})$")
+
+def _norm(name: str) -> str:
+    name = unicodedata.normalize("NFKD", name)
+    return "".join(c for c in name if c.isalnum() and not unicodedata.combining(c)).lower()
+
+def _alias_table() -> Dict[str, int]:
+    table = {}
+    for i, book in enumerate(BOOKS):
+        table[_norm(book)] = i
+        for alias in _ALIASES.get(book, "").split():
+            table[_norm(alias)] = i
+    return table
+
+_BOOK_INDEX = _alias_table()
+
+def book_index(name: str) -> Optional[int]:
+    """Position of a book in BOOKS from its name or abbreviation ("1 Co", "Jn", "Génesis")."""
+    return _BOOK_INDEX.get(_norm(name))
+
+def verse_ordinal(book: int, chapter: int, verse: int) -> int:
+    return (book * (MAX_CHAPTER + 1) + chapter) * (MAX_VERSE + 1) + verse
+
+def ordinal_verse(ordinal: int) -> Tuple[str, int, int]:
+    rest, verse = divmod(ordinal, MAX_VERSE + 1)
+    book, chapter = divmod(rest, MAX_CHAPTER + 1)
+    return BOOKS[book], chapter, verse
+
+def _ordinals(book: Optional[int], chapter: int, first: int, last: Optional[int]) -> List[int]:
+    if book is None or not 1 <= chapter <= MAX_CHAPTER or not 1 <= first <= MAX_VERSE:
+        return []
+    last = first if last is None or not first <= last <= MAX_VERSE else last
+    return [verse_ordinal(book, chapter, v) for v in range(first, min(last, first + MAX_RANGE - 1) + 1)]
+
+def extract_refs(text: str, strict: bool = True) -> List[int]:
+    """
+    Ordinals of the verses cited in text.
+
+    Args:
+        text: Commentary text
+        strict: Require abbreviations that are also common words ("he", "os")
+            to be capitalized or followed by a period
+
+    Returns:
+        Sorted unique ordinals ("Jn 3:16-18" gives three)
+    """
+    out = set()
+    for m in _REF.finditer(text):
+        num, name, dot, chapter, first, last = m.groups()
+        if strict and not num and not dot and name[0].islower() and _norm(name) in _WORD_ALIASES:
+            continue
+        book = book_index((num or "") + name)
+        out.update(_ordinals(book, int(chapter), int(first), int(last) if last else None))
+    return sorted(out)
+
+def parse_ref_key(ref_key: str) -> List[int]:
+    """Ordinal of a file-name reference key such as "Jn_3_16" (empty if it is not one)."""
+    m = _KEY.match(ref_key)
+    if not m:
+        return []
+    return _ordinals(book_index(m.group(1)), int(m.group(2)), int(m.group(3)), None)
+
+def parse_reference(reference: str) -> int:
+    """
+    Ordinal of a single reference ("Juan 3:16", "1 Co 13:4").
+
+    Raises:
+        ValueError: If the reference is not recognized
+    """
+    # Una referencia suelta es una cita aunque venga en minúsculas ("os 2:1")
+    ords = extract_refs(reference, strict=False) or parse_ref_key(reference)
+    if not ords:
+        raise ValueError(f"Invalid bible reference format: {reference}")
+    return ords[0]
+
+class VerseIndexWriter:
+    """Collects (verse, chunk) pairs during ingest and writes the CSR index."""
+
+    def __init__(self, prefix: str, key_cols: Tuple[str, ...] = ("work", "ref_key", "seq", "start", "end"),
+                 text_col: str = "content"):
+        """
+        Initialize the writer.
+
+        Args:
+            prefix: Output path prefix (e.g. ./data/refs_index)
+            key_cols: Row fields stored in the catalog
+            text_col: Field scanned for references
+        """
+        self.prefix = prefix
+        self.key_cols = key_cols
+        self.text_col = text_col
+        os.makedirs(os.path.dirname(os.path.abspath(prefix)), exist_ok=True)
+        # Todo se escribe a .partial y se renombra en close(): un índice a medias nunca reemplaza al anterior
+        self.catalog = open(f"{prefix}.catalog.jsonl.partial", "wb")
+        self.line_offsets = array("Q")
+        # Pares (ordinal, chunk id) en arrays compactos: 8 bytes por cita
+        self.ords = array("I")
+        self.ids = array("I")
+
+    def add(self, row: Dict[str, Any]) -> int:
+        """
+        Register a chunk.
+
+        Args:
+            row: Chunk row (text plus key fields)
+
+        Returns:
+            Chunk id (its position in the catalog)
+        """
+        chunk_id = len(self.line_offsets)
+        self.line_offsets.append(self.catalog.tell())
+        key = {c: row[c] for c in self.key_cols if c in row}
+        self.catalog.write(json.dumps(key, ensure_ascii=False).encode("utf-8") + b"\n")
+        ords = set(extract_refs(row[self.text_col]))
+        ords.update(parse_ref_key(str(row.get("ref_key", ""))))
+        self.ords.extend(ords)
+        self.ids.extend([chunk_id] * len(ords))
+        return chunk_id
+
+    def close(self) -> Dict[str, int]:
+        """Write the index files; returns counts of chunks, citations and verses covered."""
+        self.catalog.close()
+        ords = np.frombuffer(self.ords, dtype=np.uint32)
+        ids = np.frombuffer(self.ids, dtype=np.uint32)
+        order = np.lexsort((ids, ords))
+        counts = np.bincount(ords, minlength=N_ORDINALS)
+        offsets = np.zeros(N_ORDINALS + 1, dtype=np.uint32)
+        np.cumsum(counts, out=offsets[1:])
+        arrays = {"offsets": offsets, "ids": ids[order],
+                  "catalog_offsets": np.frombuffer(self.line_offsets, dtype=np.uint64)}
+        for name, a in arrays.items():
+            with open(f"{self.prefix}.{name}.npy.partial", "wb") as f:
+                np.save(f, a)
+        for name in ("catalog.jsonl", *(f"{n}.npy" for n in arrays)):
+            os.replace(f"{self.prefix}.{name}.partial", f"{self.prefix}.{name}")
+        stats = {"chunks": len(self.line_offsets), "citations": len(ids), "verses": int(np.count_nonzero(counts))}
+        print(f"📖 Verse index {self.prefix}: {stats['chunks']} chunks, {stats['citations']} citations, "
+              f"{stats['verses']} verses covered")
+        return stats
+
+class VerseIndex:
+    """Read side of the verse → chunk index (memory-mapped)."""
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self.offsets = np.load(f"{prefix}.offsets.npy", mmap_mode="r")
+        self.ids = np.load(f"{prefix}.ids.npy", mmap_mode="r")
+        self.catalog_offsets = np.load(f"{prefix}.catalog_offsets.npy", mmap_mode="r")
+
+    def chunk_ids(self, reference: str) -> np.ndarray:
+        """Ids of the chunks citing a verse ("Juan 3:16")."""
+        o = parse_reference(reference)
+        return np.asarray(self.ids[self.offsets[o]:self.offsets[o + 1]])
+
+    def chunks(self, reference: str) -> List[Dict[str, Any]]:
+        """Catalog entries (work, ref_key, seq, ...) of the chunks citing a verse."""
+        out = []
+        with open(f"{self.prefix}.catalog.jsonl", "rb") as f:
+            for i in self.chunk_ids(reference).tolist():
+                f.seek(int(self.catalog_offsets[i]))
+                out.append(json.loads(f.readline()))
+        return out
+
+def index_rows(rows: Iterable[Dict[str, Any]], writer: VerseIndexWriter):
+    """Pass rows through, registering each one in the verse index."""
+    for r in rows:
+        writer.add(r)
+        yield r
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Los tests importan el paquete src desde la raíz del repo, como los scripts
+sys.path.insert(0, str(Path(__file__).parent.parent))
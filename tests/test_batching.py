@@ -0,0 +1,46 @@
+import random
+
+from src.train.batching import DynamicPaddingCollator, LengthGroupedBatchSampler
+from src.train.packing import IGNORE_INDEX, padding_ratio
+
+
+def lengths(n=1000, seed=0):
+    rng = random.Random(seed)
+    return [rng.randrange(10, 500) for _ in range(n)]
+
+
+def test_same_seed_and_epoch_give_same_batches():
+    a = LengthGroupedBatchSampler(lengths(), 8, megabatch_mult=10)
+    b = LengthGroupedBatchSampler(lengths(), 8, megabatch_mult=10)
+    a.set_epoch(3)
+    b.set_epoch(3)
+    assert list(a) == list(b)
+    # Cada época baraja distinto
+    assert a.batches(0) != a.batches(1)
+
+
+def test_every_row_once_and_longest_batch_first():
+    lens = lengths()
+    sampler = LengthGroupedBatchSampler(lens, 8, megabatch_mult=10)
+    batches = list(sampler)
+    assert sorted(i for b in batches for i in b) == list(range(len(lens)))
+    assert len(batches) == len(sampler)
+    assert max(lens[i] for i in batches[0]) == max(lens)
+
+
+def test_grouping_reduces_padding():
+    lens = lengths()
+    sampler = LengthGroupedBatchSampler(lens, 8, megabatch_mult=10)
+    assert sampler.padding_ratio() < padding_ratio(lens, 8) / 2
+
+
+def test_drop_last():
+    sampler = LengthGroupedBatchSampler(lengths(20), 8, drop_last=True)
+    assert len(sampler) == 2 and all(len(b) == 8 for b in sampler)
+
+
+def test_collator_pads_to_multiple():
+    out = DynamicPaddingCollator(0, pad_to_multiple_of=8)([{"input_ids": [5, 6, 7]}, {"input_ids": [5]}])
+    assert out["input_ids"].shape == (2, 8)
+    assert out["attention_mask"][1].tolist() == [1] + [0] * 7
+    assert out["labels"][0].tolist() == [5, 6, 7] + [IGNORE_INDEX] * 5
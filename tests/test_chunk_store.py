@@ -0,0 +1,102 @@
+import hashlib
+import io
+import json
+import os
+
+import numpy as np
+import pytest
+
+from src.utils.chunk_store import ChunkStore, chunk_path, iter_chunks, safe_relpath
+from src.utils.storage import LocalStorage
+
+SMALL = {"min_size": 1024, "avg_size": 4096, "max_size": 16384}
+
+
+def random_bytes(n, seed=0):
+    return np.random.default_rng(seed).integers(0, 256, n, dtype=np.uint8).tobytes()
+
+
+def chunks_of(data):
+    return list(iter_chunks(io.BytesIO(data), **SMALL))
+
+
+def test_chunks_cover_input_within_bounds():
+    data = random_bytes(200_000)
+    chunks = chunks_of(data)
+    assert b"".join(chunks) == data
+    assert all(SMALL["min_size"] <= len(c) <= SMALL["max_size"] for c in chunks[:-1])
+
+
+def test_boundaries_survive_an_insertion():
+    data = random_bytes(200_000)
+    edited = data[:100_000] + b"inserted bytes" + data[100_000:]
+    before = {hashlib.sha256(c).digest() for c in chunks_of(data)}
+    after = [hashlib.sha256(c).digest() for c in chunks_of(edited)]
+    # Solo cambian los chunks alrededor de la inserción
+    assert sum(1 for h in after if h not in before) <= 2
+
+
+def make_store(tmp_path):
+    return ChunkStore(LocalStorage(str(tmp_path / "bucket")), cache_dir=str(tmp_path / "cache"), workers=2)
+
+
+def write_checkpoint(root, weights):
+    os.makedirs(root / "sub", exist_ok=True)
+    (root / "adapter.bin").write_bytes(weights)
+    (root / "sub" / "config.json").write_text('{"r": 16}')
+    return root
+
+
+def test_snapshot_roundtrip_and_dedup(tmp_path):
+    store = make_store(tmp_path)
+    ckpt = write_checkpoint(tmp_path / "checkpoint-1", random_bytes(3_000_000))
+    first = store.put_dir(str(ckpt), "run/checkpoint-1.snapshot.json")
+    assert first["stats"]["new_chunks"] == first["stats"]["chunks"]
+    again = store.put_dir(str(ckpt), "run/checkpoint-1b.snapshot.json")
+    assert again["stats"]["new_chunks"] == 0
+
+    store.get_dir("run/checkpoint-1.snapshot.json", str(tmp_path / "restored"))
+    out = tmp_path / "restored" / "checkpoint-1"
+    assert (out / "adapter.bin").read_bytes() == (ckpt / "adapter.bin").read_bytes()
+    assert (out / "sub" / "config.json").read_text() == '{"r": 16}'
+
+
+@pytest.mark.parametrize("bad", ["../evil", "/etc/passwd", "a/../../b", "C:/x", "", "a//b"])
+def test_unsafe_manifest_paths_are_rejected(bad):
+    with pytest.raises(ValueError):
+        safe_relpath(bad)
+
+
+def test_get_dir_refuses_traversal(tmp_path):
+    store = make_store(tmp_path)
+    ckpt = write_checkpoint(tmp_path / "checkpoint-1", b"weights")
+    store.put_dir(str(ckpt), "run/c.snapshot.json")
+    storage = store.storage.remote
+    manifest = json.loads(storage.get("run/c.snapshot.json"))
+    manifest["files"][0]["path"] = "../../escaped.bin"
+    storage.put("run/c.snapshot.json", json.dumps(manifest).encode())
+    with pytest.raises(ValueError):
+        store.get_dir("run/c.snapshot.json", str(tmp_path / "restored" / "deep"))
+    assert not (tmp_path / "restored" / "escaped.bin").exists()
+
+
+def test_gc_deletes_only_unreferenced_chunks(tmp_path):
+    store = make_store(tmp_path)
+    old = store.put_dir(str(write_checkpoint(tmp_path / "a" / "checkpoint-1", random_bytes(1_000_000, 1))),
+                        "run/checkpoint-1.snapshot.json")
+    new = store.put_dir(str(write_checkpoint(tmp_path / "b" / "checkpoint-2", random_bytes(1_000_000, 2))),
+                        "run/checkpoint-2.snapshot.json")
+    storage = store.storage.remote
+    only_old = set(old["chunks"]) - set(new["chunks"])
+
+    # Recién subidos: dentro del margen de edad no se toca nada
+    assert store.gc(["run/checkpoint-2.snapshot.json"])["deleted"] == 0
+
+    dry = store.gc(["run/checkpoint-2.snapshot.json"], min_age=0, dry_run=True)
+    assert dry["deleted"] == len(only_old)
+    assert all(storage.exists(chunk_path(sha)) for sha in only_old)
+
+    result = store.gc(["run/checkpoint-2.snapshot.json"], min_age=0)
+    assert result["deleted"] == len(only_old)
+    assert not any(storage.exists(chunk_path(sha)) for sha in only_old)
+    assert all(storage.exists(chunk_path(sha)) for sha in new["chunks"])
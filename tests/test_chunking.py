@@ -0,0 +1,59 @@
+import re
+
+import pytest
+
+from src.utils.chunking import chunk_by_tokens, chunk_spans, iter_file_chunks
+from src.utils.common import chunk_text
+
+
+class WordEncoder:
+    """Hasta 4 letras, cada signo y cada tramo de espacios son un token: unir oraciones suma tokens."""
+
+    def encode_ordinary(self, text):
+        return re.findall(r"\w{1,4}|\s+|[^\w\s]", text)
+
+
+ENC = WordEncoder()
+TEXT = " ".join(f"La oración número {i} habla del verbo." for i in range(60))
+
+
+def tokens(text):
+    return len(ENC.encode_ordinary(text))
+
+
+@pytest.mark.parametrize("budget", range(40, 120, 7))
+def test_chunks_fit_budget_once_joined(budget):
+    chunks = chunk_by_tokens(TEXT, budget, 20, ENC)
+    assert len(chunks) > 1
+    assert all(tokens(c) <= budget for c in chunks)
+
+
+def test_chunks_cut_between_sentences_and_overlap():
+    spans = chunk_spans(TEXT, 100, 20, ENC)
+    assert spans[0][0] == 0 and spans[-1][1] == len(TEXT)
+    for (s1, e1), (s2, e2) in zip(spans, spans[1:]):
+        assert TEXT[e1 - 1] == "." and TEXT[s2:s2 + 3] == "La "
+        assert s2 < e1          # la oración final se repite al comienzo del siguiente
+    assert all(e <= len(TEXT) for _, e in spans)
+
+
+def test_long_word_is_cut_by_characters():
+    word = "x" * 500
+    chunks = chunk_by_tokens(f"Inicio. {word} fin.", 50, 0, ENC)
+    assert sum(c.count("x") for c in chunks) == len(word)
+    assert all(tokens(c) <= 50 for c in chunks)
+
+
+def test_file_chunks_match_offsets(tmp_path):
+    path = tmp_path / "ref.txt"
+    text = "\n\n".join(TEXT for _ in range(3))
+    path.write_text(text, encoding="utf-8")
+    for start, end, chunk in iter_file_chunks(str(path), 100, 20, ENC, block_chars=1000):
+        assert text[start:end] == chunk
+        assert tokens(chunk) <= 100
+
+
+def test_common_chunk_text_is_character_based():
+    chunks = chunk_text("palabra " * 200, max_length=100, overlap=10)
+    assert all(len(c) <= 100 for c in chunks)
+    assert chunk_text("corto") == ["corto"]
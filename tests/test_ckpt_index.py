@@ -0,0 +1,64 @@
+import json
+
+from src.utils import ckpt_index
+from src.utils.ckpt_index import CheckpointIndex
+from src.utils.storage import LocalStorage
+
+
+def make_index(tmp_path, name="cache"):
+    storage = LocalStorage(str(tmp_path / "bucket"))
+    return CheckpointIndex("run", storage, cache_dir=str(tmp_path / name)), storage
+
+
+def test_add_publishes_versions_and_pointer(tmp_path):
+    index, storage = make_index(tmp_path)
+    index.add({"path": "run/a", "step": 1})
+    index.add({"path": "run/b", "step": 2})
+    published = index.add({"path": "run/a", "step": 3})
+    assert published["version"] == 3
+    assert json.loads(storage.get("run/index.json"))["version"] == 3
+    assert [e["path"] for e in index.checkpoints()] == ["run/b", "run/a"]
+    assert index.latest()["step"] == 3
+
+
+def test_concurrent_writers_do_not_lose_entries(tmp_path):
+    a, _ = make_index(tmp_path, "cache_a")
+    b, _ = make_index(tmp_path, "cache_b")
+    a.add({"path": "run/a", "step": 1})
+    b.read()
+    a.add({"path": "run/b", "step": 2})
+    # b parte de una copia vieja: su versión choca y reaplica la entrada sobre la nueva
+    b.add({"path": "run/c", "step": 3})
+    assert {e["path"] for e in a.checkpoints()} == {"run/a", "run/b", "run/c"}
+
+
+def test_stale_pointer_is_resolved_by_readers(tmp_path):
+    index, storage = make_index(tmp_path)
+    index.add({"path": "run/a", "step": 1})
+    stale = storage.get("run/index.json")
+    index.add({"path": "run/b", "step": 2})
+    # Un escritor lento pisa el puntero con la versión 1
+    storage.put("run/index.json", stale)
+    reader, _ = make_index(tmp_path, "cache_reader")
+    assert reader.read()["version"] == 2
+    assert index.read()["version"] == 2
+
+
+def test_publish_carries_pointer_forward(tmp_path):
+    index, storage = make_index(tmp_path)
+    index.add({"path": "run/a", "step": 1})
+    v1 = json.loads(storage.get("run/index.json"))
+    index.add({"path": "run/b", "step": 2})
+    # El escritor de la versión 1 termina tarde: el puntero no debe quedarse atrás
+    storage.delete(["run/index.json"])
+    index._publish(v1)
+    assert json.loads(storage.get("run/index.json"))["version"] == 2
+
+
+def test_old_versions_are_pruned(tmp_path, monkeypatch):
+    monkeypatch.setattr(ckpt_index, "KEEP_VERSIONS", 3)
+    index, storage = make_index(tmp_path)
+    for step in range(6):
+        index.add({"path": f"run/{step}", "step": step})
+    kept = sorted(e["name"] for e in storage.list("run/index"))
+    assert kept == ["v000004.json", "v000005.json", "v000006.json"]
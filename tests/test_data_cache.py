@@ -0,0 +1,53 @@
+import errno
+import os
+
+import pytest
+from datasets import Dataset
+
+from src.train import data_cache
+from src.train.data_cache import COMPLETE, cached_dataset
+
+
+def build(rows):
+    calls = []
+
+    def fn():
+        calls.append(1)
+        return Dataset.from_dict({"input_ids": rows})
+    return fn, calls
+
+
+def test_second_call_loads_from_cache(tmp_path):
+    fn, calls = build([[1, 2], [3]])
+    first = cached_dataset("k", fn, str(tmp_path))
+    again = cached_dataset("k", fn, str(tmp_path))
+    assert len(calls) == 1
+    assert again["input_ids"] == first["input_ids"] == [[1, 2], [3]]
+    assert not [p for p in os.listdir(tmp_path) if ".partial" in p]
+
+
+def test_losing_the_rename_race_uses_the_winners_copy(tmp_path, monkeypatch):
+    winner, _ = build([[7, 7]])
+
+    def racing_replace(src, dst):
+        # Otro proceso termina de guardar la misma clave entre rmtree y replace
+        winner().save_to_disk(dst)
+        open(os.path.join(dst, COMPLETE), "w").close()
+        raise OSError(errno.ENOTEMPTY, "Directory not empty", dst)
+
+    monkeypatch.setattr(data_cache.os, "replace", racing_replace)
+    fn, _ = build([[1, 2]])
+    ds = cached_dataset("k", fn, str(tmp_path))
+    assert ds["input_ids"] == [[7, 7]]
+    assert os.listdir(tmp_path) == ["k"]
+
+
+def test_failed_rename_without_a_winner_raises(tmp_path, monkeypatch):
+    def failing_replace(src, dst):
+        raise OSError(errno.EACCES, "Permission denied", dst)
+
+    monkeypatch.setattr(data_cache.os, "replace", failing_replace)
+    fn, _ = build([[1]])
+    with pytest.raises(OSError):
+        cached_dataset("k", fn, str(tmp_path))
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,53 @@
+import pytest
+
+from src.train import device
+from src.train.device import cgroup_cpu_quota, training_device
+
+
+def write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+
+
+@pytest.mark.parametrize("content, expected", [
+    ("200000 100000\n", 2.0),
+    ("150000 100000\n", 1.5),
+    ("max 100000\n", None),
+])
+def test_cgroup_v2_cpu_max(tmp_path, content, expected):
+    write(tmp_path / "cpu.max", content)
+    assert cgroup_cpu_quota(str(tmp_path)) == expected
+
+
+@pytest.mark.parametrize("sub", ["cpu", "cpu,cpuacct"])
+def test_cgroup_v1_cfs_quota(tmp_path, sub):
+    write(tmp_path / sub / "cpu.cfs_quota_us", "400000\n")
+    write(tmp_path / sub / "cpu.cfs_period_us", "100000\n")
+    assert cgroup_cpu_quota(str(tmp_path)) == 4.0
+
+
+def test_cgroup_v1_unlimited_and_missing(tmp_path):
+    assert cgroup_cpu_quota(str(tmp_path)) is None
+    write(tmp_path / "cpu" / "cpu.cfs_quota_us", "-1\n")
+    write(tmp_path / "cpu" / "cpu.cfs_period_us", "100000\n")
+    assert cgroup_cpu_quota(str(tmp_path)) is None
+
+
+def test_garbled_v2_falls_back_to_v1(tmp_path):
+    write(tmp_path / "cpu.max", "garbage\n")
+    write(tmp_path / "cpu" / "cpu.cfs_quota_us", "100000\n")
+    write(tmp_path / "cpu" / "cpu.cfs_period_us", "100000\n")
+    assert cgroup_cpu_quota(str(tmp_path)) == 1.0
+
+
+def test_cpu_settings_follow_the_quota(monkeypatch):
+    monkeypatch.setattr(device, "available_cpus", lambda: 16)
+    monkeypatch.setattr(device, "cpu_has_bf16", lambda: False)
+    dev = training_device(device="cpu")
+    assert (dev.precision, dev.workers, dev.threads) == ("fp32", 1, 15)
+    monkeypatch.setattr(device, "available_cpus", lambda: 2)
+    monkeypatch.setattr(device, "cpu_has_bf16", lambda: True)
+    dev = training_device(device="cpu")
+    assert (dev.precision, dev.workers, dev.threads) == ("bf16", 0, 2)
+    with pytest.raises(ValueError):
+        training_device("fp8", device="cpu")
@@ -0,0 +1,59 @@
+import random
+
+import torch
+
+from src.train.packing import IGNORE_INDEX, block_causal_mask, pack_examples, padding_ratio
+
+EOS = 2
+
+
+def examples(n=200, seed=0):
+    rng = random.Random(seed)
+    return [[rng.randrange(3, 100) for _ in range(rng.randrange(5, 120))] for _ in range(n)]
+
+
+def split(row):
+    # Ejemplos de una fila empaquetada según sus position_ids
+    starts = [i for i, p in enumerate(row["position_ids"]) if p == 0] + [len(row["input_ids"])]
+    return [row["input_ids"][a:b] for a, b in zip(starts, starts[1:])]
+
+
+def test_pack_keeps_every_example_within_budget():
+    data = examples()
+    out = pack_examples({"input_ids": data}, 256, EOS)
+    rows = [dict(zip(out, r)) for r in zip(*out.values())]
+    assert all(len(r["input_ids"]) <= 256 for r in rows)
+    packed = sorted(ex for r in rows for ex in split(r))
+    assert packed == sorted(ex + [EOS] for ex in data)
+    for r in rows:
+        for start, p in enumerate(r["position_ids"]):
+            if p == 0:
+                assert r["labels"][start] == IGNORE_INDEX
+
+
+def test_pack_fills_sequences_and_is_deterministic():
+    data = examples()
+    out = pack_examples({"input_ids": data}, 256, EOS)
+    assert out == pack_examples({"input_ids": data}, 256, EOS)
+    total = sum(len(ex) + 1 for ex in data)
+    # Best-fit decreasing: a lo sumo una secuencia más que el mínimo teórico
+    assert len(out["input_ids"]) <= -(-total // 256) + 1
+    assert padding_ratio([len(x) for x in out["input_ids"]], 4) < 0.05
+
+
+def test_long_example_is_truncated_keeping_eos():
+    out = pack_examples({"input_ids": [list(range(3, 600))]}, 128, EOS)
+    assert len(out["input_ids"][0]) == 128 and out["input_ids"][0][-1] == EOS
+
+
+def test_block_causal_mask_blocks_across_examples():
+    pos = torch.tensor([[0, 1, 2, 0, 1]])
+    mask = block_causal_mask(pos, torch.float32)
+    assert mask.shape == (1, 1, 5, 5)
+    allowed = mask[0, 0] == 0
+    expected = torch.tensor([[1, 0, 0, 0, 0],
+                             [1, 1, 0, 0, 0],
+                             [1, 1, 1, 0, 0],
+                             [0, 0, 0, 1, 0],
+                             [0, 0, 0, 1, 1]], dtype=torch.bool)
+    assert torch.equal(allowed, expected)
@@ -0,0 +1,116 @@
+import random
+import threading
+import time
+
+from src.ingest.near_dup import NearDupIndex, SyncKeys
+from src.ingest.pipeline import ingest
+
+WORDS = "en el principio era el verbo y el verbo era con dios y el verbo era dios".split()
+
+
+class FakeQuery:
+    def __init__(self, table, op, rows=None):
+        self.table, self.op, self.rows = table, op, rows
+
+    def __getattr__(self, name):
+        # select(...).gt(...).order(...).limit(...) y delete().in_(...): solo importa el último argumento
+        def chain(*args, **kwargs):
+            if name == "in_":
+                self.rows = args[1]
+            return self
+        return chain
+
+    def execute(self):
+        return self.table.execute(self.op, self.rows)
+
+
+class FakeTable:
+    def __init__(self, client):
+        self.client = client
+
+    def upsert(self, rows, on_conflict=None):
+        return FakeQuery(self, "upsert", rows)
+
+    def select(self, cols):
+        return FakeQuery(self, "select")
+
+    def delete(self):
+        return FakeQuery(self, "delete")
+
+    def execute(self, op, rows):
+        with self.client.lock:
+            if op == "upsert":
+                self.client.written += [(r["ref_key"], r["seq"]) for r in rows]
+            elif op == "delete":
+                self.client.deleted += rows
+            return type("Res", (), {"data": self.client.remote if op == "select" else []})()
+
+
+class FakeClient:
+    def __init__(self, remote=()):
+        self.lock = threading.Lock()
+        self.written, self.deleted, self.remote = [], [], list(remote)
+
+    def table(self, name):
+        return FakeTable(self)
+
+
+class Verses:
+    def __init__(self):
+        self.rows = []
+
+    def add(self, row):
+        self.rows.append((row["ref_key"], row["seq"]))
+
+
+def text(seed):
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) + str(rng.randrange(50)) for _ in range(60))
+
+
+def parse(name):
+    # Archivos de tamaño y demora variables: los workers terminan en cualquier orden
+    i = int(name)
+    time.sleep(random.random() * 0.01)
+    # Cada archivo repite el texto de otro: qué copia se queda depende del orden
+    return [{"work": "w", "ref_key": name, "seq": s, "content": text((i + s) % 7)} for s in range(i % 3 + 1)]
+
+
+def run(workers, tmp_path, remote=()):
+    client, verses = FakeClient(remote), Verses()
+    index = NearDupIndex(0.8)
+    try:
+        stats = ingest("bible_refs", [str(i) for i in range(30)], client=client, embed_fn=lambda ts: [[0.0]] * len(ts),
+                       batch_size=2, parse_fn=parse, parse_workers=workers, near_dup=index,
+                       dup_log=str(tmp_path / "dups.jsonl"), verses=verses, sync=bool(remote), every=60)
+    finally:
+        index.close()
+    return stats, verses.rows, sorted(client.written), sorted(client.deleted), (tmp_path / "dups.jsonl").read_text()
+
+
+def test_dedupe_sees_files_in_source_order(tmp_path):
+    expected = run(1, tmp_path)
+    assert expected[1] == sorted(expected[1], key=lambda k: (int(k[0]), k[1]))
+    for _ in range(3):
+        assert run(4, tmp_path) == expected
+
+
+def test_sync_deletes_rows_missing_locally(tmp_path):
+    remote = [{"id": 1, "work": "w", "ref_key": "0", "seq": 0, "content_hash": "x"},
+              {"id": 2, "work": "w", "ref_key": "gone", "seq": 0, "content_hash": "x"}]
+    stats, _, _, deleted, _ = run(2, tmp_path, remote)
+    assert deleted == [2]
+    assert stats["deleted"] == 1
+
+
+def test_sync_keys_stale_ids_in_batches():
+    keys = SyncKeys()
+    assert keys.add_remote([(("w", "a", i), 10 + i, f"h{i}") for i in range(5)]) == 5
+    keys.add(("w", "a", 1))
+    keys.add(("w", "a", 3))
+    keys.add(("w", "new", 0))
+    assert ("w", "a", 1) in keys and ("w", "a", 0) not in keys
+    assert keys.remote(("w", "a", 2)) == (12, "h2")
+    assert keys.remote(("w", "new", 0)) is None
+    assert list(keys.stale_ids(2)) == [[10, 12], [14]]
+    keys.close()
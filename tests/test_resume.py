@@ -0,0 +1,89 @@
+import json
+
+import pytest
+import torch
+from safetensors.torch import save_file
+
+from transformers import TrainingArguments
+
+from src.train.resume import (check_checkpoint, checkpoint_epoch, checkpoint_run, find_resume_checkpoint,
+                              local_checkpoints, write_run_marker)
+
+
+def make_checkpoint(root, step, epoch=0.5):
+    path = root / f"checkpoint-{step}"
+    path.mkdir(parents=True)
+    (path / "trainer_state.json").write_text(json.dumps({"global_step": step, "epoch": epoch}))
+    save_file({"lora_A": torch.ones(4, 4)}, str(path / "adapter_model.safetensors"))
+    torch.save({"state": {0: torch.zeros(1000)}}, path / "optimizer.pt")
+    torch.save({"last_epoch": step}, path / "scheduler.pt")
+    return path
+
+
+def test_complete_checkpoint(tmp_path):
+    path = make_checkpoint(tmp_path, 10)
+    assert check_checkpoint(str(path)) is None
+    assert checkpoint_epoch(str(path)) == 0.5
+    assert checkpoint_epoch(None) == 0.0
+
+
+def truncate(path, n=10):
+    data = path.read_bytes()
+    path.write_bytes(data[:-n])
+
+
+@pytest.mark.parametrize("damage, expected", [
+    (lambda p: truncate(p / "adapter_model.safetensors"), "truncated"),
+    (lambda p: truncate(p / "optimizer.pt", 200), "optimizer.pt"),
+    (lambda p: (p / "scheduler.pt").unlink(), "missing scheduler.pt"),
+    (lambda p: (p / "adapter_model.safetensors").unlink(), "no model weights"),
+    (lambda p: (p / "trainer_state.json").write_text('{"global_step": 5}'), "step 5"),
+    (lambda p: (p / "trainer_state.json").write_text("{"), "trainer_state.json"),
+])
+def test_damaged_checkpoint_is_reported(tmp_path, damage, expected):
+    path = make_checkpoint(tmp_path, 10)
+    damage(path)
+    problem = check_checkpoint(str(path))
+    assert problem is not None and expected in problem
+
+
+def test_corrupt_zip_entry_fails_crc(tmp_path):
+    path = make_checkpoint(tmp_path, 10)
+    data = bytearray((path / "optimizer.pt").read_bytes())
+    # Un byte cambiado dentro de los datos del tensor
+    i = data.index(b"data/0") + 500
+    data[i] ^= 0xFF
+    (path / "optimizer.pt").write_bytes(bytes(data))
+    assert check_checkpoint(str(path)) is not None
+
+
+def test_resume_picks_newest_complete_local_checkpoint(tmp_path):
+    make_checkpoint(tmp_path, 10)
+    newest = make_checkpoint(tmp_path, 20)
+    (newest / "optimizer.pt").unlink()
+    (tmp_path / "checkpoint-30").mkdir()
+    assert [s for s, _ in local_checkpoints(str(tmp_path))] == [30, 20, 10]
+    assert find_resume_checkpoint(str(tmp_path)) == str(tmp_path / "checkpoint-10")
+    assert find_resume_checkpoint(str(tmp_path / "missing")) is None
+
+
+def test_resume_skips_checkpoints_of_other_runs(tmp_path):
+    ours = make_checkpoint(tmp_path, 10)
+    write_run_marker(str(ours), "run-a")
+    # Otro run con el mismo output_dir dejó un checkpoint más nuevo
+    theirs = make_checkpoint(tmp_path, 50)
+    write_run_marker(str(theirs), "run-b")
+    make_checkpoint(tmp_path, 60)          # sin marca: no se sabe de quién es
+    assert find_resume_checkpoint(str(tmp_path), run_name="run-a") == str(ours)
+    assert find_resume_checkpoint(str(tmp_path), run_name="run-c") is None
+
+
+def test_checkpoint_run_falls_back_to_training_args(tmp_path):
+    path = make_checkpoint(tmp_path, 10)
+    assert checkpoint_run(str(path)) is None
+    targs = TrainingArguments(output_dir=str(tmp_path), run_name="run-a", report_to="none")
+    torch.save(targs, path / "training_args.bin")
+    assert checkpoint_run(str(path)) == "run-a"
+    assert check_checkpoint(str(path)) is None
+    write_run_marker(str(path), "run-b")
+    assert checkpoint_run(str(path)) == "run-b"
@@ -0,0 +1,49 @@
+import re
+
+from src.utils import search
+from src.utils.verse_index import VerseIndexWriter
+
+COND = re.compile(r'and\(work\.eq\."((?:[^"\\]|\\.)*)",ref_key\.eq\."((?:[^"\\]|\\.)*)",seq\.eq\.(\d+)\)')
+
+
+class FakeRefs:
+    """bible_refs simulada: aplica el filtro or=(...) y corta en 1000 filas como PostgREST."""
+
+    def __init__(self, rows):
+        self.rows, self.queries = rows, []
+
+    def table(self, name):
+        return self
+
+    def select(self, cols):
+        return self
+
+    def or_(self, cond):
+        self.queries.append(cond)
+        unquote = lambda v: re.sub(r"\\(.)", r"\1", v)
+        self.wanted = {(unquote(w), unquote(r), int(s)) for w, r, s in COND.findall(cond)}
+        return self
+
+    def execute(self):
+        data = [r for r in self.rows if (r["work"], r["ref_key"], r["seq"]) in self.wanted][:1000]
+        return type("Res", (), {"data": data})()
+
+
+def test_fetches_only_the_indexed_chunks_in_batches(tmp_path, monkeypatch):
+    prefix = str(tmp_path / "idx")
+    writer = VerseIndexWriter(prefix)
+    rows, cited = [], []
+    for seq in range(3000):
+        # Un archivo enorme, con comas en el nombre; cita Juan 3:16 cada 25 fragmentos
+        content = "Juan 3:16." if seq % 25 == 0 else "Texto."
+        row = {"id": seq + 1, "work": "w", "ref_key": 'Notas, "varias"', "seq": seq, "content": content}
+        rows.append(row)
+        writer.add(row)
+        if seq % 25 == 0:
+            cited.append(row)
+    writer.close()
+    monkeypatch.setattr(search, "REFS_BATCH", 40)
+    client = FakeRefs(rows)
+    assert search.refs_for_verse("Jn 3:16", prefix, client) == cited
+    assert len(client.queries) == 3   # 120 claves en lotes de 40
+    search._verse_index.cache_clear()
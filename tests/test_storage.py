@@ -0,0 +1,124 @@
+import io
+import json
+
+import httpx
+import pytest
+
+from src.config import cfg
+from src.utils import supa
+from src.utils.storage import LocalStorage, SupabaseStorage
+
+
+def test_local_roundtrip_and_ranges(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    storage.put("a/b.bin", b"0123456789")
+    assert storage.get("a/b.bin") == b"0123456789"
+    assert storage.get_range("a/b.bin", 2, 5) == b"234"
+    assert storage.size("a/b.bin") == 10
+    assert [e["name"] for e in storage.list("a")] == ["b.bin"]
+    storage.delete(["a/b.bin", "a/missing"])
+    assert not storage.exists("a/b.bin")
+
+
+def test_local_create_only_and_escape(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    storage.put("x", b"1", overwrite=False)
+    with pytest.raises(FileExistsError):
+        storage.put("x", b"2", overwrite=False)
+    with pytest.raises(ValueError):
+        storage.put("../outside", b"1")
+
+
+def test_local_get_if_changed(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    storage.put("i.json", b"{}")
+    data, etag = storage.get_if_changed("i.json")
+    assert data == b"{}"
+    assert storage.get_if_changed("i.json", etag) == (None, etag)
+    storage.put("i.json", b"{1}")
+    assert storage.get_if_changed("i.json", etag)[0] == b"{1}"
+
+
+@pytest.fixture
+def mock_http(monkeypatch):
+    """Cliente httpx del pool reemplazado por un transporte simulado."""
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        if request.headers.get("If-None-Match") == '"v1"':
+            return httpx.Response(304)
+        if request.url.path.endswith("/missing"):
+            return httpx.Response(404)
+        return httpx.Response(200, content=b"body", headers={"ETag": '"v1"'})
+
+    monkeypatch.setattr(supa, "_http", httpx.Client(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(cfg, "supabase_url", "https://proj.supabase.co/")
+    monkeypatch.setattr(cfg, "supabase_service", "key")
+    return requests
+
+
+def test_supabase_get_if_changed_uses_public_api(mock_http):
+    storage = SupabaseStorage("bucket")
+    assert storage.get_if_changed("run/index.json") == (b"body", '"v1"')
+    assert storage.get_if_changed("run/index.json", '"v1"') == (None, '"v1"')
+    req = mock_http[0]
+    assert str(req.url) == "https://proj.supabase.co/storage/v1/object/authenticated/bucket/run/index.json"
+    assert req.headers["Authorization"] == "Bearer key"
+    assert req.headers["apikey"] == "key"
+    with pytest.raises(FileNotFoundError):
+        storage.get_if_changed("missing")
+
+
+class FakeBucketApi:
+    """storage3 simulado: guarda lo subido y nunca devuelve un archivo entero."""
+
+    def __init__(self):
+        self.objects = {}
+
+    def upload(self, path, data, options):
+        self.objects[path] = data if isinstance(data, bytes) else data.read()
+
+    def list(self, prefix, options):
+        return []
+
+
+class Unsized(io.RawIOBase):
+    """Stream sin tamaño conocido (p. ej. un tar comprimiéndose)."""
+
+    def __init__(self, data):
+        self.buf = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        chunk = self.buf.read(len(b))
+        b[:len(chunk)] = chunk
+        return len(chunk)
+
+
+@pytest.fixture
+def fake_api(monkeypatch):
+    api = FakeBucketApi()
+    monkeypatch.setattr(SupabaseStorage, "_api", property(lambda self: api))
+    monkeypatch.setattr(supa, "PART_SIZE", 1000)
+    return api
+
+
+@pytest.mark.parametrize("make", [lambda d, p: io.BytesIO(d), lambda d, p: Unsized(d), lambda d, p: str(p)])
+def test_supabase_put_streams_large_payloads_in_parts(fake_api, tmp_path, make):
+    data = bytes(range(256)) * 20
+    (tmp_path / "ckpt.bin").write_bytes(data)
+    SupabaseStorage("bucket").put("run/ckpt.bin", make(data, tmp_path / "ckpt.bin"))
+    assert "run/ckpt.bin" not in fake_api.objects
+    manifest = json.loads(fake_api.objects[supa.manifest_path("run/ckpt.bin")])
+    assert manifest["size"] == len(data)
+    parts = [fake_api.objects[p["path"]] for p in manifest["parts"]]
+    assert max(map(len, parts)) <= 1000
+    assert b"".join(parts) == data
+
+
+def test_supabase_put_small_file_object_in_one_request(fake_api):
+    SupabaseStorage("bucket").put("run/small.json", io.BytesIO(b"{}"))
+    assert fake_api.objects == {"run/small.json": b"{}"}
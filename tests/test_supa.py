@@ -0,0 +1,37 @@
+import json
+import os
+
+import pytest
+
+from src.utils.storage import LocalStorage
+from src.utils.supa import download_ckpt
+
+DATA = bytes(range(256)) * 40
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = LocalStorage(str(tmp_path / "bucket"))
+    storage.put("run/adapter.bin", DATA)
+    return storage
+
+
+@pytest.mark.parametrize("state", [None, "{not json", json.dumps({"size": 1, "done": {"0": 1}})])
+def test_stale_larger_partial_is_discarded(tmp_path, storage, state):
+    out = tmp_path / "adapter.bin"
+    # Restos de otra descarga más grande, sin estado válido para este objeto
+    (tmp_path / "adapter.bin.partial").write_bytes(b"x" * (len(DATA) + 5000))
+    if state is not None:
+        (tmp_path / "adapter.bin.partial.json").write_text(state)
+    assert download_ckpt("run/adapter.bin", str(out), storage)
+    assert out.read_bytes() == DATA
+    assert not os.path.exists(f"{out}.partial.json")
+
+
+def test_resume_keeps_finished_ranges(tmp_path, storage):
+    out = tmp_path / "adapter.bin"
+    # Rango 0 ya escrito: se reutiliza tal cual (sin checksum en objetos planos)
+    (tmp_path / "adapter.bin.partial").write_bytes(DATA)
+    (tmp_path / "adapter.bin.partial.json").write_text(json.dumps({"size": len(DATA), "done": {"0": len(DATA)}}))
+    assert download_ckpt("run/adapter.bin", str(out), storage)
+    assert out.read_bytes() == DATA
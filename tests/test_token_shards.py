@@ -0,0 +1,47 @@
+import json
+
+import numpy as np
+import pytest
+
+from src.train.packing import IGNORE_INDEX
+from src.train.token_shards import META, ShardWriter, TokenShardDataset, token_dtype
+
+EOS = 2
+DOCS = [[10, 11, 12, EOS], [20, 21, EOS], [30, 31, 32, 33, 34, EOS], [40, EOS]]
+
+
+def write_shards(root, docs, shard_tokens):
+    # Lo que escribe build_shards, sin tokenizer
+    writer = ShardWriter(str(root), token_dtype(1000), shard_tokens)
+    for ids in docs:
+        writer.add(ids)
+    meta = {"dtype": "uint16", "docs": len(docs), "tokens": sum(map(len, docs)), "shards": writer.close()}
+    (root / META).write_text(json.dumps(meta))
+    return meta
+
+
+def test_windows_cover_shards_without_crossing_them(tmp_path):
+    meta = write_shards(tmp_path, DOCS, shard_tokens=7)
+    # Los documentos no se parten: shard 0 = docs 0-1 (7 tokens), shard 1 = docs 2-3 (8 tokens)
+    assert [s["tokens"] for s in meta["shards"]] == [7, 8]
+    ds = TokenShardDataset(str(tmp_path), seq_len=4)
+    assert len(ds) == 2 + 2
+    assert [ds[i]["input_ids"] for i in range(len(ds))] == [
+        [10, 11, 12, EOS], [20, 21, EOS], [30, 31, 32, 33], [34, EOS, 40, EOS]]
+    assert ds[-1] == ds[3]
+
+
+def test_positions_and_labels_restart_per_document(tmp_path):
+    write_shards(tmp_path, DOCS, shard_tokens=100)
+    ds = TokenShardDataset(str(tmp_path), seq_len=5)
+    row = ds[1]     # tokens 5..9: [21, EOS | 30, 31, 32]
+    assert row["input_ids"] == [21, EOS, 30, 31, 32]
+    # El documento que empezó en la ventana anterior cuenta desde el inicio de la ventana
+    assert row["position_ids"] == [0, 1, 0, 1, 2]
+    assert row["labels"] == [IGNORE_INDEX, EOS, IGNORE_INDEX, 31, 32]
+
+
+def test_missing_meta_is_an_unfinished_build(tmp_path):
+    ShardWriter(str(tmp_path), np.dtype(np.uint16)).add([1, EOS])
+    with pytest.raises(FileNotFoundError):
+        TokenShardDataset(str(tmp_path), 4)
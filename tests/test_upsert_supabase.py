@@ -0,0 +1,18 @@
+from src.ingest.upsert_supabase import diff_rows
+
+
+def verse(v, h):
+    return {"book": "Juan", "chapter": 1, "verse": v, "text": "...", "content_hash": h}
+
+
+def test_diff_rows_splits_changed_and_stale():
+    remote = {("Juan", 1, 1): (10, "a"), ("Juan", 1, 2): (11, "b"), ("Juan", 1, 3): (12, "c")}
+    rows = [verse(1, "a"), verse(2, "changed"), verse(4, "new")]
+    changed, stale = diff_rows("bible_verses", rows, remote)
+    assert [r["verse"] for r in changed] == [2, 4]
+    assert stale == [12]
+
+
+def test_diff_rows_without_remote_writes_everything():
+    rows = [verse(1, "a"), verse(2, "b")]
+    assert diff_rows("bible_verses", rows, {}) == (rows, [])
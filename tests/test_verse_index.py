@@ -0,0 +1,36 @@
+import pytest
+
+from src.utils.verse_index import VerseIndex, VerseIndexWriter, extract_refs, ordinal_verse, parse_reference
+
+
+def verses(text):
+    return [ordinal_verse(o) for o in extract_refs(text)]
+
+
+def test_references_in_prose():
+    assert verses("Como dice Jn 3:16-17 y 1 Co 13,4") == [("Juan", 3, 16), ("Juan", 3, 17), ("1 Corintios", 13, 4)]
+    assert verses("Véase Is. 53:5 y Os 2:1") == [("Isaías", 53, 5), ("Oseas", 2, 1)]
+
+
+@pytest.mark.parametrize("prose", ["he 3:16 veces", "os 2:1 digo", "is 4:30 pm", "mi 2:1", "am 9:15",
+                                   "mal 3:10", "job 1:2"])
+def test_common_words_are_not_book_names(prose):
+    assert extract_refs(prose) == []
+
+
+def test_lowercase_abbreviation_is_a_reference_on_its_own():
+    assert ordinal_verse(parse_reference("os 2:1")) == ("Oseas", 2, 1)
+    with pytest.raises(ValueError):
+        parse_reference("sin referencia")
+
+
+def test_index_roundtrip(tmp_path):
+    prefix = str(tmp_path / "refs_index")
+    writer = VerseIndexWriter(prefix)
+    writer.add({"work": "w", "ref_key": "Jn_3_16", "seq": 0, "content": "Amor de Dios."})
+    writer.add({"work": "w", "ref_key": "Notas", "seq": 0, "content": "Cf. Juan 3:16; he 3:16 veces."})
+    writer.add({"work": "w", "ref_key": "Notas", "seq": 1, "content": "Hebreos 3:16."})
+    writer.close()
+    index = VerseIndex(prefix)
+    assert [(c["ref_key"], c["seq"]) for c in index.chunks("Juan 3:16")] == [("Jn_3_16", 0), ("Notas", 0)]
+    assert [(c["ref_key"], c["seq"]) for c in index.chunks("He 3:16")] == [("Notas", 1)]
@@ -4,6 +4,7 @@
 Versión especializada en responder objeciones ateas con fundamentos históricos
 """
 
+import math
 import torch
 import json
 import argparse
@@ -13,20 +14,25 @@ from transformers import (
     AutoTokenizer, 
     AutoModelForCausalLM,
     TrainingArguments, 
-    Trainer,
     GenerationConfig
 )
 from peft import LoraConfig, get_peft_model, TaskType
+from src.config import cfg
+from src.train.batching import DynamicPaddingCollator, LengthGroupedBatchSampler, LengthGroupedTrainer, row_lengths
+from src.train.data_cache import cached_dataset, dataset_key
+from src.train.device import PRECISIONS, training_device
+from src.train.formatters import format_apologetic
+from src.train.tokenization import tokenize_texts
 
-def setup_model_and_tokenizer(model_name):
+def setup_model_and_tokenizer(model_name, dev):
     """Configurar modelo y tokenizer"""
     print(f'🤖 Cargando modelo: {model_name}')
     
     tokenizer = AutoTokenizer.from_pretrained(model_name)
     model = AutoModelForCausalLM.from_pretrained(
         model_name,
-        torch_dtype=torch.float16,
-        device_map='auto',
+        torch_dtype=dev.model_dtype(torch.float16),  # float32 fuera de CUDA
+        device_map=dev.device_map,
         trust_remote_code=True
     )
     
@@ -35,7 +41,7 @@ def setup_model_and_tokenizer(model_name):
         tokenizer.pad_token = tokenizer.eos_token
         tokenizer.pad_token_id = tokenizer.eos_token_id
     
-    print('🖥️ Modelo cargado en GPU')
+    print(f'🖥️ Modelo cargado en {dev.device}')
     
     # Configurar LoRA para apologética (parámetros más conservadores)
     lora_config = LoraConfig(
@@ -64,12 +70,8 @@ def load_apologetic_dataset(dataset_path):
     # Procesar datos para formato de entrenamiento
     processed_data = []
     for item in data:
-        # Formato de conversación apologética
-        text = f"""### Objeción: {item['instruction']}
-### Respuesta Fundamentada: {item['output']}"""
-        
         processed_data.append({
-            'text': text,
+            'text': format_apologetic(item),
             'input_ids': None,
             'labels': None
         })
@@ -77,61 +79,48 @@ def load_apologetic_dataset(dataset_path):
     print(f'📊 Procesados {len(processed_data)} ejemplos válidos para apologética')
     return processed_data
 
-def tokenize_dataset(data, tokenizer, max_length=1024):
+def tokenize_dataset(data, tokenizer, max_length=1024, num_proc=None):
     """Tokenizar dataset con longitud extendida para respuestas apologéticas"""
     print('🔤 Tokenizando dataset apologético...')
     
-    def tokenize_function(examples):
-        # Tokenizar texto
-        tokenized = tokenizer(
-            examples['text'],
-            truncation=True,
-            padding=False,
-            max_length=max_length,
-            return_tensors=None
-        )
-        
-        # Para entrenamiento causal LM, labels = input_ids
-        tokenized['labels'] = tokenized['input_ids'].copy()
-        return tokenized
-    
-    # Convertir a Dataset de HuggingFace
+    # Convertir a Dataset de HuggingFace y tokenizar en lotes grandes, en paralelo.
+    # Sin columna labels: el collator las toma de input_ids al armar cada batch
     dataset = Dataset.from_list(data)
-    tokenized_dataset = dataset.map(
-        tokenize_function,
-        batched=True,
-        remove_columns=dataset.column_names
-    )
+    tokenized_dataset = tokenize_texts(dataset, tokenizer, max_length, num_proc=num_proc)
     
     print(f'✅ Tokenización completada: {len(tokenized_dataset)} ejemplos')
     return tokenized_dataset
 
-def train_apologetic_model(model, tokenizer, dataset, output_dir, epochs=3):
+def train_apologetic_model(model, tokenizer, dataset, output_dir, dev, epochs=3, batch_size=1):
     """Entrenar modelo apologético"""
     print('🚀 Iniciando entrenamiento apologético...')
     
+    # Batches agrupados por longitud: cada uno se rellena solo hasta su fila más larga
+    sampler = LengthGroupedBatchSampler(row_lengths(dataset), batch_size)
+    print(f'📊 Relleno por batch: {sampler.padding_ratio():.1%} (agrupado por longitud)')
+    
     training_args = TrainingArguments(
         output_dir=output_dir,
         num_train_epochs=epochs,
-        per_device_train_batch_size=1,  # Batch pequeño para estabilidad
-        gradient_accumulation_steps=4,  # Simular batch size 4
+        per_device_train_batch_size=batch_size,
+        gradient_accumulation_steps=math.ceil(4 / batch_size),  # Simular batch size 4 (al menos)
         warmup_steps=50,
         learning_rate=1e-5,  # Learning rate conservador
-        fp16=True,
         logging_steps=1,
         save_strategy='epoch',
         eval_strategy='no',  # Actualizado de evaluation_strategy
         load_best_model_at_end=False,
         report_to=None,
         remove_unused_columns=False,
-        dataloader_pin_memory=False
+        **dev.training_args()  # precisión, use_cpu y workers del DataLoader según el dispositivo
     )
     
-    trainer = Trainer(
+    trainer = LengthGroupedTrainer(
         model=model,
         args=training_args,
         train_dataset=dataset,
-        tokenizer=tokenizer
+        tokenizer=tokenizer,
+        data_collator=DynamicPaddingCollator(tokenizer.pad_token_id)
     )
     
     print('📈 Entrenamiento iniciado...')
@@ -193,6 +182,16 @@ def main():
                        help='Directorio de salida')
     parser.add_argument('--epochs', type=int, default=3,
                        help='Número de épocas')
+    parser.add_argument('--batch_size', type=int, default=1,  # Batch pequeño para estabilidad
+                       help='Ejemplos por batch (agrupados por longitud)')
+    parser.add_argument('--cache_dir', default=cfg.dataset_cache,
+                       help='Caché de datasets tokenizados (vacío = desactivado)')
+    parser.add_argument('--num_proc', type=int, default=None,
+                       help='Procesos para tokenizar (por defecto: CPUs disponibles)')
+    parser.add_argument('--precision', choices=PRECISIONS, default='auto',
+                       help='auto: fp16 en GPU; en CPU bf16 si el procesador lo soporta, si no fp32')
+    parser.add_argument('--dataloader_workers', type=int, default=None,
+                       help='Procesos del DataLoader (por defecto: según el dispositivo)')
     parser.add_argument('--test', action='store_true',
                        help='Probar respuestas después del entrenamiento')
     
@@ -203,23 +202,30 @@ def main():
     print(f'📚 Dataset: {args.dataset}')
     print(f'📁 Salida: {args.output}')
     print(f'🔄 Épocas: {args.epochs}')
+    print(f'📦 Batch: {args.batch_size}')
     print()
     
     # Crear directorio de salida
     Path(args.output).mkdir(parents=True, exist_ok=True)
     
-    # Configurar modelo y tokenizer
-    model, tokenizer = setup_model_and_tokenizer(args.model)
+    # Dispositivo: precisión, hilos según la cuota de CPU del contenedor y workers
+    dev = training_device(args.precision, args.dataloader_workers)
+    dev.apply()
+    print(f'🖥️ Dispositivo: {dev.describe()}')
     
-    # Cargar dataset apologético
-    data = load_apologetic_dataset(args.dataset)
+    # Configurar modelo y tokenizer
+    model, tokenizer = setup_model_and_tokenizer(args.model, dev)
     
-    # Tokenizar
-    dataset = tokenize_dataset(data, tokenizer)
+    # Cargar y tokenizar dataset apologético (o reutilizarlo del caché)
+    key = dataset_key(args.dataset, tokenizer, format_apologetic, 1024) if args.cache_dir else None
+    dataset = cached_dataset(
+        key, lambda: tokenize_dataset(load_apologetic_dataset(args.dataset), tokenizer, num_proc=args.num_proc),
+        args.cache_dir
+    )
     
     # Entrenar
     model, tokenizer = train_apologetic_model(
-        model, tokenizer, dataset, args.output, args.epochs
+        model, tokenizer, dataset, args.output, dev, args.epochs, args.batch_size
     )
     
     # Probar respuestas si se solicita